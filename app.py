@@ -1,9 +1,8 @@
 import streamlit as st
-import plotly.graph_objects as go
-from crypto_portfolio_v2 import CryptoPortfolio
+from crypto_portfolio_v2 import CryptoPortfolio, preload_modules
+from services import PortfolioRefresher, RebalancingService, get_credit_scheduler, get_metrics
 import pandas as pd
-from datetime import datetime
-import asyncio
+from datetime import datetime, timedelta
 import streamlit.components.v1 as components
 import os
 import time
@@ -278,59 +277,88 @@ if 'portfolio_data' not in st.session_state:
 if 'last_update' not in st.session_state:
     st.session_state.last_update = None
 
-async def get_portfolio_data():
-    """Async function to get portfolio data"""
-    portfolio = CryptoPortfolio()
-    return await portfolio.get_portfolio_data()
+@st.cache_resource
+def get_refresher() -> PortfolioRefresher:
+    """Process-wide background refresher shared by all sessions"""
+    interval = float(os.getenv('PORTFOLIO_REFRESH_SECONDS', '300'))
+    refresher = PortfolioRefresher(CryptoPortfolio, interval=interval).start()
+    # Import the chart and AI libraries while the first quotes are fetched
+    preload_modules('plotly.graph_objects', 'services.openai_service')
+    return refresher
 
-def run_async(coroutine):
-    """Helper function to run async code"""
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    try:
-        return loop.run_until_complete(coroutine)
-    except RuntimeError:
-        # If the loop is closed, create a new one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(coroutine)
-
-def update_portfolio_data():
-    """Update portfolio data and last update time"""
-    try:
-        # Create a new portfolio instance for each update
-        portfolio = CryptoPortfolio()
-        portfolio_data = run_async(portfolio.get_portfolio_data(force_refresh=True))
-        st.session_state.portfolio_data = portfolio_data
-        st.session_state.last_update = datetime.now()
-        return portfolio_data
-    except Exception as e:
-        st.error(f"Failed to update portfolio: {str(e)}")
-        return st.session_state.portfolio_data
+def get_latest_portfolio_data():
+    """Return the latest published snapshot, waiting only if none exists yet"""
+    refresher = get_refresher()
+    snapshot = refresher.latest()
+    if snapshot is None:
+        with st.spinner('Loading portfolio data...'):
+            snapshot = refresher.wait_for_snapshot(timeout=30)
+    if snapshot is None:
+        if refresher.last_error is not None:
+            st.error(f"Failed to load portfolio: {str(refresher.last_error)}")
+        return None
+    return snapshot.data
+
+def update_portfolio_data(force_refresh: bool = True):
+    """Refresh portfolio data now and wait for the new snapshot"""
+    refresher = get_refresher()
+    snapshot = refresher.refresh_now(force_refresh=force_refresh)
+    if refresher.last_error is not None:
+        st.error(f"Failed to update portfolio: {str(refresher.last_error)}")
+    if snapshot is not None:
+        st.session_state.portfolio_data = snapshot.data
+        st.session_state.last_update = snapshot.created_at
+    return st.session_state.portfolio_data
 
 def auto_update_portfolio():
-    """Auto-update portfolio data every 5 minutes"""
-    if 'last_auto_update' not in st.session_state:
-        st.session_state.last_auto_update = datetime.min
-    
-    current_time = datetime.now()
-    if (current_time - st.session_state.last_auto_update).total_seconds() >= 300:  # 5 minutes
-        try:
-            # Create a new portfolio instance for auto-update
-            portfolio_data = update_portfolio_data()
-            st.session_state.last_auto_update = current_time
-            return portfolio_data
-        except Exception as e:
-            st.error(f"Failed to auto-update portfolio: {str(e)}")
-            return st.session_state.portfolio_data
+    """Return the latest snapshot published by the background refresher"""
+    portfolio_data = get_latest_portfolio_data()
+    if portfolio_data is not None:
+        st.session_state.portfolio_data = portfolio_data
     return st.session_state.portfolio_data
 
+# Holdings table columns: values stay numeric and the grid formats them
+HOLDINGS_COLUMN_CONFIG = {
+    'symbol': st.column_config.TextColumn('Symbol'),
+    'amount': st.column_config.NumberColumn('Amount', format='%.8f'),
+    'price_brl': st.column_config.NumberColumn('Price (BRL)', format='R$ %.2f'),
+    'value_brl': st.column_config.NumberColumn('Value (BRL)', format='R$ %.2f'),
+    'percent_change_24h': st.column_config.NumberColumn('24h Change', format='%+.2f%%'),
+    'percent_change_7d': st.column_config.NumberColumn('7d Change', format='%+.2f%%'),
+    'portfolio_percentage': st.column_config.NumberColumn('Allocation', format='%.2f%%')
+}
+
+def change_colors(changes: pd.DataFrame) -> pd.DataFrame:
+    """Text color per cell: green for gains, red for losses"""
+    colors = pd.DataFrame('color: #F6465D', index=changes.index, columns=changes.columns)
+    return colors.mask(changes >= 0, 'color: #00C087')
+
+def build_holdings_display(portfolio_data: dict):
+    """Holdings sorted by value and a Styler that only colors the change columns"""
+    # Use the frame built by the valuation engine when available
+    holdings_frame = portfolio_data.get('holdings_frame')
+    if holdings_frame is None:
+        holdings_frame = pd.DataFrame(portfolio_data.get('holdings', []))
+    holdings_frame = holdings_frame.sort_values('value_brl', ascending=False)
+    styler = holdings_frame.style.apply(
+        change_colors, subset=['percent_change_24h', 'percent_change_7d'], axis=None
+    )
+    return holdings_frame, styler
+
+def get_holdings_display(portfolio_data: dict):
+    """Holdings frame and Styler, rebuilt only when a new snapshot is published"""
+    # Keyed on the snapshot timestamp: snapshot ids restart with the refresher
+    key = portfolio_data.get('timestamp')
+    cached = st.session_state.get('holdings_display')
+    if key is None or cached is None or cached[0] != key:
+        cached = (key, *build_holdings_display(portfolio_data))
+        st.session_state.holdings_display = cached
+    return cached[1], cached[2]
+
 def display_portfolio_overview():
     """Display the portfolio overview section"""
+    import plotly.graph_objects as go  # deferred: plotly is slow to import
+
     st.markdown("# Portfolio Overview")
     
     # Add update button in the sidebar with last update time
@@ -340,13 +368,17 @@ def display_portfolio_overview():
     
     st.sidebar.markdown("### Portfolio Updates")
     st.sidebar.text(f"Last Update: {last_update_str}")
+    budget = get_credit_scheduler().status()
+    st.sidebar.caption(
+        f"API budget: {budget['credits_remaining_day']:.0f} credits left today, "
+        f"{budget['calls_remaining_minute']:.0f} calls this minute"
+    )
     
     col1, col2 = st.sidebar.columns(2)
     with col1:
         if st.button("🔄 Update Now", key="update_portfolio"):
             with st.spinner('Updating portfolio data...'):
                 try:
-                    # Create a new portfolio instance for manual update
                     st.session_state.portfolio_data = update_portfolio_data()
                     st.success('Portfolio updated successfully!')
                     time.sleep(0.5)  # Add a small delay before rerun
@@ -364,13 +396,19 @@ def display_portfolio_overview():
         portfolio_data = st.session_state.portfolio_data
     
     if portfolio_data is None:
-        with st.spinner('Loading portfolio data...'):
-            portfolio_data = update_portfolio_data()
-            st.rerun()
+        portfolio_data = auto_update_portfolio()
+        if portfolio_data is None:
+            return
 
     # Portfolio Value Card
     total_value = portfolio_data.get('total_value_brl', 0)
     change_24h = portfolio_data.get('weighted_24h_change', 0)
+    currency_signs = {'USD': 'US$', 'EUR': '€'}
+    other_totals = ' · '.join(
+        f"{currency_signs.get(currency, currency + ' ')}{value:,.2f}"
+        for currency, value in portfolio_data.get('total_value', {}).items()
+        if currency != 'BRL'
+    )
     
     value_color = "positive" if change_24h >= 0 else "negative"
     change_symbol = "↑" if change_24h >= 0 else "↓"
@@ -379,23 +417,30 @@ def display_portfolio_overview():
         <div style='text-align: center; padding: 20px;'>
             <h3 style='color: #B7BDC6; margin-bottom: 5px;'>Total Portfolio Value</h3>
             <h1 style='font-size: 2.5em; margin: 0;'>R$ {total_value:.2f}</h1>
+            <p style='color: #B7BDC6; margin: 0;'>{other_totals}</p>
             <p class='{value_color}' style='font-size: 1.2em; margin-top: 5px;'>
                 {change_symbol} {abs(change_24h):.2f}%
             </p>
         </div>
     """, unsafe_allow_html=True)
 
+    # Earnings derived from the recorded snapshots by the ledger
+    try:
+        earnings = st.session_state.portfolio.get_earnings_data()
+        col1, col2 = st.columns(2)
+        col1.metric("Earnings (24h)", f"R$ {earnings['total_daily']:+.2f}")
+        col2.metric("Accumulated Earnings", f"R$ {earnings['total_accumulated']:+.2f}")
+    except Exception as e:
+        print(f"Error calculating earnings: {e}")
+
     # Portfolio Composition
     st.markdown("### Portfolio Composition")
     
     # Create donut chart with Plotly
-    holdings = portfolio_data.get('holdings', [])
+    holdings_frame, holdings_styler = get_holdings_display(portfolio_data)
     
-    # Sort holdings by value
-    holdings = sorted(holdings, key=lambda x: x['value_brl'], reverse=True)
-    
-    labels = [h['symbol'] for h in holdings]
-    values = [h['value_brl'] for h in holdings]
+    labels = holdings_frame['symbol']
+    values = holdings_frame['value_brl']
     colors = ['#1E88E5', '#FFC107', '#E53935', '#43A047', '#5E35B1', '#FB8C00']
     
     fig = go.Figure(data=[go.Pie(
@@ -426,53 +471,105 @@ def display_portfolio_overview():
     
     st.plotly_chart(fig, use_container_width=True)
 
+    display_portfolio_history()
+
     # Holdings Table
     st.markdown("### Holdings Details")
     
-    # Create DataFrame
-    df = pd.DataFrame(holdings)
-    df['price_brl'] = df['price_brl'].map('R$ {:.2f}'.format)
-    df['value_brl'] = df['value_brl'].map('R$ {:.2f}'.format)
-    df['percent_change_24h'] = df['percent_change_24h'].map('{:+.2f}%'.format)
-    df['percent_change_7d'] = df['percent_change_7d'].map('{:+.2f}%'.format)
-    
-    # Rename columns
-    df = df.rename(columns={
-        'symbol': 'Symbol',
-        'amount': 'Amount',
-        'price_brl': 'Price (BRL)',
-        'value_brl': 'Value (BRL)',
-        'percent_change_24h': '24h Change',
-        'percent_change_7d': '7d Change'
-    })
-    
-    # Apply conditional styling
-    def style_negative_positive(val):
-        try:
-            value = float(val.strip('%'))
-            color = '#00C087' if value >= 0 else '#F6465D'
-            return f'color: {color}'
-        except:
-            return ''
-
-    # Style the dataframe
-    styled_df = df.style.map(
-        style_negative_positive,
-        subset=['24h Change', '7d Change']
-    )
-    
     st.dataframe(
-        styled_df,
+        holdings_styler,
+        column_order=list(HOLDINGS_COLUMN_CONFIG),
+        column_config=HOLDINGS_COLUMN_CONFIG,
         hide_index=True,
         use_container_width=True
     )
 
+def display_portfolio_history():
+    """Display the portfolio value history from the snapshot store"""
+    import plotly.graph_objects as go  # deferred: plotly is slow to import
+
+    st.markdown("### Portfolio History")
+
+    # Window label -> (lookback, downsampling interval)
+    windows = {
+        '24h': (timedelta(days=1), '1m'),
+        '7d': (timedelta(days=7), '1h'),
+        '30d': (timedelta(days=30), '1h'),
+        '1y': (timedelta(days=365), '1d')
+    }
+    window = st.radio("Window", list(windows.keys()), index=1, horizontal=True, key="history_window")
+    lookback, interval = windows[window]
+
+    portfolio = st.session_state.portfolio
+    start = datetime.now() - lookback
+    buckets = portfolio.history.downsample(None, interval=interval, start=start)
+    # Backfilled daily closes reach further back than the recorded snapshots
+    backfilled = []
+    if lookback >= timedelta(days=7):
+        backfilled = portfolio.history.holdings_value_history(portfolio.portfolio, 'daily', start=start)
+    if not buckets and not backfilled:
+        st.info("No history recorded yet.")
+        return
+
+    fig = go.Figure()
+    if backfilled:
+        fig.add_trace(go.Scatter(
+            x=[point['timestamp'] for point in backfilled],
+            y=[point['value'] for point in backfilled],
+            mode='lines',
+            name='Current holdings at daily closes',
+            line=dict(color='#FFC107', width=1, dash='dot'),
+            hovertemplate='R$ %{y:.2f}<extra></extra>'
+        ))
+    if buckets:
+        fig.add_trace(go.Scatter(
+            x=[b['timestamp'] for b in buckets],
+            y=[b['close'] for b in buckets],
+            mode='lines',
+            name='Recorded value',
+            line=dict(color='#1E88E5', width=2),
+            hovertemplate='R$ %{y:.2f}<extra></extra>'
+        ))
+    fig.update_layout(
+        showlegend=bool(backfilled),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(t=10, l=0, r=0, b=0),
+        height=250,
+        font=dict(color='#E6E8EA')
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    if backfilled:
+        st.caption("Daily closes come from `python -m services.backfill_service`; "
+                   "symbols that were never backfilled are left out.")
+
 def edit_holdings():
     """Edit portfolio holdings"""
     st.markdown("# Edit Holdings")
     
     portfolio = st.session_state.portfolio
-    
+
+    # Symbol lookup served from the local listings snapshot, no API call
+    listings = portfolio.listings.get_index()
+    if listings is not None:
+        query = st.text_input("Search assets", "", placeholder="Symbol or name, e.g. BTC or bitcoin")
+        if query:
+            matches = listings.search(query)
+            if matches:
+                st.dataframe(pd.DataFrame([
+                    {
+                        'Symbol': asset.symbol,
+                        'Name': asset.name,
+                        'CMC rank': asset.rank,
+                        'CMC id': asset.id,
+                        'Shared ticker': len(listings.candidates(asset.symbol)) > 1
+                    }
+                    for asset in matches
+                ]), hide_index=True)
+            else:
+                st.caption(f"No assets match '{query}'")
+
     # Form for adding new holdings
     with st.form("add_holding"):
         st.markdown("### Add New Holding")
@@ -513,9 +610,8 @@ def edit_holdings():
                     else:
                         portfolio.update_holdings(symbol, amount)
                         st.success(f"Updated {symbol} amount to {amount}")
-                    # Update portfolio data with force_refresh=True
-                    portfolio_data = run_async(portfolio.get_portfolio_data(force_refresh=True))
-                    st.session_state.portfolio_data = portfolio_data
+                    # Cached quotes are reused, only a new symbol is fetched
+                    update_portfolio_data(force_refresh=False)
                     time.sleep(0.5)  # Add a small delay before rerun
                     st.rerun()
                 except Exception as e:
@@ -548,9 +644,8 @@ def edit_holdings():
                     try:
                         portfolio.update_holdings(holding['symbol'], new_amount)
                         st.success(f"Updated {holding['symbol']} amount to {new_amount}")
-                        # Update portfolio data with force_refresh=True
-                        portfolio_data = run_async(portfolio.get_portfolio_data(force_refresh=True))
-                        st.session_state.portfolio_data = portfolio_data
+                        # Amounts changed but quotes did not, so the cache can serve them
+                        update_portfolio_data(force_refresh=False)
                         time.sleep(0.5)  # Add a small delay before rerun
                         st.rerun()
                     except Exception as e:
@@ -562,9 +657,8 @@ def edit_holdings():
                         try:
                             portfolio.remove_holding(holding['symbol'])
                             st.success(f"Removed {holding['symbol']} from portfolio")
-                            # Update portfolio data with force_refresh=True
-                            portfolio_data = run_async(portfolio.get_portfolio_data(force_refresh=True))
-                            st.session_state.portfolio_data = portfolio_data
+                            # Amounts changed but quotes did not, so the cache can serve them
+                            update_portfolio_data(force_refresh=False)
                             time.sleep(0.5)  # Add a small delay before rerun
                             st.rerun()
                         except Exception as e:
@@ -578,133 +672,70 @@ def display_market_analysis():
     try:
         # Get portfolio data and analysis
         portfolio = CryptoPortfolio()
-        portfolio_data = run_async(get_portfolio_data())
+        portfolio_data = get_latest_portfolio_data()
         
         if not portfolio_data:
             st.error("Failed to fetch portfolio data. Please try again.")
             return
             
-        analysis = portfolio.get_market_analysis(portfolio_data)
-        
-        # Display the analysis
-        st.markdown(analysis)
+        # Render the analysis progressively as tokens arrive
+        placeholder = st.empty()
+        analysis = ""
+        for chunk in portfolio.stream_market_analysis(portfolio_data):
+            analysis += chunk
+            placeholder.markdown(analysis + "▌")
+        placeholder.markdown(analysis)
         
         # Add rebalancing button
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            if st.button("🔄 Execute Rebalancing", help="Automatically create transactions to achieve 70-30 allocation"):
+            if st.button("🔄 Execute Rebalancing", help="Automatically create transactions to reach the target crypto/stablecoin allocation"):
                 auto_rebalance(portfolio_data)
     
     except Exception as e:
         st.error(f"Error in market analysis: {str(e)}")
         return
 
-def calculate_target_allocations(portfolio_data: dict) -> dict:
-    """Calculate target allocations for each asset based on the 70-30 strategy"""
-    total_value = portfolio_data['total_value_brl']
-    holdings = portfolio_data['holdings']
-    
-    # Separate stablecoins and crypto
-    stablecoins = [h for h in holdings if h['symbol'] in ['USDT', 'MUSD']]
-    cryptos = [h for h in holdings if h['symbol'] not in ['USDT', 'MUSD']]
-    
-    # Calculate current values
-    current_stable_value = sum(h['value_brl'] for h in stablecoins)
-    current_crypto_value = sum(h['value_brl'] for h in cryptos)
-    
-    # Target values (70-30 split)
-    target_crypto_value = total_value * 0.70
-    target_stable_value = total_value * 0.30
-    
-    # Calculate target allocations for individual cryptos
-    # Maintain relative proportions within crypto allocation
-    crypto_allocations = {}
-    if current_crypto_value > 0:
-        for crypto in cryptos:
-            current_weight = crypto['value_brl'] / current_crypto_value
-            target_value = target_crypto_value * current_weight
-            crypto_allocations[crypto['symbol']] = {
-                'current_value': crypto['value_brl'],
-                'target_value': target_value,
-                'difference': target_value - crypto['value_brl'],
-                'price_brl': crypto['price_brl']
-            }
-    
-    # Stablecoin allocation
-    stable_allocations = {}
-    for stable in stablecoins:
-        stable_allocations[stable['symbol']] = {
-            'current_value': stable['value_brl'],
-            'target_value': target_stable_value,
-            'difference': target_stable_value - stable['value_brl'],
-            'price_brl': stable['price_brl']
-        }
-    
-    return {
-        'total_value': total_value,
-        'crypto_allocations': crypto_allocations,
-        'stable_allocations': stable_allocations,
-        'current_percentages': {
-            'crypto': (current_crypto_value / total_value) * 100,
-            'stable': (current_stable_value / total_value) * 100
-        }
-    }
+@st.cache_resource
+def get_rebalancer() -> RebalancingService:
+    """Rebalancing engine configured from the environment"""
+    return RebalancingService.from_env()
 
 def auto_rebalance(portfolio_data: dict):
-    """Execute portfolio rebalancing based on the 70-30 strategy by directly updating holdings"""
+    """Execute portfolio rebalancing to the target sleeve weights by directly updating holdings"""
     try:
-        # Calculate target allocations
-        allocations = calculate_target_allocations(portfolio_data)
+        if not portfolio_data:
+            return
+
+        # Plan the trades in one vectorized pass
+        rebalancer = get_rebalancer()
+        plan = rebalancer.plan(portfolio_data)
+        stable = plan.sleeves['stable']
         
-        # Check if rebalancing is needed (using 2.5% threshold)
-        current_stable_pct = allocations['current_percentages']['stable']
-        if abs(current_stable_pct - 30) <= 2.5:
+        # Check if rebalancing is needed (within the tolerance band)
+        current_stable_pct = stable['current_pct']
+        if not plan.needs_rebalance:
             st.info(f"Portfolio is already well balanced! Current allocation: {current_stable_pct:.1f}% stablecoins")
             return
         
-        # Get stablecoin info (using USDT)
-        stable_symbol = 'USDT'
-        stable_info = next(
-            (h for h in portfolio_data['holdings'] if h['symbol'] == stable_symbol),
-            None
-        )
-        if not stable_info:
-            st.error(f"No {stable_symbol} holdings found! Cannot rebalance without {stable_symbol}.")
+        if plan.unfunded_sleeves:
+            st.error("No stablecoin holdings found! Cannot rebalance without a stablecoin such as USDT.")
             return
 
-        total_value = portfolio_data['total_value_brl']
-        target_stable_value = total_value * 0.30  # 30% in stablecoins
-        target_crypto_value = total_value * 0.70  # 70% in crypto
-
-        # Create a new portfolio instance for rebalancing
+        # Create a new portfolio instance and write all trades in a single transaction
         portfolio = CryptoPortfolio()
-        
-        # Calculate and update new holdings
-        for holding in portfolio_data['holdings']:
-            symbol = holding['symbol']
-            price_brl = holding['price_brl']
-            
-            if symbol == stable_symbol:
-                # Calculate new stablecoin amount
-                new_amount = target_stable_value / price_brl
-            else:
-                # Calculate new crypto amount maintaining relative proportions
-                current_crypto_value = sum(h['value_brl'] for h in portfolio_data['holdings'] if h['symbol'] != stable_symbol)
-                if current_crypto_value > 0:
-                    crypto_weight = holding['value_brl'] / current_crypto_value
-                    target_value = target_crypto_value * crypto_weight
-                    new_amount = target_value / price_brl
-                else:
-                    new_amount = 0
-
-            # Update holding with new amount
-            portfolio.update_holdings(symbol, new_amount)
+        with portfolio.batch():
+            for symbol, target_amount in zip(plan.trades['symbol'], plan.trades['target_amount']):
+                portfolio.update_holdings(symbol, float(target_amount))
         
         # Update portfolio data after rebalancing
         st.session_state.portfolio = portfolio
-        st.session_state.portfolio_data = run_async(portfolio.get_portfolio_data(force_refresh=True))
+        update_portfolio_data(force_refresh=False)
         
-        st.success(f"Portfolio successfully rebalanced from {current_stable_pct:.1f}% stablecoins to target 30% allocation.")
+        st.success(
+            f"Portfolio successfully rebalanced from {current_stable_pct:.1f}% stablecoins "
+            f"to target {stable['target_pct']:.0f}% allocation."
+        )
         time.sleep(0.5)  # Add a small delay before rerun
         st.rerun()
         
@@ -720,24 +751,65 @@ tab1, tab2, tab3, tab4, tab5 = st.tabs([
     "Rebalancing"
 ])
 
-with tab1:
+metrics = get_metrics()
+
+with tab1, metrics.timer('render_seconds', section='overview'):
     display_portfolio_overview()
 
-with tab2:
+with tab2, metrics.timer('render_seconds', section='edit_holdings'):
     edit_holdings()
 
-with tab3:
+with tab3, metrics.timer('render_seconds', section='market_analysis'):
     display_market_analysis()
 
 with tab4:
     display_tradingview_widget()
 
-with tab5:
-    auto_rebalance(update_portfolio_data())
+with tab5, metrics.timer('render_seconds', section='rebalancing'):
+    auto_rebalance(get_latest_portfolio_data())
+
+def display_debug_metrics():
+    """Sidebar panel with timings, counters and cache statistics (METRICS_ENABLED=1)"""
+    snapshot = metrics.snapshot()
+    with st.expander("Debug metrics"):
+        timings = [
+            {
+                'metric': name,
+                'labels': ', '.join(f"{key}={value}" for key, value in series['labels'].items()),
+                'count': series['count'],
+                'mean_ms': (series['mean'] or 0) * 1000,
+                'p95_ms': (series['p95'] or 0) * 1000
+            }
+            for name, entries in snapshot['histograms'].items()
+            if name.endswith('_seconds')
+            for series in entries
+        ]
+        if timings:
+            st.dataframe(pd.DataFrame(timings), hide_index=True)
+        counters = [
+            {
+                'metric': name,
+                'labels': ', '.join(f"{key}={value}" for key, value in series['labels'].items()),
+                'value': series['value']
+            }
+            for name, entries in snapshot['counters'].items()
+            for series in entries
+        ]
+        if counters:
+            st.dataframe(pd.DataFrame(counters), hide_index=True)
+        if snapshot['gauges']:
+            st.json(snapshot['gauges'])
+        st.download_button("Download JSON", metrics.to_json(), file_name='metrics.json', mime='application/json')
+        st.download_button("Download Prometheus", metrics.render_prometheus(), file_name='metrics.prom',
+                           mime='text/plain')
+        if st.button("Reset metrics"):
+            metrics.reset()
 
 # Sidebar
 with st.sidebar:
     st.title("Controls")
+    if metrics.enabled:
+        display_debug_metrics()
 
 # Footer
 st.markdown("---")
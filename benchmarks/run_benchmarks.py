@@ -0,0 +1,303 @@
+"""Benchmarks for the valuation, caching and rebalancing hot paths
+
+Runs every case against synthetic portfolios of increasing size, with the
+CoinMarketCap and OpenAI APIs replaced by a local stub, and writes the
+timings to JSON so runs from different commits can be compared.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --sizes 10 1000 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import StubServer, synthetic_listings_body, synthetic_universe
+from benchmarks.synthetic import synthetic_fx_rates, synthetic_market_data, synthetic_portfolio, synthetic_symbols
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def measure(run: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None,
+            track_memory: bool = False) -> Dict[str, float]:
+    """Time run() repeat times (setup() runs untimed before each call)
+
+    With track_memory, one extra untimed run under tracemalloc records the
+    peak bytes allocated by run() as peak_bytes.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    result = {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'mean_s': statistics.fmean(timings),
+        'runs': repeat
+    }
+    if track_memory:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            run()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+class BenchmarkSuite:
+    """Benchmark cases; each case method takes a size and a repeat count"""
+
+    # Case name -> largest size it runs at (None for no limit)
+    CASES = {
+        'cmc_get_market_data_cold': None,
+        'cmc_get_market_data_warm': None,
+        'json_decode_listings_json': None,
+        'json_decode_listings_orjson': None,
+        'json_decode_listings_msgspec': None,
+        'listings_index_build': None,
+        'listings_lookup': None,
+        'financial_calculate_holdings_value': None,
+        'financial_calculate_portfolio_metrics': None,
+        'financial_holdings_frame': None,
+        'earnings_calculate_earnings': None,
+        'rebalancing_plan': None,
+        'openai_build_messages': 10000,
+        'openai_generate_market_analysis': 1000
+    }
+
+    def __init__(self, stub: StubServer):
+        from services import (
+            CoinMarketCapService, EarningsService, FinancialService, MarketDataCache,
+            OpenAIService, RebalancingService, get_runtime
+        )
+        from services.json_codec import available_backends, make_codec
+        self.stub = stub
+        self.runtime = get_runtime()
+        self.CoinMarketCapService = CoinMarketCapService
+        self.MarketDataCache = MarketDataCache
+        self.codecs = {name: make_codec(name) for name in available_backends()}
+        self.financial = FinancialService()
+        self.earnings = EarningsService()
+        self.rebalancer = RebalancingService()
+        self.openai = OpenAIService(rebalancer=self.rebalancer)
+        self.fx_rates = synthetic_fx_rates()
+        with open(os.path.join(ROOT, 'config', 'templates.json'), 'r', encoding='utf-8') as f:
+            self.templates = json.load(f)
+
+    def _portfolio_data(self, size: int) -> Dict:
+        holdings = synthetic_portfolio(size)
+        frame = self.financial.calculate_holdings_frame(holdings, synthetic_market_data(list(holdings)), self.fx_rates)
+        portfolio_data = self.financial.calculate_frame_metrics(frame, self.fx_rates)
+        portfolio_data['timestamp'] = datetime.now().isoformat()
+        return portfolio_data
+
+    def _cmc_service(self, size: int):
+        cache = self.MarketDataCache(max_entries=2 * size + 16)
+        return self.CoinMarketCapService(cache=cache)
+
+    def cmc_get_market_data_cold(self, size: int, repeat: int) -> Dict[str, float]:
+        symbols = list(synthetic_portfolio(size))
+        state = {}
+
+        def setup():
+            state['service'] = self._cmc_service(size)
+
+        return measure(lambda: self.runtime.run(state['service'].get_market_data(symbols)), repeat, setup)
+
+    def cmc_get_market_data_warm(self, size: int, repeat: int) -> Dict[str, float]:
+        symbols = list(synthetic_portfolio(size))
+        service = self._cmc_service(size)
+        self.runtime.run(service.get_market_data(symbols))
+        return measure(lambda: self.runtime.run(service.get_market_data(symbols)), repeat)
+
+    def _json_decode_listings(self, backend: str, size: int, repeat: int) -> Optional[Dict[str, float]]:
+        """Parse time and peak memory of decoding a size-coin listings/latest body into quotes"""
+        codec = self.codecs.get(backend)
+        if codec is None:
+            return None
+        body = synthetic_listings_body(synthetic_symbols(size))
+        result = measure(lambda: codec.decode_quotes(body, 'USD'), repeat, track_memory=True)
+        result['body_bytes'] = len(body)
+        return result
+
+    def json_decode_listings_json(self, size: int, repeat: int) -> Optional[Dict[str, float]]:
+        return self._json_decode_listings('json', size, repeat)
+
+    def json_decode_listings_orjson(self, size: int, repeat: int) -> Optional[Dict[str, float]]:
+        return self._json_decode_listings('orjson', size, repeat)
+
+    def json_decode_listings_msgspec(self, size: int, repeat: int) -> Optional[Dict[str, float]]:
+        return self._json_decode_listings('msgspec', size, repeat)
+
+    def _listings_snapshot(self, size: int) -> Dict:
+        from services.listings_service import ListingsIndex
+        from services.records import Asset
+        assets = [
+            Asset(coin['id'], coin['symbol'], coin['name'], coin['slug'], coin['rank'])
+            for coin in synthetic_universe(size)
+        ]
+        return ListingsIndex(assets, fetched_at=time.time()).to_json()
+
+    def listings_index_build(self, size: int, repeat: int) -> Dict[str, float]:
+        from services.listings_service import ListingsIndex
+        snapshot = self._listings_snapshot(size)
+        return measure(lambda: ListingsIndex.from_json(snapshot), repeat, track_memory=True)
+
+    def listings_lookup(self, size: int, repeat: int) -> Dict[str, float]:
+        """Validation and prefix search for every symbol of a size-coin index"""
+        from services.listings_service import ListingsIndex
+        index = ListingsIndex.from_json(self._listings_snapshot(size))
+        symbols = [asset.symbol for asset in index.assets]
+
+        def run():
+            for symbol in symbols:
+                if symbol in index:
+                    index.resolve(symbol)
+                index.search(symbol[:4])
+
+        return measure(run, repeat)
+
+    def financial_calculate_holdings_value(self, size: int, repeat: int) -> Dict[str, float]:
+        holdings = synthetic_portfolio(size)
+        market_data = synthetic_market_data(list(holdings))
+        return measure(lambda: self.financial.calculate_holdings_value(holdings, market_data, self.fx_rates), repeat)
+
+    def financial_calculate_portfolio_metrics(self, size: int, repeat: int) -> Dict[str, float]:
+        holdings = synthetic_portfolio(size)
+        summary = self.financial.calculate_holdings_value(holdings, synthetic_market_data(list(holdings)), self.fx_rates)
+        return measure(lambda: self.financial.calculate_portfolio_metrics(summary), repeat)
+
+    def financial_holdings_frame(self, size: int, repeat: int) -> Dict[str, float]:
+        holdings = synthetic_portfolio(size)
+        market_data = synthetic_market_data(list(holdings))
+        return measure(
+            lambda: self.financial.calculate_frame_metrics(
+                self.financial.calculate_holdings_frame(holdings, market_data, self.fx_rates), self.fx_rates
+            ),
+            repeat
+        )
+
+    def earnings_calculate_earnings(self, size: int, repeat: int) -> Dict[str, float]:
+        portfolio_data = self._portfolio_data(size)
+        return measure(lambda: self.earnings.calculate_earnings(portfolio_data), repeat)
+
+    def rebalancing_plan(self, size: int, repeat: int) -> Dict[str, float]:
+        portfolio_data = self._portfolio_data(size)
+        return measure(lambda: self.rebalancer.plan(portfolio_data), repeat)
+
+    def openai_build_messages(self, size: int, repeat: int) -> Dict[str, float]:
+        portfolio_data = self._portfolio_data(size)
+        return measure(lambda: self.openai._build_messages(portfolio_data, self.templates), repeat)
+
+    def openai_generate_market_analysis(self, size: int, repeat: int) -> Dict[str, float]:
+        portfolio_data = self._portfolio_data(size)
+        return measure(lambda: self.openai.generate_market_analysis(portfolio_data, self.templates), repeat)
+
+    def run(self, cases: List[str], sizes: List[int], repeat: int) -> Dict[str, Dict[str, Dict]]:
+        results: Dict[str, Dict[str, Dict]] = {}
+        for case in cases:
+            max_size = self.CASES[case]
+            for size in sizes:
+                if max_size is not None and size > max_size:
+                    continue
+                timing = getattr(self, case)(size, repeat)
+                if timing is None:
+                    print(f"{case:<40}{size:>8}{'skipped (not installed)':>26}")
+                    break
+                results.setdefault(case, {})[str(size)] = timing
+                peak = f"{timing['peak_bytes'] / 1048576:>10.2f} MiB peak" if 'peak_bytes' in timing else ''
+                print(f"{case:<40}{size:>8}{timing['median_s'] * 1000:>12.2f} ms{peak}")
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: Dict, baseline_file: str, threshold: float) -> List[str]:
+    """Print the median ratio against a baseline run and return the regressed cases"""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    print(f"\n{'case':<40}{'size':>8}{'baseline ms':>14}{'current ms':>14}{'ratio':>8}")
+    for case, sizes in results.items():
+        for size, timing in sizes.items():
+            before = baseline.get(case, {}).get(size)
+            if before is None:
+                continue
+            ratio = timing['median_s'] / before['median_s'] if before['median_s'] > 0 else float('inf')
+            flag = '  REGRESSION' if ratio > threshold else ''
+            print(f"{case:<40}{size:>8}{before['median_s'] * 1000:>14.2f}"
+                  f"{timing['median_s'] * 1000:>14.2f}{ratio:>8.2f}{flag}")
+            if flag:
+                regressions.append(f"{case}[{size}]")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the valuation, caching and rebalancing hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Portfolio sizes")
+    parser.add_argument('--cases', nargs='+', choices=list(BenchmarkSuite.CASES),
+                        default=list(BenchmarkSuite.CASES), help="Cases to run")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case and size")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated API latency in seconds")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="Median ratio above which a case counts as a regression")
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as stub:
+        os.environ.update(stub.environ())
+        results = BenchmarkSuite(stub).run(args.cases, sorted(args.sizes), args.repeat)
+        requests = dict(stub.requests)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'created_at': datetime.now().isoformat(),
+            'repeat': args.repeat,
+            'latency_s': args.latency,
+            'stub_requests': requests
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
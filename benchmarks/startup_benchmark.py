@@ -0,0 +1,91 @@
+"""Import and cold-start benchmark for CryptoPortfolio
+
+Every run starts a fresh interpreter so module caches are cold, then times
+the startup stages of the CLI/app path:
+
+    import      import crypto_portfolio_v2
+    construct   CryptoPortfolio()
+    services    first use of the CMC, financial and OpenAI services
+    templates   first template load
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 10 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a child interpreter; prints one JSON object with stage timings
+CHILD_SCRIPT = r'''
+import json, os, sys, time
+os.environ.setdefault('CMC_API_KEY', 'benchmark')
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+timings = {}
+start = time.perf_counter()
+import crypto_portfolio_v2
+timings['import'] = time.perf_counter() - start
+
+mark = time.perf_counter()
+portfolio = crypto_portfolio_v2.CryptoPortfolio()
+timings['construct'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+portfolio.cmc_service, portfolio.financial_service, portfolio.openai_service
+timings['services'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+portfolio.templates
+timings['templates'] = time.perf_counter() - mark
+
+timings['total'] = time.perf_counter() - start
+print(json.dumps(timings))
+'''
+
+
+def run_once() -> Dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Median, min and max (in milliseconds) per stage"""
+    summary = {}
+    for stage in runs[0]:
+        values = [run[stage] * 1000 for run in runs]
+        summary[stage] = {
+            'median_ms': statistics.median(values),
+            'min_ms': min(values),
+            'max_ms': max(values)
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and cold-start time of CryptoPortfolio")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh interpreters to time")
+    parser.add_argument('--json', help="Write the summary to this JSON file")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = summarize(runs)
+
+    print(f"{'stage':<12}{'median ms':>12}{'min ms':>12}{'max ms':>12}")
+    for stage, stats in summary.items():
+        print(f"{stage:<12}{stats['median_ms']:>12.1f}{stats['min_ms']:>12.1f}{stats['max_ms']:>12.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'runs': args.runs, 'stages': summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
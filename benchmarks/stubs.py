@@ -0,0 +1,361 @@
+"""Local stand-ins for the CoinMarketCap and OpenAI APIs
+
+StubServer runs one aiohttp application on a background thread that
+answers the endpoints the services call, with deterministic synthetic
+data, so benchmarks measure the client side without network noise or API
+credits. Point the services at it with CMC_API_ROOT and OPENAI_BASE_URL
+(StubServer.environ() returns both).
+"""
+import asyncio
+import json
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+# Fiat currencies served by the stub: symbol -> (CMC id, units per USD)
+SYNTHETIC_FIAT = {
+    'USD': (2781, 1.0),
+    'BRL': (2783, 5.0),
+    'EUR': (2790, 0.92)
+}
+
+
+def synthetic_price(symbol: str) -> float:
+    """Deterministic USD price per symbol (stablecoins at 1)"""
+    if symbol in ('USDT', 'MUSD', 'USDC'):
+        return 1.0
+    return 1.0 + zlib.crc32(symbol.encode()) % 100000 / 50.0
+
+
+def synthetic_coin(symbol: str, convert: str = 'USD', rank: int = 1) -> Dict:
+    """Coin object shaped like CMC's quotes/latest and listings/latest entries
+
+    Carries the full set of fields the real API returns, most of which the
+    services never read, so decoding benchmarks see realistic payload sizes.
+    """
+    checksum = zlib.crc32(symbol.encode())
+    price = synthetic_price(symbol) * SYNTHETIC_FIAT.get(convert, (0, 1.0))[1]
+    supply = float(checksum % 1000000000 + 1000)
+    return {
+        'id': checksum % 1000000,
+        'name': f"{symbol} Token",
+        'symbol': symbol,
+        'slug': symbol.lower(),
+        'num_market_pairs': checksum % 500,
+        'date_added': '2021-05-01T00:00:00.000Z',
+        'tags': ['defi', 'layer-1', 'binance-smart-chain'][:checksum % 4],
+        'max_supply': None,
+        'circulating_supply': supply,
+        'total_supply': supply * 1.5,
+        'infinite_supply': False,
+        'platform': None,
+        'cmc_rank': rank,
+        'self_reported_circulating_supply': None,
+        'self_reported_market_cap': None,
+        'tvl_ratio': None,
+        'last_updated': '2024-01-01T00:00:00.000Z',
+        'quote': {convert: {
+            'price': price,
+            'volume_24h': price * supply * 0.05,
+            'volume_change_24h': (checksum % 1000 - 500) / 10.0,
+            'percent_change_1h': (checksum % 20 - 10) / 10.0,
+            'percent_change_24h': (checksum % 200 - 100) / 10.0,
+            'percent_change_7d': (zlib.adler32(symbol.encode()) % 400 - 200) / 10.0,
+            'percent_change_30d': (checksum % 600 - 300) / 10.0,
+            'percent_change_60d': (checksum % 800 - 400) / 10.0,
+            'percent_change_90d': (checksum % 1000 - 500) / 10.0,
+            'market_cap': price * supply,
+            'market_cap_dominance': checksum % 10000 / 10000.0,
+            'fully_diluted_market_cap': price * supply * 1.5,
+            'tvl': None,
+            'last_updated': '2024-01-01T00:00:00.000Z'
+        }}
+    }
+
+
+# Seconds per data point of the intervals served by the historical endpoints
+HISTORY_INTERVALS = {'daily': 86400, 'hourly': 3600, '5m': 300, '15m': 900}
+
+
+def synthetic_history_price(symbol: str, ts: int, convert: str = 'USD') -> float:
+    """Deterministic historical price: synthetic_price moved by up to 9% depending on ts"""
+    return synthetic_price(symbol) * (1 + (ts // 300) % 10 / 100.0) * SYNTHETIC_FIAT.get(convert, (0, 1.0))[1]
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+# Coins served by the stub's map and listings endpoints: a few real tickers
+# (UNI twice, as on CMC) followed by generated ones
+STUB_UNIVERSE_SIZE = 10000
+_NAMED_COINS = [
+    ('BTC', 'Bitcoin'), ('ETH', 'Ethereum'), ('USDT', 'Tether'), ('LTC', 'Litecoin'),
+    ('LINK', 'Chainlink'), ('UNI', 'Uniswap'), ('MUSD', 'mStable USD'), ('UNI', 'UNICORN Token')
+]
+
+
+def synthetic_universe(size: int = STUB_UNIVERSE_SIZE) -> List[Dict]:
+    """Map entries (id, rank, name, symbol, slug) of the stub's coin universe, by rank"""
+    coins = _NAMED_COINS + [(f"C{i:06d}", f"Coin {i}") for i in range(max(size - len(_NAMED_COINS), 0))]
+    return [
+        {'id': rank, 'rank': rank, 'name': name, 'symbol': symbol,
+         'slug': name.lower().replace(' ', '-'), 'is_active': 1}
+        for rank, (symbol, name) in enumerate(coins, 1)
+    ]
+
+
+def synthetic_listings_body(symbols: List[str], convert: str = 'USD') -> bytes:
+    """Raw listings/latest response body for symbols"""
+    return json.dumps({
+        'status': {'error_code': 0, 'credit_count': max((len(symbols) + 199) // 200, 1)},
+        'data': [synthetic_coin(symbol, convert, rank) for rank, symbol in enumerate(symbols, 1)]
+    }).encode()
+
+
+class StubServer:
+    """CoinMarketCap and OpenAI stub served from a background event loop"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind, 0 picks a free one
+            latency: Seconds added to every response, to simulate network round trips
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests: Dict[str, int] = {}
+        self._universe = synthetic_universe()
+        self._by_symbol: Dict[str, Dict] = {}
+        for entry in self._universe:
+            self._by_symbol.setdefault(entry['symbol'], entry)
+        self._by_id = {entry['id']: entry for entry in self._universe}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def environ(self) -> Dict[str, str]:
+        """Environment variables that route the services to this stub
+
+        The stub has no rate limits, so the credit scheduler is opened up too.
+        """
+        return {
+            'CMC_API_ROOT': self.url,
+            'CMC_API_KEY': 'benchmark',
+            'CMC_CALLS_PER_MINUTE': '1000000000',
+            'CMC_CREDITS_PER_DAY': '1000000000',
+            'CMC_ID_MAP_FILE': '',
+            'OPENAI_BASE_URL': f"{self.url}/v1",
+            'OPENAI_API_KEY': 'benchmark'
+        }
+
+    async def _count(self, request: web.Request) -> None:
+        self.requests[request.path] = self.requests.get(request.path, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _entry(self, symbol: str) -> Dict:
+        """Map entry for symbol; symbols outside the universe get an unranked entry on first sight"""
+        entry = self._by_symbol.get(symbol)
+        if entry is None:
+            asset_id = len(self._by_id) + 1
+            entry = {'id': asset_id, 'rank': None, 'name': symbol, 'symbol': symbol,
+                     'slug': symbol.lower(), 'is_active': 1}
+            self._by_symbol[symbol] = self._by_id[asset_id] = entry
+        return entry
+
+    async def _quotes_latest(self, request: web.Request) -> web.Response:
+        await self._count(request)
+        convert = request.query.get('convert', 'USD')
+        data = {}
+        if 'id' in request.query:
+            for key in request.query['id'].split(','):
+                entry = self._by_id.get(int(key))
+                if entry is not None:
+                    data[key] = synthetic_coin(entry['symbol'], convert, entry['rank'])
+                    data[key]['id'] = entry['id']
+        else:
+            for symbol in request.query.get('symbol', '').split(','):
+                if symbol:
+                    data[symbol] = synthetic_coin(symbol, convert)
+        return web.json_response({'status': {'error_code': 0}, 'data': data})
+
+    def _page(self, request: web.Request) -> List[Dict]:
+        start = int(request.query.get('start', '1'))
+        limit = int(request.query.get('limit', '100'))
+        return self._universe[start - 1:start - 1 + limit]
+
+    async def _cryptocurrency_map(self, request: web.Request) -> web.Response:
+        await self._count(request)
+        if 'symbol' in request.query:
+            # Every ticker sharing a requested symbol, like CMC
+            wanted = {symbol for symbol in request.query['symbol'].split(',') if symbol}
+            page = [entry for entry in self._universe if entry['symbol'] in wanted]
+            listed = {entry['symbol'] for entry in page}
+            page += [self._entry(symbol) for symbol in wanted - listed]
+        else:
+            page = self._page(request)
+        return web.json_response({'status': {'error_code': 0, 'credit_count': 1}, 'data': page})
+
+    async def _listings_latest(self, request: web.Request) -> web.Response:
+        await self._count(request)
+        convert = request.query.get('convert', 'USD')
+        data = []
+        for entry in self._page(request):
+            coin = synthetic_coin(entry['symbol'], convert, entry['rank'])
+            coin.update(id=entry['id'], name=entry['name'], slug=entry['slug'])
+            data.append(coin)
+        credit_count = max((len(data) + 199) // 200, 1)
+        return web.json_response({'status': {'error_code': 0, 'credit_count': credit_count}, 'data': data})
+
+    async def _fiat_map(self, request: web.Request) -> web.Response:
+        await self._count(request)
+        data = [{'id': fiat_id, 'symbol': symbol, 'name': symbol} for symbol, (fiat_id, _) in SYNTHETIC_FIAT.items()]
+        return web.json_response({'status': {'error_code': 0, 'credit_count': 1}, 'data': data})
+
+    async def _price_conversion(self, request: web.Request) -> web.Response:
+        await self._count(request)
+        by_id = {str(fiat_id): (symbol, rate) for symbol, (fiat_id, rate) in SYNTHETIC_FIAT.items()}
+        amount = float(request.query.get('amount', '1'))
+        source_rate = by_id[request.query['id']][1]
+        convert_ids = [key for key in request.query.get('convert_id', '').split(',') if key]
+        quote = {key: {'price': amount * by_id[key][1] / source_rate} for key in convert_ids}
+        return web.json_response({
+            'status': {'error_code': 0, 'credit_count': max(len(convert_ids), 1)},
+            'data': {'id': request.query['id'], 'amount': amount, 'quote': quote}
+        })
+
+    def _history_points(self, request: web.Request) -> range:
+        """Period starts after time_start (exclusive, like CMC) up to time_end"""
+        seconds = HISTORY_INTERVALS[request.query.get('interval', 'daily')]
+        time_start = int(request.query['time_start'])
+        time_end = int(request.query['time_end'])
+        return range((time_start // seconds + 1) * seconds, time_end + 1, seconds)
+
+    def _history_body(self, request: web.Request, quotes_for) -> Dict:
+        """v2 historical body: every requested symbol maps to a list of coins sharing it"""
+        points = self._history_points(request)
+        convert = request.query.get('convert', 'USD')
+        data = {}
+        for symbol in request.query.get('symbol', '').split(','):
+            if symbol:
+                entry = self._entry(symbol)
+                data[symbol] = [{
+                    'id': entry['id'], 'name': entry['name'], 'symbol': symbol,
+                    'quotes': [quotes_for(symbol, ts, convert) for ts in points]
+                }]
+        return {'status': {'error_code': 0, 'credit_count': max((len(points) + 99) // 100, 1)}, 'data': data}
+
+    async def _ohlcv_historical(self, request: web.Request) -> web.Response:
+        await self._count(request)
+        seconds = HISTORY_INTERVALS[request.query.get('interval', 'daily')]
+
+        def quotes_for(symbol: str, ts: int, convert: str) -> Dict:
+            open_price = synthetic_history_price(symbol, ts, convert)
+            close_price = synthetic_history_price(symbol, ts + seconds, convert)
+            return {
+                'time_open': _iso(ts), 'time_close': _iso(ts + seconds - 1),
+                'quote': {convert: {
+                    'open': open_price, 'high': max(open_price, close_price) * 1.01,
+                    'low': min(open_price, close_price) * 0.99, 'close': close_price,
+                    'volume': open_price * 1000, 'market_cap': open_price * 1000000,
+                    'timestamp': _iso(ts + seconds - 1)
+                }}
+            }
+
+        return web.json_response(self._history_body(request, quotes_for))
+
+    async def _quotes_historical(self, request: web.Request) -> web.Response:
+        await self._count(request)
+
+        def quotes_for(symbol: str, ts: int, convert: str) -> Dict:
+            price = synthetic_history_price(symbol, ts, convert)
+            return {
+                'timestamp': _iso(ts),
+                'quote': {convert: {
+                    'price': price, 'volume_24h': price * 1000, 'market_cap': price * 1000000,
+                    'timestamp': _iso(ts)
+                }}
+            }
+
+        return web.json_response(self._history_body(request, quotes_for))
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        await self._count(request)
+        body = await request.json()
+        text = "Análise de benchmark: portfólio dentro do esperado."
+        if not body.get('stream'):
+            return web.json_response({
+                'id': 'benchmark', 'object': 'chat.completion', 'created': 0, 'model': body.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                             'finish_reason': 'stop'}]
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for word in text.split(' '):
+            chunk = {
+                'id': 'benchmark', 'object': 'chat.completion.chunk', 'created': 0, 'model': body.get('model'),
+                'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def _make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/v1/cryptocurrency/quotes/latest', self._quotes_latest)
+        app.router.add_get('/v1/cryptocurrency/map', self._cryptocurrency_map)
+        app.router.add_get('/v1/cryptocurrency/listings/latest', self._listings_latest)
+        app.router.add_get('/v1/fiat/map', self._fiat_map)
+        app.router.add_get('/v2/tools/price-conversion', self._price_conversion)
+        app.router.add_get('/v2/cryptocurrency/ohlcv/historical', self._ohlcv_historical)
+        app.router.add_get('/v2/cryptocurrency/quotes/historical', self._quotes_historical)
+        app.router.add_post('/v1/chat/completions', self._chat_completions)
+        return app
+
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(self._make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self) -> 'StubServer':
+        """Start serving on a background thread"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='benchmark-stub', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,37 @@
+"""Synthetic portfolios and quote snapshots for benchmarks"""
+import random
+import zlib
+from typing import Dict, List
+
+from .stubs import SYNTHETIC_FIAT, synthetic_price
+
+
+def synthetic_symbols(size: int) -> List[str]:
+    """size symbols: USDT and MUSD plus generated tickers"""
+    return ['USDT', 'MUSD'] + [f"C{i:06d}" for i in range(max(size - 2, 0))]
+
+
+def synthetic_portfolio(size: int, seed: int = 42) -> Dict[str, float]:
+    """Holdings for size symbols with random amounts (reproducible for a seed)"""
+    rng = random.Random(seed)
+    return {symbol: rng.uniform(0.001, 10.0) for symbol in synthetic_symbols(size)}
+
+
+def synthetic_market_data(symbols: List[str]) -> Dict:
+    """Quotes in the format returned by CoinMarketCapService.get_market_data (USD base)"""
+    from services.records import Quote
+    return {
+        symbol: Quote(
+            synthetic_price(symbol),
+            (zlib.crc32(symbol.encode()) % 200 - 100) / 10.0,
+            (zlib.adler32(symbol.encode()) % 400 - 200) / 10.0
+        )
+        for symbol in symbols
+        if symbol != 'MUSD'
+    }
+
+
+def synthetic_fx_rates():
+    """Exchange rate table matching the stub's fiat rates"""
+    from services import FxRates
+    return FxRates(base='USD', rates={symbol: rate for symbol, (_, rate) in SYNTHETIC_FIAT.items() if symbol != 'USD'})
@@ -1,90 +1,228 @@
 import os
 import json
+import importlib
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
 from dotenv import load_dotenv
 import asyncio
 
-from services import CoinMarketCapService, FinancialService, OpenAIService, EarningsService
+from services.analysis_cache import get_analysis_cache
+from services.earnings_service import EarningsService
+from services.history_service import HistoryStore, get_history_store
+from services.portfolio_store import PortfolioStore
+
+if TYPE_CHECKING:
+    from services.coinmarketcap_service import CoinMarketCapService
+    from services.financial_service import FinancialService
+    from services.listings_service import ListingsService
+    from services.openai_service import OpenAIService
 
 # Load environment variables
 load_dotenv()
 
+TEMPLATES_FILE = os.path.join(os.path.dirname(__file__), 'config', 'templates.json')
+
+_templates: Optional[Dict] = None
+_templates_lock = threading.Lock()
+
+
+def load_templates() -> Dict:
+    """Load the analysis templates once per process"""
+    global _templates
+    with _templates_lock:
+        if _templates is None:
+            try:
+                with open(TEMPLATES_FILE, 'r', encoding='utf-8') as f:
+                    _templates = json.load(f)
+            except Exception as e:
+                print(f"Error loading templates: {e}")
+                return {
+                    "system_template": "",
+                    "user_template": ""
+                }
+        return _templates
+
+
+def preload_modules(*modules: str) -> threading.Thread:
+    """Import modules on a background thread
+
+    Lets slow imports (openai, pandas, plotly) overlap with network I/O such
+    as the first quote fetch; a later regular import just waits on the
+    import lock if the module is still loading.
+    """
+    def run():
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                print(f"Error preloading {module}: {e}")
+
+    thread = threading.Thread(target=run, name='module-preload', daemon=True)
+    thread.start()
+    return thread
+
+
 class CryptoPortfolio:
-    def __init__(self, portfolio=None):
-        # Initialize services
-        self.cmc_service = CoinMarketCapService()
-        self.financial_service = FinancialService()
-        self.openai_service = OpenAIService()
+    """Portfolio facade used by the Streamlit app and the CLI
+
+    Services, the history store and the templates are created on first use,
+    so constructing a CryptoPortfolio (which the app does on every rerun)
+    only reads the portfolio file.
+    """
+
+    def __init__(self, portfolio=None, portfolio_file: Optional[str] = None):
+        # Services are created lazily by the properties below
+        self._cmc_service: Optional['CoinMarketCapService'] = None
+        self._financial_service: Optional['FinancialService'] = None
+        self._openai_service: Optional['OpenAIService'] = None
+        self._history: Optional[HistoryStore] = None
         self.earnings_service = EarningsService()
         
         # Portfolio file paths
-        self.portfolio_file = os.path.join(os.path.dirname(__file__), 'portfolio.json')
+        self.portfolio_file = portfolio_file or os.path.join(os.path.dirname(__file__), 'portfolio.json')
         self.daily_values_file = os.path.join(os.path.dirname(__file__), 'daily_values.json')
+        self.history_file = os.path.join(os.path.dirname(__file__), 'portfolio_history.db')
+        self.analysis_cache_file = os.path.join(os.path.dirname(__file__), 'analysis_cache.json')
+        self.listings_file = os.path.join(os.path.dirname(__file__), 'listings_snapshot.json')
         
-        # Load portfolio and daily values
+        # Load portfolio; changes are staged and written through the store
+        self.store = PortfolioStore(self.portfolio_file)
+        self._pending: Dict[str, Optional[float]] = {}
+        self._batch_depth = 0
         self.portfolio = self._load_portfolio() if portfolio is None else portfolio
-        self.daily_values = self._load_daily_values()
-        
-        # Load templates
-        self.templates = self._load_templates()
+
+    @property
+    def cmc_service(self) -> 'CoinMarketCapService':
+        """CoinMarketCap client, created on first use"""
+        if self._cmc_service is None:
+            from services.coinmarketcap_service import CoinMarketCapService
+            # New symbols resolve to CMC ids through the local listings snapshot
+            self._cmc_service = CoinMarketCapService(listings=self.listings)
+        return self._cmc_service
+
+    @property
+    def financial_service(self) -> 'FinancialService':
+        """Valuation service, created on first use (imports pandas)"""
+        if self._financial_service is None:
+            from services.financial_service import FinancialService
+            self._financial_service = FinancialService()
+        return self._financial_service
+
+    @property
+    def openai_service(self) -> 'OpenAIService':
+        """OpenAI client, created on first use (imports the OpenAI SDK)"""
+        if self._openai_service is None:
+            from services.openai_service import OpenAIService
+            self._openai_service = OpenAIService()
+        return self._openai_service
+
+    @property
+    def listings(self) -> 'ListingsService':
+        """Local CMC listings snapshot, shared by every instance in the process"""
+        from services.listings_service import get_listings_service
+        return get_listings_service(self.listings_file)
+
+    @property
+    def history(self) -> HistoryStore:
+        """Snapshot history store, opened on first use"""
+        if self._history is None:
+            self._history = self._load_history()
+        return self._history
+
+    @property
+    def templates(self) -> Dict:
+        """Analysis templates, shared by every instance in the process"""
+        return load_templates()
+
+    # Holdings used when no portfolio file exists yet
+    DEFAULT_PORTFOLIO = {
+        'MUSD': 8.61847767,
+        'UNI': 0.31159027,
+        'ETH': 0.00124575,
+        'BTC': 0.00004615,
+        'LINK': 0.20556793,
+        'LTC': 0.03921850
+    }
 
     def _load_portfolio(self) -> Dict:
         """Load portfolio from file or return default values"""
         try:
-            if os.path.exists(self.portfolio_file):
-                with open(self.portfolio_file, 'r') as f:
-                    return json.load(f)
+            portfolio = self.store.load()
+            if portfolio is not None:
+                return portfolio
         except Exception as e:
             print(f"Error loading portfolio: {e}")
         
-        return {
-            'MUSD': 8.61847767,
-            'UNI': 0.31159027,
-            'ETH': 0.00124575,
-            'BTC': 0.00004615,
-            'LINK': 0.20556793,
-            'LTC': 0.03921850
-        }
+        return dict(self.DEFAULT_PORTFOLIO)
+
+    def _stage(self, symbol: str, amount: Optional[float]) -> None:
+        """Apply a change in memory and persist it, or defer it inside batch()
+
+        Args:
+            symbol: Holding to change
+            amount: New amount, or None to remove the holding
+        """
+        if amount is None:
+            self.portfolio.pop(symbol, None)
+        else:
+            self.portfolio[symbol] = amount
+        self._pending[symbol] = amount
+        if self._batch_depth == 0:
+            self._save_portfolio()
 
     def _save_portfolio(self):
-        """Save portfolio to file"""
+        """Write staged changes to file in one locked, atomic transaction
+
+        Changes are applied on top of the file's current contents, so edits
+        made concurrently by other sessions are kept.
+        """
+        pending, self._pending = self._pending, {}
         try:
-            with open(self.portfolio_file, 'w') as f:
-                json.dump(self.portfolio, f, indent=4)
+            with self.store.transaction(default=self.portfolio) as holdings:
+                for symbol, amount in pending.items():
+                    if amount is None:
+                        holdings.pop(symbol, None)
+                    else:
+                        holdings[symbol] = amount
+            self.portfolio = dict(holdings)
         except Exception as e:
             print(f"Error saving portfolio: {e}")
 
-    def _load_templates(self) -> Dict:
-        """Load analysis templates from JSON file"""
-        template_path = os.path.join(os.path.dirname(__file__), 'config', 'templates.json')
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading templates: {e}")
-            return {
-                "system_template": "",
-                "user_template": ""
-            }
-
-    def _load_daily_values(self) -> Dict:
-        """Load daily portfolio values from file"""
+    @contextmanager
+    def batch(self) -> Iterator['CryptoPortfolio']:
+        """Group holding changes into a single write
+
+        Inside the block add_holding, update_holdings and remove_holding only
+        update memory; everything is written once when the outermost block
+        exits. If the block raises, the staged changes are discarded and the
+        portfolio is reloaded from file.
+        """
+        self._batch_depth += 1
         try:
-            if os.path.exists(self.daily_values_file):
-                with open(self.daily_values_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Error loading daily values: {e}")
-        return {'last_update': None, 'values': {}}
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._pending = {}
+                self.portfolio = self._load_portfolio()
+            raise
+        else:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._pending:
+                self._save_portfolio()
 
-    def _save_daily_values(self):
-        """Save daily portfolio values to file"""
+    def _load_history(self) -> HistoryStore:
+        """Open the snapshot history, importing the legacy daily_values.json once"""
+        history = get_history_store(self.history_file)
         try:
-            with open(self.daily_values_file, 'w') as f:
-                json.dump(self.daily_values, f, indent=4)
+            if history.is_empty() and os.path.exists(self.daily_values_file):
+                with open(self.daily_values_file, 'r') as f:
+                    history.import_daily_values(json.load(f))
         except Exception as e:
-            print(f"Error saving daily values: {e}")
+            print(f"Error importing daily values: {e}")
+        return history
 
     def add_holding(self, symbol: str, amount: float) -> None:
         """Add a new cryptocurrency holding"""
@@ -96,9 +234,15 @@ class CryptoPortfolio:
         symbol = symbol.strip().upper()
         if symbol in self.portfolio:
             raise ValueError(f"Symbol {symbol} already exists in portfolio")
+
+        # Checked against the local listings snapshot; skipped until one has been fetched
+        index = self.listings.get_index()
+        if index is not None and symbol not in index:
+            suggestions = ', '.join(asset.symbol for asset in index.search(symbol[:3], limit=5))
+            hint = f" Did you mean: {suggestions}?" if suggestions else ""
+            raise ValueError(f"Unknown symbol {symbol}.{hint}")
             
-        self.portfolio[symbol] = float(amount)
-        self._save_portfolio()
+        self._stage(symbol, float(amount))
 
     def update_holdings(self, symbol: str, amount: float) -> None:
         """Update or add a new cryptocurrency holding"""
@@ -111,11 +255,7 @@ class CryptoPortfolio:
         if symbol not in self.portfolio:
             raise ValueError(f"Symbol {symbol} not found in portfolio")
             
-        if amount <= 0:
-            del self.portfolio[symbol]
-        else:
-            self.portfolio[symbol] = float(amount)
-        self._save_portfolio()
+        self._stage(symbol, float(amount) if amount > 0 else None)
 
     def remove_holding(self, symbol: str) -> None:
         """Remove a cryptocurrency holding"""
@@ -126,49 +266,81 @@ class CryptoPortfolio:
         if symbol not in self.portfolio:
             raise ValueError(f"Symbol {symbol} not found in portfolio")
             
-        del self.portfolio[symbol]
-        self._save_portfolio()
+        self._stage(symbol, None)
 
     async def get_portfolio_data(self, force_refresh: bool = False) -> Dict:
         """Get current portfolio data with market information"""
-        # Get market data for all portfolio symbols
-        market_data = await self.cmc_service.get_market_data(
-            list(self.portfolio.keys()),
-            force_refresh=force_refresh
+        # Get market data for all portfolio symbols (in the base currency) and
+        # the exchange rates to report it in; the rates have their own longer TTL
+        market_data, fx_rates = await asyncio.gather(
+            self.cmc_service.get_market_data(
+                list(self.portfolio.keys()),
+                force_refresh=force_refresh
+            ),
+            self.cmc_service.get_fx_rates()
         )
         
-        # Calculate holdings values and metrics
-        holdings_summary = self.financial_service.calculate_holdings_value(
+        # Value all holdings in one vectorized pass
+        holdings_frame = self.financial_service.calculate_holdings_frame(
             self.portfolio, 
-            market_data
+            market_data,
+            fx_rates
         )
         
         # Calculate overall portfolio metrics
-        portfolio_metrics = self.financial_service.calculate_portfolio_metrics(holdings_summary)
+        portfolio_metrics = self.financial_service.calculate_frame_metrics(holdings_frame, fx_rates)
         
         # Add timestamp
         portfolio_metrics['timestamp'] = datetime.now().isoformat()
+
+        # Record the snapshot in the history store and book it in the earnings ledger
+        try:
+            self.history.append_snapshot(portfolio_metrics)
+        except Exception as e:
+            print(f"Error saving portfolio history: {e}")
+        try:
+            # Removed holdings are closed against the file, not this session's copy
+            stored = self.store.load()
+            ledger = self.earnings_service.get_ledger(self.history)
+            ledger.sync(holdings=stored if stored is not None else self.portfolio)
+        except Exception as e:
+            print(f"Error updating earnings ledger: {e}")
         
         return portfolio_metrics
 
-    async def get_earnings_data(self) -> Dict:
-        """Get earnings data for the portfolio"""
-        portfolio_data = await self.get_portfolio_data()
-        return self.earnings_service.calculate_earnings(portfolio_data)
+    def get_earnings_data(self) -> Dict:
+        """Get earnings data for the portfolio
+
+        Read-only: the ledger is derived from the snapshot history and booked
+        by get_portfolio_data whenever a snapshot is recorded.
+        """
+        return self.earnings_service.get_ledger(self.history).summary()
 
     def get_market_analysis(self, portfolio_data: Dict) -> str:
         """Generate market analysis for the current portfolio"""
         return self.openai_service.generate_market_analysis(
             portfolio_data,
-            self.templates
+            self.templates,
+            cache=get_analysis_cache(self.analysis_cache_file)
+        )
+
+    def stream_market_analysis(self, portfolio_data: Dict) -> Iterator[str]:
+        """Generate market analysis for the current portfolio, yielding text as it arrives"""
+        return self.openai_service.stream_market_analysis(
+            portfolio_data,
+            self.templates,
+            cache=get_analysis_cache(self.analysis_cache_file)
         )
 
     async def close(self):
         """Close all service connections"""
-        await self.cmc_service.close()
+        if self._cmc_service is not None:
+            await self._cmc_service.close()
 
     def __del__(self):
         """Cleanup on object destruction"""
+        if getattr(self, '_cmc_service', None) is None:
+            return
         try:
             loop = asyncio.get_event_loop()
             if loop.is_running():
@@ -180,22 +352,27 @@ class CryptoPortfolio:
 
     def display_portfolio(self):
         """Display portfolio information and AI analysis"""
-        portfolio_data = asyncio.run(self.get_portfolio_data())
+        from services.async_runtime import get_runtime
+        preload_modules('services.openai_service')
+        portfolio_data = get_runtime().run(self.get_portfolio_data())
         analysis = self.get_market_analysis(portfolio_data)
         
         print("\n=== Crypto Portfolio Summary ===")
         print(f"Total Portfolio Value: R$ {portfolio_data['total_value_brl']:,.2f}")
+        for currency, value in portfolio_data.get('total_value', {}).items():
+            if currency != 'BRL':
+                print(f"  in {currency}: {value:,.2f}")
         print("\nHoldings:")
         
         for holding in portfolio_data['holdings']:
-            print(f"\n{holding['symbol']}:")
-            print(f"  Amount: {holding['amount']}")
-            print(f"  Price: R$ {holding['price_brl']:,.2f}")
-            print(f"  Value: R$ {holding['value_brl']:,.2f}")
-            print(f"  24h Change: {holding['percent_change_24h']:,.2f}%")
-            print(f"  7d Change: {holding['percent_change_7d']:,.2f}%")
-            print(f"  24h Volume: R$ {holding['volume_24h']:,.2f}")
-            print(f"  Market Cap: R$ {holding['market_cap']:,.2f}")
+            print(f"\n{holding.symbol}:")
+            print(f"  Amount: {holding.amount}")
+            print(f"  Price: R$ {holding.price_brl:,.2f}")
+            print(f"  Value: R$ {holding.value_brl:,.2f}")
+            print(f"  24h Change: {holding.percent_change_24h:,.2f}%")
+            print(f"  7d Change: {holding.percent_change_7d:,.2f}%")
+            print(f"  24h Volume: R$ {holding.volume_24h:,.2f}")
+            print(f"  Market Cap: R$ {holding.market_cap:,.2f}")
 
         print("\n=== AI Market Analysis ===")
         print(analysis)
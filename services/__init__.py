@@ -1,6 +1,84 @@
-from .coinmarketcap_service import CoinMarketCapService
-from .financial_service import FinancialService
-from .openai_service import OpenAIService
-from .earnings_service import EarningsService
+import importlib
 
-__all__ = ['CoinMarketCapService', 'FinancialService', 'OpenAIService', 'EarningsService']
+# Public name -> submodule. Submodules are imported on first attribute access,
+# so importing the package does not pull in openai, pandas or aiohttp until
+# a service that needs them is actually used.
+_EXPORTS = {
+    'CoinMarketCapService': 'coinmarketcap_service',
+    'FinancialService': 'financial_service',
+    'OpenAIService': 'openai_service',
+    'get_openai_client': 'openai_service',
+    'EarningsService': 'earnings_service',
+    'EarningsLedger': 'earnings_service',
+    'Trade': 'earnings_service',
+    'AnalysisCache': 'analysis_cache',
+    'get_analysis_cache': 'analysis_cache',
+    'AsyncRuntime': 'async_runtime',
+    'get_runtime': 'async_runtime',
+    'CreditScheduler': 'rate_limit_service',
+    'CreditBudgetExceeded': 'rate_limit_service',
+    'get_credit_scheduler': 'rate_limit_service',
+    'FxRates': 'fx_service',
+    'FxService': 'fx_service',
+    'Quote': 'records',
+    'Holding': 'records',
+    'SymbolTable': 'records',
+    'get_symbol_table': 'records',
+    'Asset': 'records',
+    'JsonCodec': 'json_codec',
+    'get_json_codec': 'json_codec',
+    'ListingsIndex': 'listings_service',
+    'ListingsService': 'listings_service',
+    'get_listings_service': 'listings_service',
+    'SymbolIdMap': 'listings_service',
+    'get_symbol_id_map': 'listings_service',
+    'MarketDataCache': 'cache_service',
+    'get_shared_cache': 'cache_service',
+    'HistoricalBackfillService': 'backfill_service',
+    'BatchValuationService': 'batch_service',
+    'HistoryStore': 'history_service',
+    'get_history_store': 'history_service',
+    'PortfolioRegistry': 'portfolio_registry',
+    'PortfolioStore': 'portfolio_store',
+    'RebalancingService': 'rebalancing_service',
+    'RebalancePlan': 'rebalancing_service',
+    'MetricsRegistry': 'metrics_service',
+    'get_metrics': 'metrics_service',
+    'start_metrics_server': 'metrics_service',
+    'PortfolioRefresher': 'refresh_service',
+    'PortfolioSnapshot': 'refresh_service'
+}
+
+__all__ = [
+    'CoinMarketCapService', 'FinancialService',
+    'OpenAIService', 'get_openai_client',
+    'EarningsService', 'EarningsLedger', 'Trade',
+    'AnalysisCache', 'get_analysis_cache',
+    'AsyncRuntime', 'get_runtime',
+    'CreditScheduler', 'CreditBudgetExceeded', 'get_credit_scheduler',
+    'FxRates', 'FxService',
+    'Quote', 'Holding', 'SymbolTable', 'get_symbol_table',
+    'Asset', 'JsonCodec', 'get_json_codec',
+    'ListingsIndex', 'ListingsService', 'get_listings_service',
+    'SymbolIdMap', 'get_symbol_id_map',
+    'MarketDataCache', 'get_shared_cache',
+    'HistoricalBackfillService',
+    'BatchValuationService',
+    'HistoryStore', 'get_history_store',
+    'PortfolioRegistry', 'PortfolioStore',
+    'RebalancingService', 'RebalancePlan',
+    'MetricsRegistry', 'get_metrics', 'start_metrics_server',
+    'PortfolioRefresher', 'PortfolioSnapshot'
+]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from .metrics_service import get_metrics, timed
+
+
+class AnalysisCache:
+    """Disk-backed cache of AI market analyses keyed on a quantized portfolio fingerprint
+
+    The fingerprint rounds allocations to a tolerance band and buckets the
+    24h/7d changes, so small price moves map to the same key and a new
+    completion is only requested once the portfolio has actually moved.
+    Entries expire after a TTL, the least recently used ones are evicted
+    beyond max_entries, and the cache is saved to a JSON file so it survives
+    restarts.
+    """
+
+    def __init__(self, cache_file: Optional[str], ttl: timedelta = timedelta(hours=6),
+                 max_entries: int = 64, allocation_band: float = 2.5, change_bucket: float = 2.0):
+        """
+        Args:
+            cache_file: JSON file the cache is persisted to, or None for memory only
+            ttl: Maximum age of an analysis
+            max_entries: Maximum number of analyses kept
+            allocation_band: Allocation tolerance in percentage points
+            change_bucket: Width of the 24h/7d change buckets in percentage points
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.allocation_band = allocation_band
+        self.change_bucket = change_bucket
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @timed('file_io_seconds', file='analysis_cache', op='read')
+    def _load(self) -> None:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._entries = OrderedDict(json.load(f))
+        except Exception as e:
+            print(f"Error loading analysis cache: {e}")
+
+    @timed('file_io_seconds', file='analysis_cache', op='write')
+    def _save(self) -> None:
+        """Persist entries with an atomic rename (caller must hold the lock)"""
+        if not self.cache_file:
+            return
+        try:
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"Error saving analysis cache: {e}")
+
+    def _bucket(self, value: float, width: float) -> int:
+        return int(math.floor(value / width)) if width > 0 else 0
+
+    def fingerprint(self, portfolio_data: Dict, template_data: Dict,
+                    rebalance_config: Optional[Dict] = None) -> str:
+        """Build the cache key for a portfolio snapshot, prompt templates and rebalancer settings"""
+        total_value = portfolio_data.get('total_value_brl', 0) or 0
+        holdings = []
+        for holding in sorted(portfolio_data.get('holdings', []), key=lambda h: h.symbol):
+            allocation = holding.portfolio_percentage
+            if allocation is None:
+                allocation = (holding.value_brl / total_value * 100) if total_value > 0 else 0
+            holdings.append([
+                holding.symbol,
+                round(allocation / self.allocation_band),
+                self._bucket(holding.percent_change_24h, self.change_bucket),
+                self._bucket(holding.percent_change_7d, self.change_bucket)
+            ])
+
+        template_hash = hashlib.sha256(
+            json.dumps(template_data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        # The prompt's rebalancing section depends on the weights, tolerance and mode
+        rebalance_hash = hashlib.sha256(
+            json.dumps(rebalance_config or {}, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+        features = {
+            'holdings': holdings,
+            'change_24h': self._bucket(portfolio_data.get('weighted_24h_change', 0), self.change_bucket),
+            'change_7d': self._bucket(portfolio_data.get('weighted_7d_change', 0), self.change_bucket),
+            'templates': template_hash,
+            'rebalance': rebalance_hash
+        }
+        return hashlib.sha256(json.dumps(features, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached analysis if present and not expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and datetime.now() - datetime.fromisoformat(entry['created_at']) < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['analysis']
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, analysis: str) -> None:
+        """Store an analysis, evicting the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._entries[key] = {'created_at': datetime.now().isoformat(), 'analysis': analysis}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+
+_caches: Dict[str, AnalysisCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_analysis_cache(cache_file: str) -> AnalysisCache:
+    """Return the process-wide analysis cache for a file"""
+    cache_file = os.path.abspath(cache_file)
+    with _caches_lock:
+        if cache_file not in _caches:
+            cache = _caches[cache_file] = AnalysisCache(
+                cache_file,
+                ttl=timedelta(seconds=int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', '21600')))
+            )
+            get_metrics().register_collector(lambda: {
+                'analysis_cache_hits': cache.hits,
+                'analysis_cache_misses': cache.misses
+            })
+        return _caches[cache_file]
@@ -0,0 +1,128 @@
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Optional
+
+import aiohttp
+
+
+class AsyncRuntime:
+    """Long-lived event loop running in a background thread
+
+    The loop owns a single pooled aiohttp session (keep-alive, DNS cache,
+    connection limits) that every service running on it shares, so warm
+    requests reuse open TCP/TLS connections. Synchronous code such as the
+    Streamlit script calls run() instead of creating its own event loops.
+    """
+
+    def __init__(self, limit: int = 20, limit_per_host: int = 10,
+                 ttl_dns_cache: int = 300, keepalive_timeout: float = 30.0,
+                 timeout: float = 10.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The runtime event loop, started on first access"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    ready = threading.Event()
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=self._run_loop, args=(loop, ready), name='async-runtime', daemon=True
+                    )
+                    self._thread.start()
+                    ready.wait()
+                    self._loop = loop
+        return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def owns_current_loop(self) -> bool:
+        """True when called from a coroutine running on the runtime loop"""
+        try:
+            return self._loop is not None and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coroutine: Awaitable) -> concurrent.futures.Future:
+        """Schedule a coroutine on the runtime loop without waiting for it"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the runtime loop and block until it finishes
+
+        Raises:
+            RuntimeError: If called from the runtime loop itself, which would deadlock
+        """
+        if self.owns_current_loop():
+            raise RuntimeError("AsyncRuntime.run() cannot be called from the runtime loop")
+        return self.submit(coroutine).result(timeout)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared pooled session; must be awaited on the runtime loop"""
+        if not self.owns_current_loop():
+            raise RuntimeError("The shared session can only be used on the runtime loop")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def _close_session(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def close(self) -> None:
+        """Close the shared session and stop the loop"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_session(), loop).result(5)
+        except Exception as e:
+            print(f"Error closing shared session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(5)
+        if not loop.is_running():
+            loop.close()
+        self._session = None
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AsyncRuntime:
+    """Return the process-wide async runtime, creating it on first use"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AsyncRuntime()
+                atexit.register(_runtime.close)
+    return _runtime
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .coinmarketcap_service import CoinMarketCapService
+from .fx_service import VALUATION_CURRENCY
+from .history_service import HistoryStore, get_history_store
+
+
+class HistoricalBackfillService:
+    """Backfills historical prices from CoinMarketCap into the local HistoryStore
+
+    Each symbol is paged through the historical endpoints with bounded
+    concurrency. Fetched ranges are recorded in a checkpoint file after every
+    page, so an interrupted run resumes where it stopped and later runs only
+    request the gaps that were never fetched.
+    """
+
+    # Period -> (endpoint, fixed query params, seconds per period)
+    PERIODS = {
+        'daily': ('/v2/cryptocurrency/ohlcv/historical', {'time_period': 'daily', 'interval': 'daily'}, 86400),
+        'hourly': ('/v2/cryptocurrency/ohlcv/historical', {'time_period': 'hourly', 'interval': 'hourly'}, 3600),
+        '5m': ('/v2/cryptocurrency/quotes/historical', {'interval': '5m'}, 300),
+        '15m': ('/v2/cryptocurrency/quotes/historical', {'interval': '15m'}, 900)
+    }
+
+    def __init__(self, store: HistoryStore, cmc_service: Optional[CoinMarketCapService] = None,
+                 checkpoint_file: Optional[str] = None, max_concurrency: int = 4, page_size: int = 500):
+        """
+        Args:
+            store: Destination history store
+            cmc_service: CoinMarketCap client, created if not given
+            checkpoint_file: JSON file recording the ranges already fetched
+                (defaults to <store>.backfill.json)
+            max_concurrency: Maximum number of requests in flight
+            page_size: Periods requested per call (CMC bills 1 credit per 100 points)
+        """
+        self.store = store
+        self.cmc_service = cmc_service if cmc_service is not None else CoinMarketCapService()
+        self.checkpoint_file = checkpoint_file or f"{store.db_path}.backfill.json"
+        self.max_concurrency = max_concurrency
+        self.page_size = page_size
+        self._checkpoint = self._load_checkpoint()
+
+    def _load_checkpoint(self) -> Dict[str, List[List[int]]]:
+        try:
+            if os.path.exists(self.checkpoint_file):
+                with open(self.checkpoint_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error loading backfill checkpoint: {e}")
+        return {}
+
+    def _save_checkpoint(self) -> None:
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self._checkpoint, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    @staticmethod
+    def _checkpoint_key(symbol: str, period: str) -> str:
+        return f"{symbol}:{period}"
+
+    def _mark_covered(self, key: str, start_ts: int, end_ts: int, seconds: int) -> None:
+        """Add [start_ts, end_ts] to the covered ranges of key and persist the checkpoint
+
+        Ranges that touch (one period apart) are merged.
+        """
+        ranges = sorted(self._checkpoint.get(key, []) + [[start_ts, end_ts]])
+        merged: List[List[int]] = []
+        for range_start, range_end in ranges:
+            if merged and range_start <= merged[-1][1] + seconds:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        self._checkpoint[key] = merged
+        self._save_checkpoint()
+
+    def gaps(self, symbol: str, period: str, start_ts: int, end_ts: int) -> List[Tuple[int, int]]:
+        """Ranges within [start_ts, end_ts] that have not been fetched yet"""
+        seconds = self.PERIODS[period][2]
+        gaps = []
+        cursor = start_ts
+        for range_start, range_end in self._checkpoint.get(self._checkpoint_key(symbol, period), []):
+            if range_end < cursor:
+                continue
+            if range_start > end_ts:
+                break
+            if range_start > cursor:
+                gaps.append((cursor, min(range_start - seconds, end_ts)))
+            cursor = max(cursor, range_end + seconds)
+        if cursor <= end_ts:
+            gaps.append((cursor, end_ts))
+        return gaps
+
+    @staticmethod
+    def _to_epoch(value: str) -> int:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+    @staticmethod
+    def _symbol_entry(data: Dict, symbol: str) -> Optional[Dict]:
+        """Pick the coin entry for symbol from a v2 historical response
+
+        Single-coin responses are returned unwrapped; multi-coin and by-symbol
+        responses map each symbol to an object or a list of coins sharing it.
+        """
+        if 'quotes' in data:
+            return data
+        entry = data.get(symbol)
+        if isinstance(entry, list):
+            return entry[0] if entry else None
+        return entry
+
+    def _parse_rows(self, period: str, entry: Dict, convert: str) -> List[Dict]:
+        """Convert API quotes to HistoryStore OHLCV rows"""
+        rows = []
+        is_ohlcv = self.PERIODS[period][0].endswith('ohlcv/historical')
+        for item in entry.get('quotes', []):
+            quote = (item.get('quote') or {}).get(convert)
+            if not quote:
+                continue
+            if is_ohlcv:
+                rows.append({
+                    'ts': self._to_epoch(item['time_open']),
+                    'open': quote.get('open'),
+                    'high': quote.get('high'),
+                    'low': quote.get('low'),
+                    'close': quote['close'],
+                    'volume': quote.get('volume'),
+                    'market_cap': quote.get('market_cap')
+                })
+            else:
+                price = quote['price']
+                rows.append({
+                    'ts': self._to_epoch(item['timestamp']),
+                    'open': price,
+                    'high': price,
+                    'low': price,
+                    'close': price,
+                    'volume': quote.get('volume_24h'),
+                    'market_cap': quote.get('market_cap')
+                })
+        return rows
+
+    async def _fetch_page(self, symbol: str, period: str, page_start: int, page_end: int,
+                          semaphore: asyncio.Semaphore) -> int:
+        path, fixed_params, seconds = self.PERIODS[period]
+        # History is kept in the valuation currency: converting past prices
+        # with today's exchange rate would distort them
+        convert = VALUATION_CURRENCY
+        params = dict(fixed_params)
+        params.update({
+            'symbol': symbol,
+            'convert': convert,
+            # time_start is exclusive, so ask from one period before the page
+            'time_start': page_start - seconds,
+            'time_end': page_end,
+            'skip_invalid': 'true'
+        })
+        async with semaphore:
+            data = await self.cmc_service._request(path, params)
+
+        entry = self._symbol_entry(data['data'], symbol)
+        rows = self._parse_rows(period, entry, convert) if entry else []
+        written = self.store.append_ohlcv(symbol, period, rows)
+        self._mark_covered(self._checkpoint_key(symbol, period), page_start, page_end, seconds)
+        return written
+
+    async def _backfill_symbol(self, symbol: str, period: str, start_ts: int, end_ts: int,
+                               semaphore: asyncio.Semaphore) -> int:
+        seconds = self.PERIODS[period][2]
+        page_span = self.page_size * seconds
+        written = 0
+        for gap_start, gap_end in self.gaps(symbol, period, start_ts, end_ts):
+            page_start = gap_start
+            while page_start <= gap_end:
+                page_end = min(gap_end, page_start + page_span - seconds)
+                written += await self._fetch_page(symbol, period, page_start, page_end, semaphore)
+                page_start = page_end + seconds
+        return written
+
+    async def backfill(self, symbols: List[str], start: datetime, end: Optional[datetime] = None,
+                       period: str = 'daily') -> Dict[str, int]:
+        """Fill missing history for symbols between start and end
+
+        Args:
+            symbols: Symbols to backfill
+            start: First period to fetch
+            end: Last period to fetch, defaults to the last complete period
+            period: One of PERIODS
+
+        Returns:
+            Rows written per symbol (errors are reported and do not stop other symbols)
+
+        Raises:
+            ValueError: If the period is not supported
+        """
+        if period not in self.PERIODS:
+            raise ValueError(f"Unsupported period {period}, use one of {list(self.PERIODS)}")
+        seconds = self.PERIODS[period][2]
+        start_ts = int(start.timestamp()) // seconds * seconds
+        end_ts = int((end or datetime.now(timezone.utc)).timestamp()) // seconds * seconds
+        if end is None:
+            end_ts -= seconds  # the current period is still incomplete
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        symbols = list(dict.fromkeys(symbols))
+        results = await asyncio.gather(
+            *(self._backfill_symbol(symbol, period, start_ts, end_ts, semaphore) for symbol in symbols),
+            return_exceptions=True
+        )
+
+        written = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"Error backfilling {symbol}: {result}")
+                written[symbol] = 0
+            else:
+                written[symbol] = result
+        return written
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Backfill historical prices for portfolio symbols")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--portfolio', default=os.path.join(root, 'portfolio.json'),
+                        help="Portfolio JSON file whose symbols are backfilled")
+    parser.add_argument('--db', default=os.path.join(root, 'portfolio_history.db'),
+                        help="History database file")
+    parser.add_argument('--start', required=True, help="First date to fetch (ISO format)")
+    parser.add_argument('--end', help="Last date to fetch (ISO format), defaults to now")
+    parser.add_argument('--period', default='daily', choices=list(HistoricalBackfillService.PERIODS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.portfolio, 'r') as f:
+        symbols = [symbol for symbol in json.load(f) if symbol != 'MUSD']
+
+    def parse_date(value: str) -> datetime:
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+    async def run():
+        service = HistoricalBackfillService(get_history_store(args.db), max_concurrency=args.concurrency)
+        try:
+            return await service.backfill(
+                symbols,
+                parse_date(args.start),
+                parse_date(args.end) if args.end else None,
+                period=args.period
+            )
+        finally:
+            await service.cmc_service.close()
+
+    for symbol, rows in asyncio.run(run()).items():
+        print(f"{symbol}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from .analysis_cache import get_analysis_cache
+from .fx_service import FxRates
+from .portfolio_registry import PortfolioRegistry
+
+REPORT_FORMATS = ('csv', 'json', 'parquet')
+
+
+class BatchValuationService:
+    """Headless valuation of many portfolios against one quote snapshot
+
+    Portfolios are loaded into a PortfolioRegistry, quotes are fetched once
+    for the union of their symbols, and the portfolios are then valued in
+    parallel. AI analysis is optional and bounded by the OpenAI service's
+    own concurrency limit.
+    """
+
+    def __init__(self, registry: Optional[PortfolioRegistry] = None, max_workers: Optional[int] = None):
+        """
+        Args:
+            registry: Registry holding the portfolios, created if not given
+            max_workers: Threads used for valuation (defaults to the CPU count, capped at 8)
+        """
+        self.registry = registry if registry is not None else PortfolioRegistry()
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    def load_manifest(self, manifest_file: str) -> List[str]:
+        """Load portfolios listed in a manifest file
+
+        The manifest is JSON: either a list of portfolio file paths or an
+        object mapping portfolio names to paths. Relative paths are resolved
+        against the manifest's directory.
+
+        Returns:
+            Names of the portfolios loaded
+        """
+        base_dir = os.path.dirname(os.path.abspath(manifest_file))
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+
+        entries = manifest.items() if isinstance(manifest, dict) else ((None, path) for path in manifest)
+        names = []
+        for name, path in entries:
+            path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+            try:
+                names.append(self.registry.load_file(path, name=name))
+            except Exception as e:
+                print(f"Error loading portfolio {path}: {e}")
+        return names
+
+    def value_all(self, market_data: Dict, fx_rates: FxRates) -> Dict[str, Dict]:
+        """Value every registered portfolio in parallel against one quote snapshot"""
+        names = list(self.registry.portfolios)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda name: self.registry.value_portfolio(name, market_data, fx_rates), names)
+            return dict(zip(names, results))
+
+    async def analyze_all(self, valuations: Dict[str, Dict], template_data: Dict,
+                          cache_file: Optional[str] = None) -> Dict[str, str]:
+        """Generate an AI analysis per portfolio, concurrently"""
+        from .openai_service import OpenAIService
+
+        service = OpenAIService()
+        cache = get_analysis_cache(cache_file) if cache_file else None
+        names = list(valuations)
+        analyses = await asyncio.gather(*(
+            service.agenerate_market_analysis(valuations[name], template_data, cache)
+            for name in names
+        ))
+        return dict(zip(names, analyses))
+
+    async def run(self, force_refresh: bool = False, template_data: Optional[Dict] = None,
+                  cache_file: Optional[str] = None) -> Dict:
+        """Fetch quotes once, value all portfolios and optionally analyze them
+
+        Args:
+            force_refresh: Bypass the quote cache
+            template_data: Analysis templates; analysis is skipped when not given
+            cache_file: Analysis cache file used when analysis is enabled
+
+        Returns:
+            Dict with the generation time, the valuations and the analyses per portfolio name
+        """
+        market_data, fx_rates = await self.registry.fetch_market_data(force_refresh=force_refresh)
+        valuations = self.value_all(market_data, fx_rates)
+        for metrics in valuations.values():
+            metrics['timestamp'] = datetime.now().isoformat()
+
+        analyses = {}
+        if template_data is not None:
+            analyses = await self.analyze_all(valuations, template_data, cache_file)
+
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'valuations': valuations,
+            'analyses': analyses
+        }
+
+    @staticmethod
+    def summary_frame(report: Dict) -> pd.DataFrame:
+        """One row per portfolio with its totals (and analysis when present)"""
+        rows = []
+        for name, metrics in report['valuations'].items():
+            row = {
+                'portfolio': name,
+                'total_value_brl': metrics['total_value_brl'],
+                **{
+                    f"total_value_{currency.lower()}": value
+                    for currency, value in metrics.get('total_value', {}).items()
+                    if currency != 'BRL'
+                },
+                'weighted_24h_change': metrics['weighted_24h_change'],
+                'weighted_7d_change': metrics['weighted_7d_change'],
+                'holdings_count': len(metrics['holdings_frame'])
+            }
+            if name in report['analyses']:
+                row['analysis'] = report['analyses'][name]
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    @staticmethod
+    def holdings_frame(report: Dict) -> pd.DataFrame:
+        """All holdings of all portfolios in one table, tagged with the portfolio name"""
+        frames = [
+            metrics['holdings_frame'].assign(portfolio=name)
+            for name, metrics in report['valuations'].items()
+        ]
+        if not frames:
+            return pd.DataFrame()
+        frame = pd.concat(frames, ignore_index=True)
+        return frame[['portfolio'] + [column for column in frame.columns if column != 'portfolio']]
+
+    @staticmethod
+    def check_formats(formats: List[str]) -> None:
+        """Validate report formats before any work is done
+
+        Raises:
+            ValueError: If a format is unknown
+            ImportError: If parquet is requested and pyarrow is not installed
+        """
+        unknown = [fmt for fmt in formats if fmt not in REPORT_FORMATS]
+        if unknown:
+            raise ValueError(f"Unsupported report formats {unknown}, use {list(REPORT_FORMATS)}")
+        if 'parquet' in formats and importlib.util.find_spec('pyarrow') is None:
+            raise ImportError("Parquet reports require pyarrow (pip install pyarrow)")
+
+    def write_reports(self, report: Dict, output_dir: str, formats: List[str]) -> List[str]:
+        """Write the summary and holdings tables in each requested format
+
+        Returns:
+            Paths of the files written
+        """
+        self.check_formats(formats)
+        os.makedirs(output_dir, exist_ok=True)
+        summary = self.summary_frame(report)
+        holdings = self.holdings_frame(report)
+        written = []
+
+        if 'csv' in formats:
+            for name, frame in (('summary', summary), ('holdings', holdings)):
+                path = os.path.join(output_dir, f"{name}.csv")
+                frame.to_csv(path, index=False)
+                written.append(path)
+
+        if 'parquet' in formats:
+            for name, frame in (('summary', summary), ('holdings', holdings)):
+                path = os.path.join(output_dir, f"{name}.parquet")
+                frame.to_parquet(path, index=False)
+                written.append(path)
+
+        if 'json' in formats:
+            path = os.path.join(output_dir, 'report.json')
+            payload = {
+                'generated_at': report['generated_at'],
+                'portfolios': {
+                    name: {
+                        'total_value_brl': metrics['total_value_brl'],
+                        'total_value': metrics.get('total_value', {}),
+                        'weighted_24h_change': metrics['weighted_24h_change'],
+                        'weighted_7d_change': metrics['weighted_7d_change'],
+                        'holdings': [holding.to_dict() for holding in metrics['holdings']],
+                        'analysis': report['analyses'].get(name)
+                    }
+                    for name, metrics in report['valuations'].items()
+                }
+            }
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+            written.append(path)
+
+        return written
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Value many portfolios against one quote snapshot")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--directory', help="Directory of portfolio JSON files")
+    source.add_argument('--manifest', help="JSON list of portfolio files, or object of name -> file")
+    parser.add_argument('--output', default='reports', help="Directory the reports are written to")
+    parser.add_argument('--format', action='append', choices=list(REPORT_FORMATS),
+                        help="Report format, may be repeated (default: csv and json)")
+    parser.add_argument('--analysis', action='store_true', help="Also generate an AI analysis per portfolio")
+    parser.add_argument('--templates', default=os.path.join(root, 'config', 'templates.json'),
+                        help="Analysis templates file")
+    parser.add_argument('--analysis-cache', default=os.path.join(root, 'analysis_cache.json'),
+                        help="Analysis cache file")
+    parser.add_argument('--workers', type=int, help="Valuation threads")
+    parser.add_argument('--force-refresh', action='store_true', help="Bypass the quote cache")
+    args = parser.parse_args()
+    formats = args.format or ['csv', 'json']
+    try:
+        BatchValuationService.check_formats(formats)
+    except ImportError as e:
+        parser.error(str(e))
+
+    service = BatchValuationService(max_workers=args.workers)
+    if args.manifest:
+        names = service.load_manifest(args.manifest)
+    else:
+        names = service.registry.load_directory(args.directory)
+    if not names:
+        parser.error("No portfolios loaded")
+
+    template_data = None
+    if args.analysis:
+        with open(args.templates, 'r', encoding='utf-8') as f:
+            template_data = json.load(f)
+
+    async def run():
+        try:
+            return await service.run(args.force_refresh, template_data, args.analysis_cache)
+        finally:
+            await service.registry.close()
+
+    report = asyncio.run(run())
+    for path in service.write_reports(report, args.output, formats):
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
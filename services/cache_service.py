@@ -0,0 +1,123 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .metrics_service import get_metrics
+
+
+class MarketDataCache:
+    """Thread-safe TTL cache with LRU eviction, shared across the whole process"""
+
+    def __init__(self, ttl: timedelta = timedelta(minutes=5), max_entries: int = 2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[datetime, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: Hashable, now: datetime, allow_stale: bool) -> Optional[Any]:
+        """Return the entry for key (caller must hold the lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if not allow_stale and now - stored_at >= self.ttl:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Optional[Any]:
+        """Get a single entry if present and not expired
+
+        Args:
+            key: Cache key
+            allow_stale: If True, return expired entries too (used as a fallback on API errors)
+        """
+        with self._lock:
+            value = self._lookup(key, datetime.now(), allow_stale)
+            if not allow_stale:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return value
+
+    def get_many(self, keys: Iterable[Hashable], allow_stale: bool = False) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """Get several entries at once
+
+        Returns:
+            Tuple of (found entries by key, list of missing or expired keys)
+        """
+        found: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        with self._lock:
+            now = datetime.now()
+            for key in keys:
+                value = self._lookup(key, now, allow_stale)
+                if value is None:
+                    missing.append(key)
+                else:
+                    found[key] = value
+            if not allow_stale:
+                self.hits += len(found)
+                self.misses += len(missing)
+        return found, missing
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a single entry"""
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[Hashable, Any]) -> None:
+        """Store several entries with the same timestamp, evicting the least recently used"""
+        with self._lock:
+            now = datetime.now()
+            for key, value in items.items():
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl.total_seconds(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / total) if total > 0 else 0.0
+            }
+
+
+_shared_cache: Optional[MarketDataCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> MarketDataCache:
+    """Return the process-wide market data cache, creating it on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                cache = MarketDataCache(
+                    ttl=timedelta(seconds=int(os.getenv('CMC_CACHE_TTL_SECONDS', '300'))),
+                    max_entries=int(os.getenv('CMC_CACHE_MAX_ENTRIES', '2048'))
+                )
+                get_metrics().register_collector(lambda: {
+                    f"market_cache_{name}": value
+                    for name, value in cache.stats().items()
+                })
+                _shared_cache = cache
+    return _shared_cache
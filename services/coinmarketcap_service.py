@@ -1,142 +1,421 @@
 import os
 import aiohttp
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+import random
+import threading
+from typing import Callable, Dict, Optional, Any, Tuple
+
+from .async_runtime import get_runtime
+from .cache_service import MarketDataCache, get_shared_cache
+from .fx_service import FxRates, FxService
+from .json_codec import get_json_codec
+from .listings_service import ListingsService, SymbolIdMap, get_symbol_id_map
+from .metrics_service import SIZE_BUCKETS, get_metrics
+from .rate_limit_service import estimate_credits, get_credit_scheduler
+from .records import MISSING_QUOTE, get_symbol_table
+
+
+class _FetchAbandoned(Exception):
+    """Set on a shared fetch whose owner was cancelled; waiters fetch the symbols themselves"""
+
 
 class CoinMarketCapService:
-    def __init__(self):
+    # Registry of in-flight quote fetches, shared by all instances so that
+    # concurrent callers asking for the same symbols await one request
+    _inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+    _inflight_lock = threading.Lock()
+
+    # Symbols per quotes/latest call, to keep request URLs within CMC limits
+    MAX_SYMBOLS_PER_REQUEST = int(os.getenv('CMC_MAX_SYMBOLS_PER_REQUEST', '100'))
+
+    # Retries for 429 and 5xx responses, with exponential backoff honouring Retry-After
+    MAX_RETRIES = int(os.getenv('CMC_MAX_RETRIES', '3'))
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 60.0
+
+    def __init__(self, cache: Optional[MarketDataCache] = None, id_map: Optional[SymbolIdMap] = None,
+                 listings: Optional[ListingsService] = None):
+        """
+        Args:
+            cache: Quote cache, the process-wide shared cache by default
+            id_map: Symbol -> CMC id mapping, the process-wide persistent map by default
+            listings: Local listings snapshot used to resolve new symbols without an API call
+        """
         api_key = os.getenv('CMC_API_KEY')
         if not api_key:
             raise ValueError("CMC_API_KEY environment variable is required")
         self.api_key = api_key
-        self.base_url = 'https://pro-api.coinmarketcap.com/v1'
+        # CMC_API_ROOT can point at a local stub server for testing
+        self.api_root = os.getenv('CMC_API_ROOT', 'https://pro-api.coinmarketcap.com').rstrip('/')
+        # Quotes are fetched once in this base currency; reporting currencies
+        # are derived locally from the FX rate table (see get_fx_rates)
+        self.convert = os.getenv('CMC_BASE_CURRENCY', 'USD').upper()
+        self._fx_service: Optional[FxService] = None
         self.session: Optional[aiohttp.ClientSession] = None
-        self._cache: Dict[str, Any] = {}
-        self._cache_time: Dict[str, datetime] = {}
-        self.CACHE_DURATION = timedelta(minutes=5)
+        self._owns_session = False
+        # Quotes are cached per symbol in a process-wide cache, so every
+        # CryptoPortfolio instance and Streamlit session shares the same entries
+        self.cache = cache if cache is not None else get_shared_cache()
+        # Quotes are requested by CMC id; symbols are resolved once and pinned
+        self.id_map = id_map if id_map is not None else get_symbol_id_map()
+        self.listings = listings
 
     async def _ensure_session(self):
-        """Ensure we have an active session"""
+        """Ensure we have an active session
+
+        On the shared runtime loop the pooled runtime session is used; on any
+        other loop (scripts calling asyncio.run) a private session is created.
+        """
+        runtime = get_runtime()
+        if runtime.owns_current_loop():
+            self.session = await runtime.get_session()
+            self._owns_session = False
+            return
         try:
             if self.session is None or self.session.closed:
                 timeout = aiohttp.ClientTimeout(total=10)
                 self.session = aiohttp.ClientSession(timeout=timeout)
+                self._owns_session = True
         except Exception:
             # If there's any issue with the session, create a new one
             timeout = aiohttp.ClientTimeout(total=10)
             self.session = aiohttp.ClientSession(timeout=timeout)
+            self._owns_session = True
+
+    def _cache_key(self, symbol: str) -> Tuple[str, str]:
+        """Cache key for a single quote: one entry per symbol and convert currency"""
+        return (symbol, self.convert)
+
+    def _get_cached_data(self, symbols: list, allow_stale: bool = False) -> Tuple[Dict, list]:
+        """Split symbols into cached quotes and symbols that still need to be fetched
+
+        Returns:
+            Tuple of (cached quotes by symbol, list of missing or expired symbols)
+        """
+        found, missing = self.cache.get_many(
+            [self._cache_key(symbol) for symbol in symbols],
+            allow_stale=allow_stale
+        )
+        cached = {key[0]: quote for key, quote in found.items()}
+        return cached, [key[0] for key in missing]
+
+    @staticmethod
+    def _merge_quotes(*sources: Dict) -> Dict:
+        """Merge quote dicts, dropping the MISSING_QUOTE entries that mark unknown symbols"""
+        result = {}
+        for source in sources:
+            for symbol, quote in source.items():
+                if quote:
+                    result[symbol] = quote
+        return result
+
+    async def resolve_ids(self, symbols: list) -> Dict[str, Optional[int]]:
+        """CMC id per symbol: pinned ids first, then the listings snapshot, then /v1/cryptocurrency/map
 
-    async def _get_cached_data(self, cache_key: str) -> Optional[Dict]:
-        """Get data from cache if available and not expired"""
-        current_time = datetime.now()
-        if cache_key in self._cache and cache_key in self._cache_time:
-            last_update = self._cache_time[cache_key]
-            if current_time - last_update < self.CACHE_DURATION:
-                return self._cache[cache_key]
-        return None
+        Newly resolved ids are pinned in the id map. Tickers shared by several
+        coins resolve to the best ranked one.
+
+        Returns:
+            Id per normalized symbol, None for symbols CMC does not know; symbols
+            left out could not be resolved (the map request failed)
+        """
+        symbols = list(dict.fromkeys(map(get_symbol_table().normalize, symbols)))
+        ids, missing = self.id_map.get_many(symbols)
+        if not missing:
+            return ids
+
+        resolved: Dict[str, int] = {}
+        index = self.listings.index if self.listings is not None else None
+        if index is not None:
+            for symbol in missing:
+                asset = index.resolve(symbol)
+                if asset is not None:
+                    resolved[symbol] = asset.id
+            missing = [symbol for symbol in missing if symbol not in resolved]
+
+        size = self.MAX_SYMBOLS_PER_REQUEST
+        for chunk in (missing[i:i + size] for i in range(0, len(missing), size)):
+            try:
+                body = await self._request('/v1/cryptocurrency/map', {'symbol': ','.join(chunk), 'aux': 'is_active'})
+            except Exception as e:
+                print(f"Error resolving CMC ids, querying by symbol: {e}")
+                continue
+            best: Dict[str, Tuple[float, int]] = {}
+            for coin in body['data']:
+                symbol = str(coin.get('symbol', '')).upper()
+                rank = coin.get('rank')
+                candidate = (rank if rank is not None else float('inf'), int(coin['id']))
+                if symbol in best:
+                    candidate = min(candidate, best[symbol])
+                best[symbol] = candidate
+            for symbol in chunk:
+                resolved[symbol] = best[symbol][1] if symbol in best else None
+
+        self.id_map.update({symbol: asset_id for symbol, asset_id in resolved.items() if asset_id is not None})
+        ids.update(resolved)
+        return ids
+
+    async def _fetch_quotes(self, symbols: list) -> Dict:
+        """Fetch quotes for symbols, split into chunks of at most MAX_SYMBOLS_PER_REQUEST
+
+        Symbols with a CMC id are queried by id, so only the exact assets held
+        come back; symbols CMC does not know are not requested at all, and
+        symbols whose id could not be resolved fall back to a symbol query.
+        Chunks are requested concurrently and merged into one result.
+        """
+        ids = await self.resolve_ids(symbols)
+        result = {symbol: MISSING_QUOTE for symbol in symbols if symbol in ids and ids[symbol] is None}
+        if result:
+            self.cache.set_many({self._cache_key(symbol): MISSING_QUOTE for symbol in result})
+        by_id = [symbol for symbol in symbols if ids.get(symbol) is not None]
+        by_symbol = [symbol for symbol in symbols if symbol not in ids]
+
+        size = self.MAX_SYMBOLS_PER_REQUEST
+        fetches = [self._fetch_quotes_chunk(by_id[i:i + size], ids) for i in range(0, len(by_id), size)]
+        fetches += [self._fetch_quotes_chunk(by_symbol[i:i + size]) for i in range(0, len(by_symbol), size)]
+        if len(fetches) == 1:
+            result.update(await fetches[0])
+            return result
+
+        for chunk_result in await asyncio.gather(*fetches):
+            result.update(chunk_result)
+        return result
+
+    def _backoff(self, attempt: int, response: aiohttp.ClientResponse) -> float:
+        """Seconds to wait before a retry: Retry-After if given, else full-jitter exponential backoff"""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * (2 ** attempt)))
+
+    async def _request(self, path: str, params: Dict,
+                       decode: Optional[Callable[[bytes], Tuple[Any, Optional[int]]]] = None) -> Any:
+        """GET a CMC endpoint and return the decoded JSON body
+
+        Every attempt is admitted by the process-wide credit scheduler first,
+        so requests are spread over the plan's rate and credit limits. 429
+        and 5xx responses are retried up to MAX_RETRIES times; a 429 also
+        pauses the scheduler for the Retry-After period.
+
+        Args:
+            path: Endpoint path including the version, e.g. /v1/cryptocurrency/quotes/latest
+            params: Query parameters
+            decode: Turns the raw body into (result, status.credit_count); defaults to
+                the JSON codec's decode_response, which returns the whole body
+
+        Raises:
+            ValueError: If the response has no data field
+            CreditBudgetExceeded: If the credit budget does not allow the request in time
+            RuntimeError: On rate limiting or any other non-200 status, once retries are exhausted
+        """
+        await self._ensure_session()
+        if self.session is None:
+            raise RuntimeError("Failed to create session")
+
+        headers = {
+            'X-CMC_PRO_API_KEY': self.api_key,
+            'Accept': 'application/json'
+        }
+
+        metrics = get_metrics()
+        scheduler = get_credit_scheduler()
+        codec = get_json_codec()
+        decode = decode or codec.decode_response
+        credits = estimate_credits(path, params)
+        for attempt in range(self.MAX_RETRIES + 1):
+            await scheduler.acquire(credits)
+            with metrics.timer('cmc_request_seconds', endpoint=path):
+                async with self.session.get(f"{self.api_root}{path}", headers=headers, params=params) as response:
+                    metrics.increment('cmc_requests_total', endpoint=path, status=response.status)
+                    if response.status == 200:
+                        # Raw bytes go straight to the codec, skipping aiohttp's str decode + json.loads
+                        body = await response.read()
+                        metrics.observe('cmc_response_bytes', len(body), buckets=SIZE_BUCKETS, endpoint=path)
+                        with metrics.timer('cmc_decode_seconds', endpoint=path, backend=codec.name):
+                            result, credit_count = decode(body)
+                        scheduler.reconcile(credits, credit_count)
+                        return result
+
+                    # Only successful calls are billed
+                    scheduler.reconcile(credits, 0)
+                    retryable = response.status == 429 or response.status >= 500
+                    if not retryable or attempt == self.MAX_RETRIES:
+                        if response.status == 429:
+                            raise RuntimeError("Rate limit exceeded. Please try again later.")
+                        error_msg = await response.text()
+                        raise RuntimeError(f"API Error: {response.status} - {error_msg}")
+
+                    delay = self._backoff(attempt, response)
+                    if response.status == 429:
+                        scheduler.pause(delay)
+            print(f"CoinMarketCap request {path} failed with {response.status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _fetch_quotes_chunk(self, symbols: list, ids: Optional[Dict[str, int]] = None) -> Dict:
+        """Fetch quotes for symbols in a single quotes/latest call and cache them
+
+        With ids the request is made by CMC id, otherwise by symbol. Symbols
+        skipped by the API are cached as MISSING_QUOTE so they are not
+        refetched on every request; their pinned ids are dropped so they are
+        resolved again next time.
+        """
+        path = '/v1/cryptocurrency/quotes/latest'
+        params = {'convert': self.convert, 'skip_invalid': 'true'}
+        result = dict.fromkeys(symbols, MISSING_QUOTE)
+        if ids is not None:
+            params['id'] = ','.join(str(ids[symbol]) for symbol in symbols)
+            quotes = await self._request(
+                path, params, decode=lambda body: get_json_codec().decode_quotes(body, self.convert, key='id')
+            )
+            for symbol in symbols:
+                quote = quotes.get(ids[symbol])
+                if quote is not None:
+                    result[symbol] = quote
+            self.id_map.discard([symbol for symbol in symbols if ids[symbol] not in quotes])
+        else:
+            params['symbol'] = ','.join(symbols)
+            quotes = await self._request(
+                path, params, decode=lambda body: get_json_codec().decode_quotes(body, self.convert)
+            )
+            for symbol in symbols:
+                quote = quotes.get(symbol)
+                if quote is not None:
+                    result[symbol] = quote
+
+        # Fresh data is always worth sharing, even on a forced refresh
+        self.cache.set_many({self._cache_key(symbol): quote for symbol, quote in result.items()})
+        return result
+
+    async def _fetch_coalesced(self, symbols: list) -> Dict:
+        """Fetch quotes, joining any in-flight request that already covers some of the symbols
+
+        Symbols already being fetched on this event loop are awaited on the
+        existing future; only the remaining ones open a new HTTP request. If
+        the task owning a shared fetch is cancelled, its waiters fetch the
+        symbols again instead of being cancelled with it.
+        """
+        loop = asyncio.get_running_loop()
+        waiting: Dict[asyncio.Future, list] = {}
+        to_fetch = []
+        own_future: Optional[asyncio.Future] = None
+
+        with self._inflight_lock:
+            for symbol in symbols:
+                future = self._inflight.get(self._cache_key(symbol))
+                if future is not None and not future.done() and future.get_loop() is loop:
+                    waiting.setdefault(future, []).append(symbol)
+                else:
+                    to_fetch.append(symbol)
+            if to_fetch:
+                own_future = loop.create_future()
+                for symbol in to_fetch:
+                    self._inflight[self._cache_key(symbol)] = own_future
+
+        result = {}
+        if own_future is not None:
+            try:
+                fetched = await self._fetch_quotes(to_fetch)
+                own_future.set_result(fetched)
+                result.update(fetched)
+            except asyncio.CancelledError:
+                own_future.set_exception(_FetchAbandoned())
+                own_future.exception()
+                raise
+            except Exception as e:
+                own_future.set_exception(e)
+                # Mark the exception as retrieved in case nobody else was waiting
+                own_future.exception()
+                raise
+            finally:
+                with self._inflight_lock:
+                    for symbol in to_fetch:
+                        key = self._cache_key(symbol)
+                        if self._inflight.get(key) is own_future:
+                            del self._inflight[key]
+
+        for future, future_symbols in waiting.items():
+            try:
+                # Shield so that cancelling this caller does not cancel the shared fetch
+                shared = await asyncio.shield(future)
+            except _FetchAbandoned:
+                result.update(await self._fetch_coalesced(future_symbols))
+                continue
+            result.update({symbol: shared.get(symbol, MISSING_QUOTE) for symbol in future_symbols})
+
+        return result
 
     async def get_market_data(self, symbols: list, force_refresh: bool = False) -> Dict:
         """
-        Fetch market data for given symbols including USD/BRL rate
+        Fetch market data for given symbols, priced in the base currency (self.convert)
+
+        Symbols with a fresh cached quote are served from the cache; only the
+        missing or expired ones are fetched, in one batched request that is
+        shared with any concurrent caller asking for the same symbols.
         
         Args:
             symbols: List of cryptocurrency symbols
             force_refresh: If True, bypass cache and fetch fresh data
             
         Returns:
-            Dict containing market data for requested symbols
+            Quote per requested symbol known to the API, keyed by the stripped
+            and upper-cased symbol; convert prices to a reporting currency with
+            the table from get_fx_rates
             
         Raises:
             Exception: If API request fails or data is invalid
         """
-        cache_key = f"market_data_{','.join(sorted(symbols))}"
-        
+        # One key per ticker for the id map, the cache and the in-flight registry
+        symbols = list(dict.fromkeys(map(get_symbol_table().normalize, symbols)))
+        if not symbols:
+            return {}
+
+        # Check cache first if not forcing refresh
+        if force_refresh:
+            cached, missing = {}, symbols
+        else:
+            cached, missing = self._get_cached_data(symbols)
+
         try:
-            # Check cache first if not forcing refresh
-            if not force_refresh:
-                cached_data = await self._get_cached_data(cache_key)
-                if cached_data is not None:
-                    return cached_data
-
-            await self._ensure_session()
-            if self.session is None:
-                raise RuntimeError("Failed to create session")
-            
-            # Always include USDT for USD/BRL rate if not present
-            if 'USDT' not in symbols:
-                symbols = symbols + ['USDT']
-            
-            symbols_str = ','.join(symbols)
-            url = f"{self.base_url}/cryptocurrency/quotes/latest"
-            
-            headers = {
-                'X-CMC_PRO_API_KEY': self.api_key,
-                'Accept': 'application/json'
-            }
-            
-            params = {
-                'symbol': symbols_str,
-                'convert': 'BRL',
-                'skip_invalid': 'true'
-            }
-            
-            async with self.session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if 'data' not in data:
-                        raise ValueError("Invalid API response format")
-                        
-                    result = {}
-                    for symbol in symbols:
-                        symbol_data = data['data'].get(symbol)
-                        if symbol_data:
-                            try:
-                                quote_data = symbol_data['quote']['BRL']
-                                result[symbol] = {
-                                    'price_brl': quote_data['price'],
-                                    'percent_change_24h': quote_data.get('percent_change_24h', 0),
-                                    'percent_change_7d': quote_data.get('percent_change_7d', 0)
-                                }
-                            except (KeyError, TypeError) as e:
-                                print(f"Error processing data for {symbol}: {e}")
-                                continue
-                    
-                    if not result:
-                        raise ValueError("No valid data returned from API")
-                        
-                    # Only cache if not forcing refresh
-                    if not force_refresh:
-                        self._cache[cache_key] = result
-                        self._cache_time[cache_key] = datetime.now()
-                    return result
-                    
-                elif response.status == 429:
-                    raise RuntimeError("Rate limit exceeded. Please try again later.")
-                else:
-                    error_msg = await response.text()
-                    raise RuntimeError(f"API Error: {response.status} - {error_msg}")
-                    
+            fetched = await self._fetch_coalesced(missing) if missing else {}
+
         except asyncio.TimeoutError:
             print("Timeout while fetching market data")
-            if not force_refresh:
-                cached_data = self._cache.get(cache_key)
-                if cached_data is not None:
-                    return cached_data
-            raise TimeoutError("Timeout fetching market data and no cache available")
-            
+            fetched = self._get_stale_data(missing, force_refresh)
+            if fetched is None:
+                raise TimeoutError("Timeout fetching market data and no cache available")
+
         except Exception as e:
             print(f"Error fetching market data: {e}")
-            if not force_refresh:
-                cached_data = self._cache.get(cache_key)
-                if cached_data is not None:
-                    return cached_data
-            raise
+            fetched = self._get_stale_data(missing, force_refresh)
+            if fetched is None:
+                raise
+
+        result = self._merge_quotes(cached, fetched)
+        if not result:
+            raise ValueError("No valid data returned from API")
+        return result
+
+    async def get_fx_rates(self, force_refresh: bool = False) -> FxRates:
+        """Exchange rates from the base currency to every reporting currency (cached process-wide)"""
+        if self._fx_service is None:
+            self._fx_service = FxService(self)
+        return await self._fx_service.get_rates(force_refresh=force_refresh)
+
+    def _get_stale_data(self, symbols: list, force_refresh: bool) -> Optional[Dict]:
+        """Fallback to expired cache entries when a fetch fails, if all symbols have one"""
+        if force_refresh:
+            return None
+        stale, missing = self._get_cached_data(symbols, allow_stale=True)
+        if missing:
+            return None
+        return stale
 
     async def close(self):
-        """Close the aiohttp session"""
-        if self.session and not self.session.closed:
+        """Close the aiohttp session, unless it is the shared runtime session"""
+        if self._owns_session and self.session and not self.session.closed:
             await self.session.close()
 
     async def cleanup(self):
@@ -145,7 +424,7 @@ class CoinMarketCapService:
 
     def __del__(self):
         """Cleanup on object destruction"""
-        if self.session and not self.session.closed:
+        if self._owns_session and self.session and not self.session.closed:
             try:
                 loop = asyncio.get_running_loop()
                 if not loop.is_closed():
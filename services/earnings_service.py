@@ -1,74 +1,309 @@
-from typing import Dict, List
+import math
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
 
+from .history_service import HistoryStore
+from .metrics_service import timed
+from .records import POSITION_FIELDS, SYMBOL_VALUE_FIELDS, structured_table
+
+# Quantities below this are treated as zero when reconciling holdings
+QUANTITY_EPSILON = 1e-12
+
+
+@dataclass(slots=True)
+class Trade:
+    """A single ledger entry; positive amounts are buys, negative amounts are sells"""
+    symbol: str
+    amount: float
+    value_brl: float  # total paid (buy) or received (sell), always positive
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    note: str = ''
+
+
+@dataclass(slots=True)
+class Position:
+    """Running state for one symbol, updated incrementally"""
+    quantity: float = 0.0
+    cost_basis: float = 0.0
+    realized_pnl: float = 0.0
+    price_brl: Optional[float] = None  # None until the first price tick
+    percent_change_24h: float = 0.0
+
+    @property
+    def market_value(self) -> float:
+        return self.quantity * self.price_brl if self.price_brl is not None else 0.0
+
+    @property
+    def unrealized_pnl(self) -> float:
+        return self.market_value - self.cost_basis if self.price_brl is not None else 0.0
+
+    @property
+    def daily_pnl(self) -> float:
+        return (self.percent_change_24h / 100) * self.market_value
+
+
+class EarningsLedger:
+    """Earnings engine that derives its trades from the snapshots in a HistoryStore
+
+    Keeps average cost basis, realized and unrealized PnL per symbol,
+    starting from the opening positions. sync() replays only the snapshots
+    recorded since the previous call: prices are applied per symbol, and a
+    holding amount that changed between snapshots is booked as a trade at
+    that snapshot's price. A refresh therefore costs O(changed symbols) no
+    matter how long the history is. The running totals are adjusted by
+    deltas and re-summed from the positions every RESUM_INTERVAL updates
+    (or one update per position, if there are more), so rounding errors
+    cannot accumulate.
+    """
+
+    RESUM_INTERVAL = 1000
+
+    def __init__(self, store: Optional[HistoryStore] = None, seed_trades: Iterable[Trade] = ()):
+        """
+        Args:
+            store: History the trades are derived from, or None for a ledger fed
+                only through apply_snapshot and apply_trade
+            seed_trades: Opening trades applied before the first snapshot
+        """
+        self.store = store
+        self.positions: Dict[str, Position] = {}
+        self.trade_count = 0
+        self.synced_ts: Optional[int] = None  # epoch seconds of the last snapshot replayed
+        self._lock = threading.RLock()
+        self._total_value = 0.0
+        self._total_daily = 0.0
+        self._total_accumulated = 0.0
+        self._updates = 0
+
+        for trade in seed_trades:
+            self.apply_trade(trade)
+        self.sync()
+
+    @timed('file_io_seconds', file='ledger', op='read')
+    def sync(self, holdings: Optional[Dict[str, float]] = None) -> int:
+        """Apply the snapshots recorded in the store since the last sync
+
+        Symbols missing from a snapshot are left as they are, since a quote
+        may simply have been unavailable; positions are only closed when
+        they are missing from holdings.
+
+        Args:
+            holdings: Authoritative amounts per symbol, as stored in the portfolio
+                file; open positions missing from it are closed at their last price
+
+        Returns:
+            Number of snapshots applied
+        """
+        if self.store is None:
+            return 0
+        with self._lock:
+            applied = 0
+            for ts, snapshot_holdings in self.store.iter_snapshots(after=self.synced_ts):
+                self._apply_holdings(snapshot_holdings, datetime.fromtimestamp(ts).isoformat())
+                self.synced_ts = ts
+                applied += 1
+            if holdings is not None:
+                self._close_missing(holdings)
+            if applied:
+                self._resum()
+            return applied
+
+    def _update(self, symbol: str, change) -> Position:
+        """Apply change to one position, keeping the running totals in sync"""
+        position = self.positions.setdefault(symbol, Position())
+        before = (position.market_value, position.daily_pnl, position.realized_pnl + position.unrealized_pnl)
+        change(position)
+        self._total_value += position.market_value - before[0]
+        self._total_daily += position.daily_pnl - before[1]
+        self._total_accumulated += position.realized_pnl + position.unrealized_pnl - before[2]
+        self._updates += 1
+        # Spaced by the position count too, so re-summing stays O(1) per update
+        if self._updates >= max(self.RESUM_INTERVAL, len(self.positions)):
+            self._resum()
+        return position
+
+    def _resum(self) -> None:
+        """Recompute the running totals from the positions"""
+        positions = self.positions.values()
+        self._total_value = math.fsum(position.market_value for position in positions)
+        self._total_daily = math.fsum(position.daily_pnl for position in positions)
+        self._total_accumulated = math.fsum(
+            position.realized_pnl + position.unrealized_pnl for position in positions
+        )
+        self._updates = 0
+
+    def _apply_trade(self, trade: Trade) -> None:
+        def change(position: Position):
+            if trade.amount >= 0:
+                position.quantity += trade.amount
+                position.cost_basis += trade.value_brl
+            else:
+                sold = min(-trade.amount, position.quantity)
+                cost_removed = position.cost_basis * (sold / position.quantity) if position.quantity > 0 else 0.0
+                position.realized_pnl += trade.value_brl - cost_removed
+                position.quantity -= sold
+                position.cost_basis -= cost_removed
+                if position.quantity <= QUANTITY_EPSILON:
+                    position.quantity = 0.0
+                    position.cost_basis = 0.0
+
+        with self._lock:
+            self._update(trade.symbol, change)
+            self.trade_count += 1
+
+    def apply_trade(self, trade: Trade) -> None:
+        """Record a trade and update only the affected position"""
+        self._apply_trade(trade)
+
+    def apply_price(self, symbol: str, price_brl: float, percent_change_24h: float = 0.0) -> None:
+        """Apply a price tick to one symbol"""
+        def change(position: Position):
+            position.price_brl = price_brl
+            position.percent_change_24h = percent_change_24h
+
+        with self._lock:
+            position = self.positions.get(symbol)
+            if position is not None and position.price_brl == price_brl \
+                    and position.percent_change_24h == percent_change_24h:
+                return
+            self._update(symbol, change)
+
+    def apply_snapshot(self, portfolio_data: Dict, holdings: Optional[Dict[str, float]] = None) -> None:
+        """Bring the ledger in line with a portfolio snapshot
+
+        Prices are applied per holding (unchanged ones are skipped). When a
+        holding amount differs from the ledger quantity, for example after a
+        manual edit or a rebalance, the difference is booked as a trade at
+        the current price.
+
+        Args:
+            portfolio_data: Result of get_portfolio_data
+            holdings: Authoritative amounts per symbol; open positions missing from it
+                are closed at their last known price
+        """
+        with self._lock:
+            self._apply_holdings(portfolio_data.get('holdings', []))
+
+            if holdings is not None:
+                self._close_missing(holdings)
+
+    def _close_missing(self, holdings: Dict[str, float]) -> None:
+        for symbol, position in list(self.positions.items()):
+            if symbol not in holdings and position.quantity > 0 and position.price_brl is not None:
+                self._reconcile(symbol, 0.0, position.price_brl)
+
+    def _apply_holdings(self, holdings: Iterable, timestamp: Optional[str] = None) -> None:
+        for holding in holdings:
+            self.apply_price(holding.symbol, holding.price_brl, holding.percent_change_24h)
+            self._reconcile(holding.symbol, holding.amount, holding.price_brl, timestamp)
+
+    def _reconcile(self, symbol: str, amount: float, price_brl: float, timestamp: Optional[str] = None) -> None:
+        difference = amount - self.positions[symbol].quantity
+        if abs(difference) > QUANTITY_EPSILON:
+            trade = Trade(
+                symbol=symbol,
+                amount=difference,
+                value_brl=abs(difference) * price_brl,
+                note='holdings adjustment'
+            )
+            if timestamp is not None:
+                trade.timestamp = timestamp
+            self.apply_trade(trade)
+
+    def summary(self) -> Dict:
+        """Return earnings in the format used by calculate_earnings
+
+        The per-symbol tables are NumPy structured arrays (see records), so a
+        summary of many positions allocates a few columns rather than one
+        dict per position; rows still support row['symbol'] access.
+        """
+        with self._lock:
+            reported = [
+                (symbol, position) for symbol, position in self.positions.items()
+                if position.quantity > 0 or position.realized_pnl != 0
+            ]
+            symbols = [symbol for symbol, _ in reported]
+            realized = [position.realized_pnl for _, position in reported]
+            unrealized = [position.unrealized_pnl for _, position in reported]
+            return {
+                'total_balance': self._total_value,
+                'daily_earnings': structured_table(
+                    SYMBOL_VALUE_FIELDS, symbol=symbols, value=[position.daily_pnl for _, position in reported]
+                ),
+                'accumulated_earnings': structured_table(
+                    SYMBOL_VALUE_FIELDS, symbol=symbols, value=[r + u for r, u in zip(realized, unrealized)]
+                ),
+                'positions': structured_table(
+                    POSITION_FIELDS,
+                    symbol=symbols,
+                    quantity=[position.quantity for _, position in reported],
+                    cost_basis=[position.cost_basis for _, position in reported],
+                    realized_pnl=realized,
+                    unrealized_pnl=unrealized
+                ),
+                'total_daily': self._total_daily,
+                'total_accumulated': self._total_accumulated
+            }
+
+
+_ledgers: Dict[str, EarningsLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
 class EarningsService:
+    # Opening positions (based on transaction history), used to seed a new ledger
+    INITIAL_VALUES = {
+        'LTC': {
+            'amount': 0.03922,  # Total amount from transactions
+            'value': 10.00 * 4  # Aproximadamente R$10 por transação
+        },
+        'BTC': {
+            'amount': 0.00004615,
+            'value': 10.00
+        },
+        'LINK': {
+            'amount': 0.20557,
+            'value': 10.00 * 2
+        },
+        'ETH': {
+            'amount': 0.00124575,
+            'value': 10.00 * 3
+        },
+        'UNI': {
+            'amount': 0.31159,
+            'value': 10.00 * 4
+        }
+    }
+
+    @staticmethod
+    def initial_trades() -> List[Trade]:
+        """Opening trades built from INITIAL_VALUES"""
+        return [
+            Trade(symbol=symbol, amount=entry['amount'], value_brl=entry['value'], note='opening position')
+            for symbol, entry in EarningsService.INITIAL_VALUES.items()
+        ]
+
+    @staticmethod
+    def get_ledger(store: HistoryStore) -> EarningsLedger:
+        """Return the process-wide ledger for a history store, replaying it on first use"""
+        key = os.path.abspath(store.db_path)
+        with _ledgers_lock:
+            if key not in _ledgers:
+                _ledgers[key] = EarningsLedger(store, EarningsService.initial_trades())
+            return _ledgers[key]
+
     @staticmethod
     def calculate_earnings(portfolio_data: Dict) -> Dict:
-        """Calculate daily and accumulated earnings"""
-        # Initial investment values (based on transaction history)
-        initial_values = {
-            'LTC': {
-                'amount': 0.03922,  # Total amount from transactions
-                'value': 10.00 * 4  # Aproximadamente R$10 por transação
-            },
-            'BTC': {
-                'amount': 0.00004615,
-                'value': 10.00
-            },
-            'LINK': {
-                'amount': 0.20557,
-                'value': 10.00 * 2
-            },
-            'ETH': {
-                'amount': 0.00124575,
-                'value': 10.00 * 3
-            },
-            'UNI': {
-                'amount': 0.31159,
-                'value': 10.00 * 4
-            }
-        }
-        
-        # Initialize result
-        result = {
-            'total_balance': portfolio_data['total_value_brl'],
-            'daily_earnings': [],
-            'accumulated_earnings': [],
-            'total_daily': 0,
-            'total_accumulated': 0
-        }
-        
-        # Calculate earnings for each holding
-        for holding in portfolio_data['holdings']:
-            symbol = holding['symbol']
-            current_value = holding['value_brl']
-            price_change_24h = holding['percent_change_24h']
-            
-            # Calculate daily earnings based on 24h price change
-            daily_value = (price_change_24h / 100) * current_value
-            
-            # Calculate accumulated earnings
-            if symbol in initial_values:
-                initial_value = initial_values[symbol]['value']
-                acc_value = current_value - initial_value
-            elif symbol == 'MUSD':  # Manter os valores fixos para MUSD
-                acc_value = 0.55
-                daily_value = -0.37
-            else:
-                # Para qualquer outro símbolo não listado
-                acc_value = daily_value
-            
-            result['daily_earnings'].append({
-                'symbol': symbol,
-                'value': daily_value
-            })
-            
-            result['accumulated_earnings'].append({
-                'symbol': symbol,
-                'value': acc_value
-            })
-            
-            result['total_daily'] += daily_value
-            result['total_accumulated'] += acc_value
-        
-        return result
+        """Calculate daily and accumulated earnings of a single snapshot
+
+        Builds a ledger seeded with the opening positions for this snapshot
+        alone, for portfolios without a history (e.g. valued in a batch).
+        Portfolios with a HistoryStore read the ledger from get_ledger, which
+        is synced when snapshots are recorded.
+        """
+        ledger = EarningsLedger(seed_trades=EarningsService.initial_trades())
+        ledger.apply_snapshot(portfolio_data)
+        return ledger.summary()
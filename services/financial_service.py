@@ -1,72 +1,125 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 from decimal import Decimal
 
+import numpy as np
+import pandas as pd
+
+from .fx_service import VALUATION_CURRENCY, FxRates
+from .metrics_service import timed
+from .records import Holding, get_symbol_table
+
 class FinancialService:
+    # Column order of the holdings table handed to the UI
+    HOLDING_COLUMNS = [
+        'symbol', 'amount', 'price_brl', 'value_brl',
+        'percent_change_24h', 'percent_change_7d', 'volume_24h', 'market_cap'
+    ]
+
     @staticmethod
-    def calculate_holdings_value(holdings: Dict[str, float], market_data: Dict) -> List[Dict]:
-        """Calculate value and metrics for each holding"""
-        holdings_summary = []
-        
-        for symbol, amount in holdings.items():
-            if symbol == 'MUSD':  # Special handling for MUSD stablecoin
-                usd_brl_rate = market_data.get('USDT', {}).get('price_brl', 5.0)
-                holding = {
-                    'symbol': symbol,
-                    'amount': amount,
-                    'price_brl': usd_brl_rate,
-                    'value_brl': amount * usd_brl_rate,
-                    'percent_change_24h': 0,
-                    'percent_change_7d': 0,
-                    'volume_24h': 0,
-                    'market_cap': 0
-                }
-            elif symbol in market_data:
-                crypto_data = market_data[symbol]
-                price_brl = crypto_data['price_brl']
-                holding = {
-                    'symbol': symbol,
-                    'amount': amount,
-                    'price_brl': price_brl,
-                    'value_brl': amount * price_brl,
-                    'percent_change_24h': crypto_data['percent_change_24h'],
-                    'percent_change_7d': crypto_data['percent_change_7d'],
-                    'volume_24h': 0,  # These metrics are not critical for now
-                    'market_cap': 0
-                }
-            else:
-                print(f"Warning: No market data available for {symbol}")
-                continue
-                
-            holdings_summary.append(holding)
-            
-        return holdings_summary
+    @timed('valuation_seconds', stage='holdings_frame')
+    def calculate_holdings_frame(holdings: Dict[str, float], market_data: Dict, fx_rates: FxRates) -> pd.DataFrame:
+        """Build the holdings table with prices and values in one vectorized pass
+
+        Args:
+            holdings: Amount held per symbol
+            market_data: Quote per symbol in the base currency, as returned by CoinMarketCapService
+            fx_rates: Exchange rates used to convert the quotes to the valuation currency (BRL)
+
+        Returns:
+            DataFrame with one row per holding that has market data
+        """
+        table = get_symbol_table()
+        symbols = list(map(table.intern, holdings.keys()))
+        count = len(symbols)
+        amounts = np.fromiter(holdings.values(), dtype=float, count=count)
+
+        quotes = [market_data.get(symbol) for symbol in symbols]
+        prices = np.fromiter((q.price if q else np.nan for q in quotes), dtype=float, count=count)
+        prices = fx_rates.convert(prices, VALUATION_CURRENCY)
+        change_24h = np.fromiter((q.percent_change_24h if q else 0.0 for q in quotes), dtype=float, count=count)
+        change_7d = np.fromiter((q.percent_change_7d if q else 0.0 for q in quotes), dtype=float, count=count)
+
+        # Special handling for MUSD stablecoin: priced at the USD/BRL rate, no changes
+        is_musd = table.codes(symbols) == table.code('MUSD')
+        if is_musd.any():
+            prices[is_musd] = fx_rates.rate(VALUATION_CURRENCY, from_currency='USD')
+            change_24h[is_musd] = 0.0
+            change_7d[is_musd] = 0.0
+
+        valid = ~np.isnan(prices)
+        for symbol in np.asarray(symbols, dtype=object)[~valid]:
+            print(f"Warning: No market data available for {symbol}")
+
+        frame = pd.DataFrame({
+            'symbol': np.asarray(symbols, dtype=object)[valid],
+            'amount': amounts[valid],
+            'price_brl': prices[valid],
+            'value_brl': amounts[valid] * prices[valid],
+            'percent_change_24h': change_24h[valid],
+            'percent_change_7d': change_7d[valid],
+            'volume_24h': 0.0,  # These metrics are not critical for now
+            'market_cap': 0.0
+        }, columns=FinancialService.HOLDING_COLUMNS)
+        return frame
 
     @staticmethod
-    def calculate_portfolio_metrics(holdings_summary: List[Dict]) -> Dict:
-        """Calculate overall portfolio metrics"""
-        total_value = sum(h['value_brl'] for h in holdings_summary)
-        
-        # Calculate portfolio composition percentages
-        for holding in holdings_summary:
-            holding['portfolio_percentage'] = (holding['value_brl'] / total_value * 100) if total_value > 0 else 0
-            
-        # Calculate weighted average changes
+    @timed('valuation_seconds', stage='frame_metrics')
+    def calculate_frame_metrics(frame: pd.DataFrame, fx_rates: Optional[FxRates] = None) -> Dict:
+        """Calculate weights and weighted changes over a holdings table
+
+        Adds a portfolio_percentage column to the frame in place.
+
+        Args:
+            frame: Holdings table from calculate_holdings_frame
+            fx_rates: When given, the total is also reported in every reporting currency
+
+        Returns:
+            Dict with totals, the holdings as Holding records and the frame itself
+        """
+        values = frame['value_brl'].to_numpy(dtype=float)
+        total_value = float(values.sum())
+
         if total_value > 0:
-            weighted_24h_change = sum(
-                h['percent_change_24h'] * (h['value_brl'] / total_value) 
-                for h in holdings_summary
-            )
-            weighted_7d_change = sum(
-                h['percent_change_7d'] * (h['value_brl'] / total_value) 
-                for h in holdings_summary
-            )
+            weights = values / total_value
+            weighted_24h_change = float(weights @ frame['percent_change_24h'].to_numpy(dtype=float))
+            weighted_7d_change = float(weights @ frame['percent_change_7d'].to_numpy(dtype=float))
         else:
+            weights = np.zeros_like(values)
             weighted_24h_change = 0
             weighted_7d_change = 0
-            
-        return {
+
+        frame['portfolio_percentage'] = weights * 100
+
+        metrics = {
             'total_value_brl': total_value,
             'weighted_24h_change': weighted_24h_change,
             'weighted_7d_change': weighted_7d_change,
-            'holdings': holdings_summary
+            'holdings': Holding.from_frame(frame),
+            'holdings_frame': frame
         }
+        if fx_rates is not None:
+            metrics['total_value'] = fx_rates.totals(total_value, VALUATION_CURRENCY)
+            metrics['fx_rates'] = fx_rates
+        return metrics
+
+    @staticmethod
+    def calculate_holdings_value(holdings: Dict[str, float], market_data: Dict, fx_rates: FxRates) -> List[Holding]:
+        """Calculate value and metrics for each holding"""
+        return Holding.from_frame(FinancialService.calculate_holdings_frame(holdings, market_data, fx_rates))
+
+    @staticmethod
+    def calculate_portfolio_metrics(holdings_summary: List[Holding]) -> Dict:
+        """Calculate overall portfolio metrics"""
+        frame = pd.DataFrame(
+            {column: [getattr(holding, column) for holding in holdings_summary]
+             for column in FinancialService.HOLDING_COLUMNS},
+            columns=FinancialService.HOLDING_COLUMNS
+        )
+        metrics = FinancialService.calculate_frame_metrics(frame)
+
+        # Keep the original behaviour of annotating the given holdings in place
+        for holding, percentage in zip(holdings_summary, frame['portfolio_percentage'].tolist()):
+            holding.portfolio_percentage = percentage
+        metrics['holdings'] = holdings_summary
+        del metrics['holdings_frame']
+        return metrics
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .coinmarketcap_service import CoinMarketCapService
+
+# Currency the holdings table is valued in (the *_brl columns)
+VALUATION_CURRENCY = 'BRL'
+
+# Currencies every portfolio valuation is reported in
+REPORTING_CURRENCIES = tuple(
+    currency.strip().upper()
+    for currency in os.getenv('REPORTING_CURRENCIES', 'BRL,USD,EUR').split(',')
+    if currency.strip()
+)
+
+
+@dataclass(frozen=True)
+class FxRates:
+    """Fiat exchange rates relative to the quote base currency
+
+    rates[currency] is the amount of currency worth one unit of base, so a
+    base-currency price converts with a single multiplication.
+    """
+    base: str
+    rates: Dict[str, float]
+    fetched_at: float = field(default_factory=time.time)
+
+    def rate(self, currency: str, from_currency: Optional[str] = None) -> float:
+        """Units of currency per unit of from_currency (the base currency by default)
+
+        Raises:
+            KeyError: If either currency is not in the table
+        """
+        rate = 1.0 if currency == self.base else self.rates[currency]
+        if from_currency is None or from_currency == self.base:
+            return rate
+        return rate / self.rate(from_currency)
+
+    def convert(self, values, currency: str, from_currency: Optional[str] = None):
+        """Convert a number, numpy array or pandas Series/frame column from one currency to another"""
+        if isinstance(values, (list, tuple)):
+            values = np.asarray(values, dtype=float)
+        return values * self.rate(currency, from_currency)
+
+    def totals(self, value: float, from_currency: str,
+               currencies: Tuple[str, ...] = REPORTING_CURRENCIES) -> Dict[str, float]:
+        """value expressed in every reporting currency the table covers"""
+        return {
+            currency: float(value * self.rate(currency, from_currency))
+            for currency in currencies
+            if currency == self.base or currency in self.rates
+        }
+
+
+class FxService:
+    """Fiat rate table built from CMC's fiat map and price-conversion tool
+
+    Quotes are fetched once in the base currency; every reporting currency
+    is derived locally from this table, so adding one costs no quote calls.
+    The fiat id map is fetched once per process and the rates are cached
+    for CMC_FX_TTL_SECONDS (fiat rates move far less than crypto prices).
+    One price-conversion call covers all currencies, billed 1 credit per
+    currency beyond the first.
+    """
+
+    _fiat_ids: Optional[Dict[str, int]] = None
+    _tables: Dict[Tuple[str, Tuple[str, ...]], FxRates] = {}
+    _lock = threading.Lock()
+
+    TTL_SECONDS = float(os.getenv('CMC_FX_TTL_SECONDS', '3600'))
+
+    def __init__(self, cmc_service: 'CoinMarketCapService', currencies: Tuple[str, ...] = REPORTING_CURRENCIES):
+        """
+        Args:
+            cmc_service: Client used for the fiat map and price-conversion requests
+            currencies: Currencies the table must cover besides the base currency
+                (the valuation currency and USD, used for USD stablecoins, are always added)
+        """
+        self.cmc_service = cmc_service
+        self.base = cmc_service.convert
+        self.currencies = tuple(sorted((set(currencies) | {VALUATION_CURRENCY, 'USD'}) - {self.base}))
+
+    async def _get_fiat_ids(self) -> Dict[str, int]:
+        """Fiat symbol -> CMC id, from /v1/fiat/map (fetched once per process)"""
+        if FxService._fiat_ids is None:
+            data = await self.cmc_service._request('/v1/fiat/map', {'limit': 5000})
+            FxService._fiat_ids = {item['symbol']: int(item['id']) for item in data['data']}
+        return FxService._fiat_ids
+
+    async def _fetch_rates(self) -> FxRates:
+        fiat_ids = await self._get_fiat_ids()
+        unknown = [currency for currency in (self.base,) + self.currencies if currency not in fiat_ids]
+        if unknown:
+            raise ValueError(f"Unsupported fiat currencies {unknown}")
+
+        rates = {}
+        if self.currencies:
+            symbol_by_id = {str(fiat_ids[currency]): currency for currency in self.currencies}
+            data = await self.cmc_service._request('/v2/tools/price-conversion', {
+                'amount': 1,
+                'id': fiat_ids[self.base],
+                'convert_id': ','.join(symbol_by_id)
+            })
+            # The quote is keyed by the convert ids (symbols on older API versions)
+            for key, quote in data['data']['quote'].items():
+                currency = symbol_by_id.get(str(key), key)
+                if currency in self.currencies:
+                    rates[currency] = float(quote['price'])
+            missing = [currency for currency in self.currencies if currency not in rates]
+            if missing:
+                raise ValueError(f"No exchange rate returned for {missing}")
+        return FxRates(base=self.base, rates=rates)
+
+    async def get_rates(self, force_refresh: bool = False) -> FxRates:
+        """Current rate table, from the process-wide cache while it is fresh
+
+        A failed refresh falls back to the expired table when there is one.
+
+        Raises:
+            Exception: If the rates cannot be fetched and nothing is cached
+        """
+        key = (self.base, self.currencies)
+        with self._lock:
+            cached = self._tables.get(key)
+        if cached is not None and not force_refresh and time.time() - cached.fetched_at < self.TTL_SECONDS:
+            return cached
+
+        try:
+            table = await self._fetch_rates()
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"Error fetching exchange rates, using rates from {time.ctime(cached.fetched_at)}: {e}")
+            return cached
+
+        with self._lock:
+            self._tables[key] = table
+        return table
@@ -0,0 +1,413 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from .metrics_service import timed
+from .records import Holding, get_symbol_table
+
+Timestamp = Union[datetime, int, float, None]
+
+
+class HistoryStore:
+    """Append-only SQLite time-series store for portfolio snapshots
+
+    Every snapshot is stored as one row per holding plus one row with the
+    portfolio totals, indexed by (symbol, ts). Historical OHLCV backfilled
+    from CoinMarketCap lives in its own table keyed by (symbol, period, ts).
+    Range queries stream rows from a cursor and downsampling is done by
+    SQLite, so months of history can be read without loading everything into
+    memory.
+    """
+
+    INTERVALS = {
+        '1m': 60,
+        '1h': 3600,
+        '1d': 86400
+    }
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS holdings_history (
+                    symbol TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    amount REAL NOT NULL,
+                    price_brl REAL NOT NULL,
+                    value_brl REAL NOT NULL,
+                    percent_change_24h REAL,
+                    percent_change_7d REAL,
+                    PRIMARY KEY (symbol, ts)
+                ) WITHOUT ROWID
+            """)
+            # Lets iter_snapshots read only the snapshots after a given time
+            self._conn.execute('CREATE INDEX IF NOT EXISTS holdings_history_ts ON holdings_history (ts)')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS portfolio_history (
+                    ts INTEGER PRIMARY KEY,
+                    total_value_brl REAL NOT NULL,
+                    weighted_24h_change REAL,
+                    weighted_7d_change REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ohlcv_history (
+                    symbol TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL NOT NULL,
+                    volume REAL,
+                    market_cap REAL,
+                    PRIMARY KEY (symbol, period, ts)
+                ) WITHOUT ROWID
+            """)
+
+    @staticmethod
+    def _to_epoch(value: Timestamp) -> Optional[int]:
+        """Convert datetimes or ISO strings to epoch seconds"""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if isinstance(value, datetime):
+            return int(value.timestamp())
+        return int(value)
+
+    def is_empty(self) -> bool:
+        """True if no snapshot has been recorded yet"""
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM portfolio_history LIMIT 1').fetchone()
+        return row is None
+
+    @timed('file_io_seconds', file='history', op='write')
+    def append_snapshot(self, portfolio_data: Dict) -> None:
+        """Record a get_portfolio_data result
+
+        Args:
+            portfolio_data: Dict with total_value_brl, weighted changes, holdings and timestamp
+        """
+        ts = self._to_epoch(portfolio_data.get('timestamp') or datetime.now())
+        rows = [
+            (
+                h.symbol, ts, h.amount, h.price_brl, h.value_brl,
+                h.percent_change_24h, h.percent_change_7d
+            )
+            for h in portfolio_data.get('holdings', [])
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO holdings_history VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO portfolio_history VALUES (?, ?, ?, ?)',
+                (
+                    ts,
+                    portfolio_data.get('total_value_brl', 0),
+                    portfolio_data.get('weighted_24h_change', 0),
+                    portfolio_data.get('weighted_7d_change', 0)
+                )
+            )
+
+    def iter_symbol(self, symbol: str, start: Timestamp = None, end: Timestamp = None,
+                    batch_size: int = 1000) -> Iterator[Dict]:
+        """Stream raw rows for one symbol in a time window, oldest first
+
+        Uses its own read connection so that a slow consumer never blocks writers.
+        """
+        start_ts = self._to_epoch(start)
+        end_ts = self._to_epoch(end)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(
+                """
+                SELECT ts, amount, price_brl, value_brl, percent_change_24h, percent_change_7d
+                FROM holdings_history
+                WHERE symbol = ? AND ts >= ? AND ts <= ?
+                ORDER BY ts
+                """,
+                (symbol, start_ts if start_ts is not None else 0,
+                 end_ts if end_ts is not None else 2 ** 62)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {
+                        'timestamp': datetime.fromtimestamp(row[0]),
+                        'amount': row[1],
+                        'price_brl': row[2],
+                        'value_brl': row[3],
+                        'percent_change_24h': row[4],
+                        'percent_change_7d': row[5]
+                    }
+        finally:
+            conn.close()
+
+    def iter_snapshots(self, after: Timestamp = None, batch_size: int = 1000) -> Iterator[Tuple[int, List[Holding]]]:
+        """Stream recorded snapshots newer than after, oldest first
+
+        Yields:
+            (epoch seconds, holdings of that snapshot)
+        """
+        after_ts = self._to_epoch(after)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(
+                """
+                SELECT ts, symbol, amount, price_brl, value_brl, percent_change_24h, percent_change_7d
+                FROM holdings_history
+                WHERE ts > ?
+                ORDER BY ts, symbol
+                """,
+                (after_ts if after_ts is not None else -1,)
+            )
+            intern = get_symbol_table().intern
+            ts, holdings = None, []
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if row[0] != ts:
+                        if holdings:
+                            yield ts, holdings
+                        ts, holdings = row[0], []
+                    holdings.append(Holding(intern(row[1]), row[2], row[3], row[4], row[5] or 0.0, row[6] or 0.0))
+            if holdings:
+                yield ts, holdings
+        finally:
+            conn.close()
+
+    def downsample(self, symbol: Optional[str], interval: str = '1h',
+                   start: Timestamp = None, end: Timestamp = None) -> List[Dict]:
+        """Aggregate history into fixed buckets
+
+        Args:
+            symbol: Symbol to aggregate, or None for the portfolio totals
+            interval: Bucket size, one of '1m', '1h' or '1d'
+            start: Start of the window (inclusive)
+            end: End of the window (inclusive)
+
+        Returns:
+            One dict per bucket with open/high/low/close values and the sample count
+
+        Raises:
+            ValueError: If the interval is not supported
+        """
+        if interval not in self.INTERVALS:
+            raise ValueError(f"Unsupported interval {interval}, use one of {list(self.INTERVALS)}")
+        seconds = self.INTERVALS[interval]
+        start_ts = self._to_epoch(start)
+        end_ts = self._to_epoch(end)
+        bounds = (start_ts if start_ts is not None else 0, end_ts if end_ts is not None else 2 ** 62)
+
+        if symbol is None:
+            value_column, table, where, params = 'total_value_brl', 'portfolio_history', '', ()
+        else:
+            value_column, table, where, params = 'value_brl', 'holdings_history', 'symbol = ? AND', (symbol,)
+
+        # Window functions pick the first/last sample of each bucket
+        query = f"""
+            SELECT bucket, MIN(value), MAX(value), COUNT(*),
+                   MAX(CASE WHEN rn_first = 1 THEN value END),
+                   MAX(CASE WHEN rn_last = 1 THEN value END)
+            FROM (
+                SELECT ts / {seconds} * {seconds} AS bucket, {value_column} AS value,
+                       ROW_NUMBER() OVER (PARTITION BY ts / {seconds} ORDER BY ts) AS rn_first,
+                       ROW_NUMBER() OVER (PARTITION BY ts / {seconds} ORDER BY ts DESC) AS rn_last
+                FROM {table}
+                WHERE {where} ts >= ? AND ts <= ?
+            )
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        with self._lock:
+            rows = self._conn.execute(query, params + bounds).fetchall()
+        return [
+            {
+                'timestamp': datetime.fromtimestamp(row[0]),
+                'low': row[1],
+                'high': row[2],
+                'samples': row[3],
+                'open': row[4],
+                'close': row[5]
+            }
+            for row in rows
+        ]
+
+    def latest(self, symbol: str) -> Optional[Dict]:
+        """Return the most recent row for a symbol"""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT ts, amount, price_brl, value_brl
+                FROM holdings_history WHERE symbol = ?
+                ORDER BY ts DESC LIMIT 1
+                """,
+                (symbol,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'timestamp': datetime.fromtimestamp(row[0]),
+            'amount': row[1],
+            'price_brl': row[2],
+            'value_brl': row[3]
+        }
+
+    def append_ohlcv(self, symbol: str, period: str, rows: List[Dict]) -> int:
+        """Insert historical OHLCV rows, replacing any existing row for the same period start
+
+        Args:
+            symbol: Cryptocurrency symbol
+            period: Period name the rows were sampled at (e.g. 'daily', 'hourly', '5m')
+            rows: Dicts with ts (epoch seconds of the period start), open, high, low, close,
+                volume and market_cap
+
+        Returns:
+            Number of rows written
+        """
+        values = [
+            (
+                symbol, period, int(row['ts']), row.get('open'), row.get('high'), row.get('low'),
+                row['close'], row.get('volume'), row.get('market_cap')
+            )
+            for row in rows
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO ohlcv_history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                values
+            )
+        return len(values)
+
+    def iter_ohlcv(self, symbol: str, period: str = 'daily', start: Timestamp = None,
+                   end: Timestamp = None, batch_size: int = 1000) -> Iterator[Dict]:
+        """Stream stored OHLCV rows for one symbol, oldest first"""
+        start_ts = self._to_epoch(start)
+        end_ts = self._to_epoch(end)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(
+                """
+                SELECT ts, open, high, low, close, volume, market_cap
+                FROM ohlcv_history
+                WHERE symbol = ? AND period = ? AND ts >= ? AND ts <= ?
+                ORDER BY ts
+                """,
+                (symbol, period, start_ts if start_ts is not None else 0,
+                 end_ts if end_ts is not None else 2 ** 62)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {
+                        'timestamp': datetime.fromtimestamp(row[0]),
+                        'open': row[1],
+                        'high': row[2],
+                        'low': row[3],
+                        'close': row[4],
+                        'volume': row[5],
+                        'market_cap': row[6]
+                    }
+        finally:
+            conn.close()
+
+    def holdings_value_history(self, amounts: Dict[str, float], period: str = 'daily',
+                               start: Timestamp = None, end: Timestamp = None) -> List[Dict]:
+        """Value of fixed holdings at the backfilled closing prices, one point per period
+
+        Only periods with a close for every symbol that has backfilled rows
+        in the window are returned, so a symbol whose history starts later
+        does not show up as a drop in value. Symbols never backfilled are
+        left out.
+
+        Args:
+            amounts: Amount held per symbol
+            period: Backfilled period to read (e.g. 'daily')
+            start: Start of the window (inclusive)
+            end: End of the window (inclusive)
+
+        Returns:
+            Dicts with timestamp and value (in the currency the history was backfilled in)
+        """
+        if not amounts:
+            return []
+        start_ts = self._to_epoch(start)
+        end_ts = self._to_epoch(end)
+        held = ', '.join('(?, ?)' for _ in amounts)
+        query = f"""
+            WITH held(symbol, amount) AS (VALUES {held})
+            SELECT o.ts, SUM(o.close * held.amount), COUNT(*),
+                   (SELECT COUNT(DISTINCT symbol) FROM ohlcv_history
+                    WHERE period = ? AND ts >= ? AND ts <= ? AND symbol IN (SELECT symbol FROM held))
+            FROM ohlcv_history AS o JOIN held ON o.symbol = held.symbol
+            WHERE o.period = ? AND o.ts >= ? AND o.ts <= ?
+            GROUP BY o.ts
+            ORDER BY o.ts
+        """
+        bounds = (start_ts if start_ts is not None else 0, end_ts if end_ts is not None else 2 ** 62)
+        params = [value for item in amounts.items() for value in item]
+        params += [period, *bounds, period, *bounds]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {'timestamp': datetime.fromtimestamp(row[0]), 'value': row[1]}
+            for row in rows
+            if row[2] == row[3]
+        ]
+
+    def import_daily_values(self, daily_values: Dict) -> None:
+        """Import the legacy daily_values.json format (one value per symbol for a single day)"""
+        values = daily_values.get('values') or {}
+        if not daily_values.get('last_update') or not values:
+            return
+        holdings = []
+        ts = None
+        for symbol, entry in values.items():
+            ts = f"{daily_values['last_update']}T{entry.get('last_update', '00:00:00')}"
+            holdings.append(Holding(
+                symbol=symbol,
+                amount=entry['amount'],
+                price_brl=entry['price_brl'],
+                value_brl=entry['total_brl']
+            ))
+        self.append_snapshot({
+            'timestamp': ts,
+            'total_value_brl': sum(h.value_brl for h in holdings),
+            'holdings': holdings
+        })
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+_stores: Dict[str, HistoryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(db_path: str) -> HistoryStore:
+    """Return the process-wide store for a database file"""
+    db_path = os.path.abspath(db_path)
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = HistoryStore(db_path)
+        return _stores[db_path]
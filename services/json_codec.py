@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .records import Quote, get_symbol_table
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional: no typed decoding, the generic backends walk the dicts
+    msgspec = None
+
+# Backends in order of preference for CMC_JSON_BACKEND=auto
+BACKENDS = ('msgspec', 'orjson', 'json')
+
+
+def _float(value) -> float:
+    return float(value or 0.0)
+
+
+def quotes_from_data(data, convert: str, key: str = 'symbol') -> Dict:
+    """Quote per symbol (or per CMC id) from the data field of a quotes/latest or listings/latest response
+
+    quotes/latest keys the coins by the symbols or ids queried, listings
+    returns them as a rank-ordered list, where the first coin of a ticker
+    wins; coins without a price in convert are skipped.
+
+    Args:
+        key: 'symbol' for symbol keys (interned), 'id' for integer CMC ids
+    """
+    by_id = key == 'id'
+    intern = get_symbol_table().intern
+    if isinstance(data, dict):
+        coins = data.items()
+    else:
+        coins = ((coin.get(key), coin) for coin in data)
+    quotes = {}
+    for name, coin in coins:
+        if not coin or not name:
+            continue
+        name = int(name) if by_id else intern(name)
+        if name in quotes:
+            continue
+        try:
+            values = coin['quote'][convert]
+            quotes[name] = Quote(
+                float(values['price']),
+                _float(values.get('percent_change_24h')),
+                _float(values.get('percent_change_7d'))
+            )
+        except (KeyError, TypeError) as e:
+            print(f"Error processing data for {name}: {e}")
+    return quotes
+
+
+class JsonCodec:
+    """Decoder for CMC response bodies, backed by the stdlib json module
+
+    Subclasses swap in a faster parser; decode_quotes is the hot path for
+    quote and listings responses, the other endpoints go through
+    decode_response and get the whole body.
+    """
+
+    name = 'json'
+
+    def loads(self, payload: bytes) -> Any:
+        return json.loads(payload)
+
+    def decode_response(self, payload: bytes) -> Tuple[Dict, Optional[int]]:
+        """The decoded body and its status.credit_count
+
+        Raises:
+            ValueError: If the body is not JSON or has no data field
+        """
+        body = self.loads(payload)
+        if not isinstance(body, dict) or 'data' not in body:
+            raise ValueError("Invalid API response format")
+        return body, (body.get('status') or {}).get('credit_count')
+
+    def decode_quotes(self, payload: bytes, convert: str, key: str = 'symbol') -> Tuple[Dict, Optional[int]]:
+        """Quotes and status.credit_count of a quotes/latest or listings/latest body
+
+        Args:
+            payload: Raw response body
+            convert: Currency the quotes were requested in
+            key: 'symbol' to key the quotes by ticker, 'id' to key them by CMC id
+
+        Raises:
+            ValueError: If the body is not JSON or has no data field
+        """
+        body, credit_count = self.decode_response(payload)
+        return quotes_from_data(body['data'], convert, key), credit_count
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson parser, same generic walk as the stdlib backend"""
+
+    name = 'orjson'
+
+    def loads(self, payload: bytes) -> Any:
+        return orjson.loads(payload)
+
+
+if msgspec is not None:
+    # Typed schemas for decode_quotes: only these fields are materialized,
+    # every other key of the payload is skipped by the parser
+    class _QuoteValues(msgspec.Struct, gc=False):
+        price: Optional[float] = None
+        percent_change_24h: Optional[float] = None
+        percent_change_7d: Optional[float] = None
+
+    class _Coin(msgspec.Struct, gc=False):
+        id: Optional[int] = None
+        symbol: Optional[str] = None
+        quote: Dict[str, Optional[_QuoteValues]] = msgspec.field(default_factory=dict)
+
+    class _Status(msgspec.Struct, gc=False):
+        credit_count: Optional[int] = None
+
+    class _QuotesResponse(msgspec.Struct, gc=False):
+        data: Union[Dict[str, Optional[_Coin]], List[_Coin]]
+        status: Optional[_Status] = None
+
+
+class MsgspecCodec(JsonCodec):
+    """msgspec parser with typed decoding of quote and listings bodies"""
+
+    name = 'msgspec'
+
+    def __init__(self):
+        self._decoder = msgspec.json.Decoder()
+        self._quotes_decoder = msgspec.json.Decoder(_QuotesResponse)
+
+    def loads(self, payload: bytes) -> Any:
+        try:
+            return self._decoder.decode(payload)
+        except msgspec.DecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}") from e
+
+    def decode_quotes(self, payload: bytes, convert: str, key: str = 'symbol') -> Tuple[Dict, Optional[int]]:
+        try:
+            response = self._quotes_decoder.decode(payload)
+        except msgspec.DecodeError as e:
+            raise ValueError(f"Invalid API response format: {e}") from e
+
+        by_id = key == 'id'
+        intern = get_symbol_table().intern
+        data = response.data
+        if isinstance(data, dict):
+            coins = data.items()
+        else:
+            coins = (((coin.id if by_id else coin.symbol), coin) for coin in data)
+        quotes = {}
+        for name, coin in coins:
+            values = coin.quote.get(convert) if coin is not None else None
+            if not name or values is None or values.price is None:
+                continue
+            name = int(name) if by_id else intern(name)
+            if name not in quotes:
+                quotes[name] = Quote(
+                    values.price, _float(values.percent_change_24h), _float(values.percent_change_7d)
+                )
+        credit_count = response.status.credit_count if response.status is not None else None
+        return quotes, credit_count
+
+
+_CODECS = {'msgspec': MsgspecCodec, 'orjson': OrjsonCodec, 'json': JsonCodec}
+
+
+def available_backends() -> List[str]:
+    """Installed backends, fastest first"""
+    installed = {'msgspec': msgspec is not None, 'orjson': orjson is not None, 'json': True}
+    return [name for name in BACKENDS if installed[name]]
+
+
+def make_codec(backend: str = 'auto') -> JsonCodec:
+    """Codec for a backend name, or the fastest installed one for 'auto'
+
+    A backend that is not installed falls back to the fastest available one.
+
+    Raises:
+        ValueError: If backend is not a known name
+    """
+    backend = backend.lower()
+    if backend != 'auto' and backend not in _CODECS:
+        raise ValueError(f"Unknown JSON backend {backend}, use 'auto' or one of {', '.join(BACKENDS)}")
+    available = available_backends()
+    if backend != 'auto' and backend not in available:
+        print(f"JSON backend {backend} is not installed, using {available[0]}")
+        backend = 'auto'
+    return _CODECS[available[0] if backend == 'auto' else backend]()
+
+
+_codec: Optional[JsonCodec] = None
+_codec_lock = threading.Lock()
+
+
+def get_json_codec() -> JsonCodec:
+    """Return the process-wide codec selected by CMC_JSON_BACKEND (default auto)"""
+    global _codec
+    if _codec is None:
+        with _codec_lock:
+            if _codec is None:
+                _codec = make_codec(os.getenv('CMC_JSON_BACKEND', 'auto'))
+    return _codec
@@ -0,0 +1,416 @@
+import concurrent.futures
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from heapq import nsmallest
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from .async_runtime import get_runtime
+from .metrics_service import get_metrics, timed
+from .rate_limit_service import BACKGROUND, priority
+from .records import Asset, get_symbol_table
+
+if TYPE_CHECKING:
+    from .coinmarketcap_service import CoinMarketCapService
+
+# Column order of the asset rows in the snapshot file
+_ROW_FIELDS = ('id', 'symbol', 'name', 'slug', 'rank', 'price', 'market_cap')
+
+
+def _rank_key(asset: Asset) -> Tuple[float, int]:
+    return (asset.rank if asset.rank is not None else math.inf, asset.id)
+
+
+class ListingsIndex:
+    """Read-only index over one listings snapshot
+
+    Assets are looked up by CMC id, slug or ticker symbol with plain dict
+    lookups. Tickers are not unique on CMC: every symbol maps to all assets
+    sharing it, best CMC rank first, and resolve() picks that one. search()
+    does prefix matching on symbols, slugs and names over one sorted key
+    list, for autocomplete.
+    """
+
+    def __init__(self, assets: Iterable[Asset], fetched_at: float):
+        self.fetched_at = fetched_at
+        self.assets: List[Asset] = sorted(assets, key=_rank_key)
+        self._by_id: Dict[int, Asset] = {asset.id: asset for asset in self.assets}
+        self._by_slug: Dict[str, Asset] = {asset.slug: asset for asset in self.assets}
+        by_symbol: Dict[str, List[Asset]] = {}
+        for asset in self.assets:
+            by_symbol.setdefault(asset.symbol, []).append(asset)
+        # assets is rank-ordered, so every ticker's list already is too
+        self._by_symbol: Dict[str, Tuple[Asset, ...]] = {
+            symbol: tuple(matches) for symbol, matches in by_symbol.items()
+        }
+        # Search keys: lowercase symbol, slug and name of every asset, sorted,
+        # with the asset position of each key alongside
+        keys = [asset.symbol.lower() for asset in self.assets]
+        keys += [asset.slug for asset in self.assets]
+        keys += [asset.name.lower() for asset in self.assets]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        count = len(self.assets)
+        self._keys = [keys[i] for i in order]
+        self._positions = [i % count for i in order]
+        self._short_searches: Dict[Tuple[str, int], List[Asset]] = {}
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self._by_symbol
+
+    def candidates(self, symbol: str) -> Tuple[Asset, ...]:
+        """Every asset trading under symbol, best rank first"""
+        return self._by_symbol.get(symbol.upper(), ())
+
+    def resolve(self, symbol: str) -> Optional[Asset]:
+        """The asset a bare ticker most likely means: the best ranked one sharing it"""
+        matches = self._by_symbol.get(symbol.upper())
+        return matches[0] if matches else None
+
+    def by_id(self, asset_id: int) -> Optional[Asset]:
+        return self._by_id.get(int(asset_id))
+
+    def by_slug(self, slug: str) -> Optional[Asset]:
+        return self._by_slug.get(slug.lower())
+
+    def lookup(self, query: str) -> Optional[Asset]:
+        """Asset for a CMC id, ticker symbol or slug, in that order"""
+        query = query.strip()
+        if query.isdigit():
+            return self.by_id(int(query))
+        return self.resolve(query) or self.by_slug(query)
+
+    def search(self, prefix: str, limit: int = 10) -> List[Asset]:
+        """Assets whose symbol, slug or name starts with prefix, best rank first"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return self.assets[:limit]
+        key = (prefix, limit)
+        cached = self._short_searches.get(key)
+        if cached is not None:
+            return cached
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + '\uffff', start)
+        # Positions follow rank order, so the smallest are the best ranked
+        result = [self.assets[position] for position in nsmallest(limit, set(self._positions[start:end]))]
+        # One- and two-letter prefixes match thousands of keys and are what
+        # autocomplete asks for first, so their results are kept
+        if len(prefix) <= 2:
+            self._short_searches[key] = result
+        return result
+
+    def to_json(self) -> Dict:
+        return {
+            'fetched_at': self.fetched_at,
+            'fields': list(_ROW_FIELDS),
+            'assets': [[getattr(asset, field) for field in _ROW_FIELDS] for asset in self.assets]
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'ListingsIndex':
+        intern = get_symbol_table().intern
+        fields = data['fields']
+        if tuple(fields) == _ROW_FIELDS:
+            assets = [Asset(row[0], intern(row[1]), *row[2:]) for row in data['assets']]
+        else:  # written by a version with other columns
+            assets = [
+                Asset(**{field: value for field, value in zip(fields, row) if field in _ROW_FIELDS})
+                for row in data['assets']
+            ]
+        return cls(assets, fetched_at=float(data['fetched_at']))
+
+
+class ListingsService:
+    """Local snapshot of CMC's coin map and top listings, refreshed in the background
+
+    The snapshot combines /v1/cryptocurrency/map (every active coin's id,
+    symbol, name, slug and rank) with /v1/cryptocurrency/listings/latest
+    (price and market cap of the top CMC_LISTINGS_LIMIT coins). It is saved
+    to a JSON file, so symbol validation and lookup work from the first
+    page render without an API call; once it is older than
+    CMC_LISTINGS_TTL_SECONDS, get_index() starts a background-priority
+    refresh and keeps serving the old index until the new one is ready.
+    A full refresh costs one credit per 5000 mapped coins plus one per 200
+    listed coins.
+    """
+
+    TTL_SECONDS = float(os.getenv('CMC_LISTINGS_TTL_SECONDS', '86400'))
+    LISTINGS_LIMIT = int(os.getenv('CMC_LISTINGS_LIMIT', '1000'))
+    MAP_PAGE_SIZE = 5000
+    # Wait before retrying after a failed background refresh
+    RETRY_SECONDS = 900.0
+
+    def __init__(self, snapshot_file: Optional[str], cmc_service: Optional['CoinMarketCapService'] = None):
+        """
+        Args:
+            snapshot_file: JSON file the snapshot is persisted to, or None for memory only
+            cmc_service: Client for the refresh requests, created on first refresh if not given
+        """
+        self.snapshot_file = snapshot_file
+        self._cmc_service = cmc_service
+        self._lock = threading.Lock()
+        self._index: Optional[ListingsIndex] = None
+        self._loaded = False
+        self._pending: Optional[concurrent.futures.Future] = None
+        self._last_attempt = 0.0
+        self.last_error: Optional[Exception] = None
+
+    @timed('file_io_seconds', file='listings', op='read')
+    def _load(self) -> Optional[ListingsIndex]:
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return None
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                return ListingsIndex.from_json(json.load(f))
+        except Exception as e:
+            print(f"Error loading listings snapshot: {e}")
+            return None
+
+    @timed('file_io_seconds', file='listings', op='write')
+    def _save(self, index: ListingsIndex) -> None:
+        """Persist the snapshot with an atomic rename"""
+        if not self.snapshot_file:
+            return
+        try:
+            tmp_file = f"{self.snapshot_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(index.to_json(), f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, self.snapshot_file)
+        except Exception as e:
+            print(f"Error saving listings snapshot: {e}")
+
+    @property
+    def index(self) -> Optional[ListingsIndex]:
+        """Current index without triggering a refresh (loaded from disk on first access)"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._index = self._load()
+                    self._loaded = True
+        return self._index
+
+    def is_stale(self) -> bool:
+        index = self.index
+        return index is None or time.time() - index.fetched_at >= self.TTL_SECONDS
+
+    @property
+    def cmc_service(self) -> 'CoinMarketCapService':
+        if self._cmc_service is None:
+            from .coinmarketcap_service import CoinMarketCapService
+            self._cmc_service = CoinMarketCapService()
+        return self._cmc_service
+
+    async def _fetch_map(self) -> List[Dict]:
+        """Every active coin from /v1/cryptocurrency/map, one page per MAP_PAGE_SIZE coins"""
+        coins = []
+        start = 1
+        while True:
+            body = await self.cmc_service._request('/v1/cryptocurrency/map', {
+                'listing_status': 'active',
+                'start': start,
+                'limit': self.MAP_PAGE_SIZE,
+                'aux': 'is_active'
+            })
+            page = body['data']
+            coins.extend(page)
+            if len(page) < self.MAP_PAGE_SIZE:
+                return coins
+            start += self.MAP_PAGE_SIZE
+
+    async def _fetch_listings(self) -> Dict[int, Tuple[Optional[float], Optional[float]]]:
+        """(price, market cap) per CMC id for the top LISTINGS_LIMIT coins"""
+        if self.LISTINGS_LIMIT <= 0:
+            return {}
+        convert = self.cmc_service.convert
+        body = await self.cmc_service._request('/v1/cryptocurrency/listings/latest', {
+            'start': 1,
+            'limit': self.LISTINGS_LIMIT,
+            'convert': convert,
+            'aux': 'cmc_rank'
+        })
+        market = {}
+        for coin in body['data']:
+            quote = (coin.get('quote') or {}).get(convert) or {}
+            market[int(coin['id'])] = (quote.get('price'), quote.get('market_cap'))
+        return market
+
+    async def refresh(self) -> ListingsIndex:
+        """Fetch a new snapshot, persist it and make it the current index
+
+        Raises:
+            Exception: If the map request fails; a failed listings request only
+                leaves prices and market caps empty
+        """
+        coins = await self._fetch_map()
+        try:
+            market = await self._fetch_listings()
+        except Exception as e:
+            print(f"Error fetching listings, keeping the coin map only: {e}")
+            market = {}
+
+        intern = get_symbol_table().intern
+        assets = []
+        for coin in coins:
+            asset_id = int(coin['id'])
+            price, market_cap = market.get(asset_id, (None, None))
+            assets.append(Asset(
+                id=asset_id,
+                symbol=intern(str(coin['symbol']).upper()),
+                name=str(coin.get('name') or coin['symbol']),
+                slug=str(coin.get('slug') or '').lower(),
+                rank=coin.get('rank'),
+                price=price,
+                market_cap=market_cap
+            ))
+        index = ListingsIndex(assets, fetched_at=time.time())
+        self._save(index)
+        with self._lock:
+            self._index = index
+            self._loaded = True
+            self.last_error = None
+        get_metrics().increment('listings_refresh_total')
+        return index
+
+    async def _refresh_in_background(self) -> Optional[ListingsIndex]:
+        # Listings are never urgent, so they only spend the background budget
+        with priority(BACKGROUND):
+            try:
+                return await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing listings snapshot: {e}")
+                self.last_error = e
+                return None
+
+    def refresh_in_background(self) -> concurrent.futures.Future:
+        """Start a refresh on the shared runtime loop, or join the one already running"""
+        with self._lock:
+            if self._pending is None or self._pending.done():
+                self._last_attempt = time.monotonic()
+                self._pending = get_runtime().submit(self._refresh_in_background())
+            return self._pending
+
+    def get_index(self) -> Optional[ListingsIndex]:
+        """Current index, starting a background refresh when it is missing or expired
+
+        Returns None only until the first snapshot has been fetched. After a
+        failed refresh the next attempt waits RETRY_SECONDS.
+        """
+        index = self.index
+        if self.is_stale() and (self.last_error is None or time.monotonic() - self._last_attempt >= self.RETRY_SECONDS):
+            self.refresh_in_background()
+        return index
+
+
+_services: Dict[str, ListingsService] = {}
+_services_lock = threading.Lock()
+
+
+def get_listings_service(snapshot_file: str) -> ListingsService:
+    """Return the process-wide listings service for a snapshot file"""
+    snapshot_file = os.path.abspath(snapshot_file)
+    with _services_lock:
+        if snapshot_file not in _services:
+            service = _services[snapshot_file] = ListingsService(snapshot_file)
+            get_metrics().register_collector(lambda: {
+                'listings_assets': len(service._index) if service._index is not None else 0,
+                'listings_age_seconds': time.time() - service._index.fetched_at if service._index is not None else 0
+            })
+        return _services[snapshot_file]
+
+
+class SymbolIdMap:
+    """Persistent ticker symbol -> CMC id mapping for the symbols we hold
+
+    Once a symbol is resolved its id is pinned, so quotes keep referring to
+    the same asset even if another coin with the same ticker later outranks
+    it. The mapping is saved to a JSON file with an atomic rename after
+    every change.
+    """
+
+    def __init__(self, path: Optional[str]):
+        """
+        Args:
+            path: JSON file the mapping is persisted to, or None for memory only
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @timed('file_io_seconds', file='cmc_ids', op='read')
+    def _load(self) -> Dict[str, int]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                intern = get_symbol_table().intern
+                return {intern(symbol): int(asset_id) for symbol, asset_id in json.load(f).items()}
+        except Exception as e:
+            print(f"Error loading CMC id map: {e}")
+            return {}
+
+    @timed('file_io_seconds', file='cmc_ids', op='write')
+    def _save(self) -> None:
+        """Persist the mapping with an atomic rename (caller must hold the lock)"""
+        if not self.path:
+            return
+        try:
+            tmp_file = f"{self.path}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._ids, f, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.path)
+        except Exception as e:
+            print(f"Error saving CMC id map: {e}")
+
+    def get(self, symbol: str) -> Optional[int]:
+        return self._ids.get(symbol)
+
+    def get_many(self, symbols: Iterable[str]) -> Tuple[Dict[str, int], List[str]]:
+        """Split symbols into known ids and symbols that still need resolving"""
+        known, missing = {}, []
+        for symbol in symbols:
+            asset_id = self._ids.get(symbol)
+            if asset_id is None:
+                missing.append(symbol)
+            else:
+                known[symbol] = asset_id
+        return known, missing
+
+    def update(self, ids: Dict[str, int]) -> None:
+        """Pin ids for symbols, saving the file if anything changed"""
+        with self._lock:
+            changed = {symbol: asset_id for symbol, asset_id in ids.items() if self._ids.get(symbol) != asset_id}
+            if changed:
+                self._ids.update(changed)
+                self._save()
+
+    def discard(self, symbols: Iterable[str]) -> None:
+        """Forget the ids of symbols, e.g. when CMC no longer returns data for them"""
+        with self._lock:
+            removed = [symbol for symbol in symbols if self._ids.pop(symbol, None) is not None]
+            if removed:
+                self._save()
+
+
+# Default location of the id map: next to the app's other data files
+DEFAULT_ID_MAP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cmc_ids.json')
+
+_id_map: Optional[SymbolIdMap] = None
+_id_map_lock = threading.Lock()
+
+
+def get_symbol_id_map() -> SymbolIdMap:
+    """Return the process-wide id map, persisted to CMC_ID_MAP_FILE (empty for memory only)"""
+    global _id_map
+    if _id_map is None:
+        with _id_map_lock:
+            if _id_map is None:
+                _id_map = SymbolIdMap(os.getenv('CMC_ID_MAP_FILE', DEFAULT_ID_MAP_FILE) or None)
+    return _id_map
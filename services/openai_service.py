@@ -1,34 +1,265 @@
+import asyncio
 import os
+import queue
+import random
+import threading
 import httpx
-from openai import OpenAI
-from typing import Dict, Optional, NoReturn
+import openai
+from openai import AsyncOpenAI
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 from httpx import Proxy
 
+from .analysis_cache import AnalysisCache
+from .async_runtime import get_runtime
+from .metrics_service import get_metrics
+from .rebalancing_service import CRYPTO_SLEEVE, STABLE_SLEEVE, RebalancingService
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+_client: Optional[AsyncOpenAI] = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the process-wide async OpenAI client
+
+    The client wraps one pooled httpx.AsyncClient, so every OpenAIService
+    shares keep-alive connections instead of opening its own. It is used
+    on the AsyncRuntime loop only. Retries are handled by OpenAIService.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY environment variable is required")
+
+            proxy_str = os.getenv('PROXIES')
+            # Certificate checks can only be turned off explicitly, e.g. behind an intercepting proxy
+            verify = os.getenv('OPENAI_VERIFY_SSL', '1') != '0'
+            if not verify:
+                print("OPENAI_VERIFY_SSL=0: TLS certificates of the OpenAI API are not verified")
+            transport = httpx.AsyncHTTPTransport(
+                proxy=Proxy(url=proxy_str) if proxy_str else None,
+                verify=verify,
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '10')),
+                    max_keepalive_connections=5,
+                    keepalive_expiry=60.0
+                )
+            )
+            timeout = float(os.getenv('OPENAI_TIMEOUT_SECONDS', '60'))
+            http_client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(timeout, connect=10.0)
+            )
+            _client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=http_client,
+                max_retries=0
+            )
+        return _client
+
+
 class OpenAIService:
-    def __init__(self):
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.api_key = api_key
+    # Completion parameters shared by the blocking and streaming paths
+    COMPLETION_PARAMS = {
+        'model': "gpt-4o-mini",
+        'temperature': 0.13,
+        'max_tokens': 1500,
+        'presence_penalty': 0.3,
+        'frequency_penalty': 0.3
+    }
+
+    # Completions in flight across all services in the process
+    MAX_CONCURRENT_COMPLETIONS = int(os.getenv('OPENAI_MAX_CONCURRENCY', '4'))
+    MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 20.0
+    _semaphore: Optional[asyncio.Semaphore] = None
+
+    def __init__(self, rebalancer: Optional[RebalancingService] = None):
+        self.client = get_openai_client()
+        self.rebalancer = rebalancer if rebalancer is not None else RebalancingService.from_env()
+
+    @classmethod
+    def _get_semaphore(cls) -> asyncio.Semaphore:
+        # Created lazily so it belongs to the runtime loop
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(cls.MAX_CONCURRENT_COMPLETIONS)
+        return cls._semaphore
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before a retry: Retry-After if given, else full-jitter exponential backoff"""
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * (2 ** attempt)))
+
+    async def _open_completion(self, messages: List[Dict], **kwargs):
+        """Request a completion, retrying transient errors; the caller holds the semaphore"""
+        metrics = get_metrics()
+        mode = 'stream' if kwargs.get('stream') else 'blocking'
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                with metrics.timer('openai_request_seconds', mode=mode):
+                    response = await self.client.chat.completions.create(
+                        messages=messages,
+                        **self.COMPLETION_PARAMS,
+                        **kwargs
+                    )
+                metrics.increment('openai_requests_total', mode=mode, result='ok')
+                return response
+            except RETRYABLE_ERRORS as e:
+                metrics.increment('openai_requests_total', mode=mode, result='retryable_error')
+                if attempt == self.MAX_RETRIES:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"OpenAI request failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _create_completion(self, messages: List[Dict], **kwargs):
+        """Request a completion under the concurrency limit, retrying transient errors"""
+        async with self._get_semaphore():
+            return await self._open_completion(messages, **kwargs)
+
+    async def _stream_completion(self, messages: List[Dict], **kwargs) -> AsyncIterator:
+        """Stream completion chunks under the concurrency limit
+
+        The semaphore is held until the stream is exhausted or the consumer
+        stops iterating, and the request is only retried until the stream
+        has been opened.
+        """
+        async with self._get_semaphore():
+            stream = await self._open_completion(messages, stream=True, **kwargs)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.response.aclose()
+
+    def _build_messages(self, portfolio_data: Dict, template_data: Dict) -> List[Dict]:
+        """Build the chat messages (system + user prompt) for a portfolio snapshot"""
+        # Allocation and rebalancing figures come from the shared rebalancing engine
+        total_value = portfolio_data['total_value_brl']
+        holdings = portfolio_data['holdings']
+        plan = self.rebalancer.plan(portfolio_data)
+        crypto_sleeve = plan.sleeves[CRYPTO_SLEEVE]
+        stable_sleeve = plan.sleeves[STABLE_SLEEVE]
+        crypto_target = crypto_sleeve['target_pct']
+        stable_target = stable_sleeve['target_pct']
+        tolerance = self.rebalancer.tolerance
+        
+        # Separate stablecoins and crypto
+        stable_symbols = self.rebalancer.stable_symbols
+        stablecoins = [h for h in holdings if h.symbol in stable_symbols]
+        cryptos = [h for h in holdings if h.symbol not in stable_symbols]
+        
+        current_stable_value = stable_sleeve['current_value']
+        current_crypto_value = crypto_sleeve['current_value']
+        
+        # Format holdings data with detailed allocation analysis
+        holdings_text = "DETALHAMENTO DOS ATIVOS:\n"
+        
+        # Group assets by type for better analysis
+        holdings_text += "\nCRYPTOCURRENCIES:\n"
+        crypto_total = current_crypto_value
+        for crypto in sorted(cryptos, key=lambda x: x.value_brl, reverse=True):
+            allocation_pct = (crypto.value_brl / total_value) * 100
+            relative_crypto_pct = (crypto.value_brl / crypto_total * 100) if crypto_total > 0 else 0
+            
+            holdings_text += f"- {crypto.symbol}:\n"
+            holdings_text += f"  * Quantidade: {crypto.amount:.8f}\n"
+            holdings_text += f"  * Valor: R$ {crypto.value_brl:.2f}\n"
+            holdings_text += f"  * Alocação Total: {allocation_pct:.1f}%\n"
+            holdings_text += f"  * Alocação Relativa (dentro dos {crypto_target:.0f}%): {relative_crypto_pct:.1f}%\n"
+            holdings_text += f"  * Variação 24h: {crypto.percent_change_24h:.2f}%\n"
+            holdings_text += f"  * Variação 7d: {crypto.percent_change_7d:.2f}%\n\n"
+        
+        holdings_text += "\nSTABLECOINS:\n"
+        for stable in stablecoins:
+            allocation_pct = (stable.value_brl / total_value) * 100
+            holdings_text += f"- {stable.symbol}:\n"
+            holdings_text += f"  * Quantidade: {stable.amount:.8f}\n"
+            holdings_text += f"  * Valor: R$ {stable.value_brl:.2f}\n"
+            holdings_text += f"  * Alocação: {allocation_pct:.1f}%\n\n"
+        
+        # Add comprehensive rebalancing analysis
+        holdings_text += f"\nANÁLISE DE BALANCEAMENTO (Estratégia {crypto_target:.0f}-{stable_target:.0f}):\n"
+        crypto_allocation = crypto_sleeve['current_pct']
+        stable_allocation = stable_sleeve['current_pct']
+        
+        holdings_text += f"- Valor Total do Portfólio: R$ {total_value:.2f}\n"
+        holdings_text += f"- Alocação Atual em Crypto: R$ {current_crypto_value:.2f} ({crypto_allocation:.1f}%)\n"
+        holdings_text += f"- Alocação Atual em Stablecoins: R$ {current_stable_value:.2f} ({stable_allocation:.1f}%)\n\n"
+        
+        holdings_text += f"ANÁLISE DE REBALANCEAMENTO:\n"
         
-        proxy_str = os.getenv('PROXIES')
+        # Overall portfolio status
+        if not plan.needs_rebalance:
+            holdings_text += f"- STATUS: Portfólio bem balanceado (dentro da margem de {tolerance}%)\n"
+        else:
+            holdings_text += f"- STATUS: Rebalanceamento necessário (desvio de {plan.max_deviation:.1f}%)\n"
         
-        # Initialize OpenAI client with custom httpx client
-        transport = httpx.HTTPTransport(
-            proxy=Proxy(url=proxy_str) if proxy_str else None
+        # Detailed adjustments needed, per sleeve, from the planned trades
+        if plan.needs_rebalance:
+            crypto_difference = crypto_sleeve['difference']
+            stable_difference = stable_sleeve['difference']
+            crypto_trades = plan.trades[plan.trades['sleeve'] == CRYPTO_SLEEVE]
+            
+            if crypto_difference > 0:
+                holdings_text += f"- Cryptos: Necessário aumentar exposição em R$ {crypto_difference:.2f}\n"
+                if not crypto_trades.empty:
+                    holdings_text += "  Sugestão de distribuição:\n"
+            else:
+                holdings_text += f"- Cryptos: Necessário reduzir exposição em R$ {abs(crypto_difference):.2f}\n"
+                if not crypto_trades.empty:
+                    holdings_text += "  Sugestão de redução:\n"
+            for symbol, value_delta in zip(crypto_trades['symbol'], crypto_trades['value_delta']):
+                sign = '+' if value_delta >= 0 else '-'
+                holdings_text += f"  * {symbol}: {sign}R$ {abs(value_delta):.2f}\n"
+            
+            if stable_difference > 0:
+                holdings_text += f"- Stablecoins: Necessário aumentar em R$ {stable_difference:.2f}\n"
+            else:
+                holdings_text += f"- Stablecoins: Necessário reduzir em R$ {abs(stable_difference):.2f}\n"
+        
+        # Format the analysis request using template data
+        system_content = template_data['system_template'].format(
+            current_time=portfolio_data.get('timestamp', 'N/A')
         )
-        http_client = httpx.Client(transport=transport, verify=False)
-        self.client = OpenAI(
-            api_key=self.api_key,
-            http_client=http_client
+        
+        user_content = template_data['user_template'].format(
+            portfolio_value=portfolio_data.get('total_value_brl', 0),
+            changes_24h=portfolio_data.get('weighted_24h_change', 0),
+            changes_7d=portfolio_data.get('weighted_7d_change', 0),
+            holdings=holdings_text
         )
 
-    def generate_market_analysis(self, portfolio_data: Dict, template_data: Dict) -> str:
-        """Generate market analysis using OpenAI
+        return [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": user_content}
+        ]
+
+    async def agenerate_market_analysis(self, portfolio_data: Dict, template_data: Dict,
+                                        cache: Optional[AnalysisCache] = None) -> str:
+        """Generate market analysis using OpenAI (runs on the AsyncRuntime loop)
         
         Args:
             portfolio_data: Dictionary containing portfolio information
             template_data: Dictionary containing template strings
+            cache: Optional analysis cache; a completion is only requested when the
+                quantized portfolio fingerprint has no fresh entry
             
         Returns:
             str: Generated market analysis text
@@ -37,127 +268,108 @@ class OpenAIService:
             Exception: If there's an error during analysis generation
         """
         try:
-            # Calculate rebalancing data using the new allocation logic
-            total_value = portfolio_data['total_value_brl']
-            holdings = portfolio_data['holdings']
-            
-            # Separate stablecoins and crypto
-            stablecoins = [h for h in holdings if h['symbol'] in ['USDT', 'MUSD']]
-            cryptos = [h for h in holdings if h['symbol'] not in ['USDT', 'MUSD']]
-            
-            current_stable_value = sum(h['value_brl'] for h in stablecoins)
-            current_crypto_value = sum(h['value_brl'] for h in cryptos)
-            
-            # Calculate target values and deviations
-            target_crypto_value = total_value * 0.70
-            target_stable_value = total_value * 0.30
-            
-            # Format holdings data with detailed allocation analysis
-            holdings_text = "DETALHAMENTO DOS ATIVOS:\n"
-            
-            # Group assets by type for better analysis
-            holdings_text += "\nCRYPTOCURRENCIES:\n"
-            crypto_total = current_crypto_value
-            for crypto in sorted(cryptos, key=lambda x: x['value_brl'], reverse=True):
-                allocation_pct = (crypto['value_brl'] / total_value) * 100
-                relative_crypto_pct = (crypto['value_brl'] / crypto_total * 100) if crypto_total > 0 else 0
-                
-                holdings_text += f"- {crypto['symbol']}:\n"
-                holdings_text += f"  * Quantidade: {crypto['amount']:.8f}\n"
-                holdings_text += f"  * Valor: R$ {crypto['value_brl']:.2f}\n"
-                holdings_text += f"  * Alocação Total: {allocation_pct:.1f}%\n"
-                holdings_text += f"  * Alocação Relativa (dentro dos 70%): {relative_crypto_pct:.1f}%\n"
-                holdings_text += f"  * Variação 24h: {crypto['percent_change_24h']:.2f}%\n"
-                holdings_text += f"  * Variação 7d: {crypto['percent_change_7d']:.2f}%\n\n"
-            
-            holdings_text += "\nSTABLECOINS:\n"
-            for stable in stablecoins:
-                allocation_pct = (stable['value_brl'] / total_value) * 100
-                holdings_text += f"- {stable['symbol']}:\n"
-                holdings_text += f"  * Quantidade: {stable['amount']:.8f}\n"
-                holdings_text += f"  * Valor: R$ {stable['value_brl']:.2f}\n"
-                holdings_text += f"  * Alocação: {allocation_pct:.1f}%\n\n"
-            
-            # Add comprehensive rebalancing analysis
-            holdings_text += f"\nANÁLISE DE BALANCEAMENTO (Estratégia 70-30):\n"
-            crypto_allocation = (current_crypto_value/total_value)*100
-            stable_allocation = (current_stable_value/total_value)*100
-            
-            holdings_text += f"- Valor Total do Portfólio: R$ {total_value:.2f}\n"
-            holdings_text += f"- Alocação Atual em Crypto: R$ {current_crypto_value:.2f} ({crypto_allocation:.1f}%)\n"
-            holdings_text += f"- Alocação Atual em Stablecoins: R$ {current_stable_value:.2f} ({stable_allocation:.1f}%)\n\n"
-            
-            # Calculate detailed rebalancing needs
-            crypto_difference = target_crypto_value - current_crypto_value
-            stable_difference = target_stable_value - current_stable_value
-            
-            holdings_text += f"ANÁLISE DE REBALANCEAMENTO:\n"
-            
-            # Overall portfolio status
-            if abs(stable_allocation - 30) <= 2.5:
-                holdings_text += "- STATUS: Portfólio bem balanceado (dentro da margem de 2.5%)\n"
-            else:
-                holdings_text += f"- STATUS: Rebalanceamento necessário (desvio de {abs(stable_allocation - 30):.1f}%)\n"
-            
-            # Detailed adjustments needed
-            if abs(crypto_difference) > (total_value * 0.025):  # 2.5% of total value
-                if crypto_difference > 0:
-                    holdings_text += f"- Cryptos: Necessário aumentar exposição em R$ {crypto_difference:.2f}\n"
-                    
-                    # Add relative adjustment suggestions
-                    if cryptos:
-                        holdings_text += "  Sugestão de distribuição:\n"
-                        for crypto in cryptos:
-                            weight = crypto['value_brl'] / current_crypto_value if current_crypto_value > 0 else 0
-                            suggested_increase = crypto_difference * weight
-                            holdings_text += f"  * {crypto['symbol']}: +R$ {suggested_increase:.2f}\n"
-                else:
-                    holdings_text += f"- Cryptos: Necessário reduzir exposição em R$ {abs(crypto_difference):.2f}\n"
-                    
-                    # Add relative reduction suggestions
-                    if cryptos:
-                        holdings_text += "  Sugestão de redução:\n"
-                        for crypto in cryptos:
-                            weight = crypto['value_brl'] / current_crypto_value
-                            suggested_reduction = abs(crypto_difference) * weight
-                            holdings_text += f"  * {crypto['symbol']}: -R$ {suggested_reduction:.2f}\n"
-            
-            if abs(stable_difference) > (total_value * 0.025):  # 2.5% of total value
-                if stable_difference > 0:
-                    holdings_text += f"- Stablecoins: Necessário aumentar em R$ {stable_difference:.2f}\n"
-                else:
-                    holdings_text += f"- Stablecoins: Necessário reduzir em R$ {abs(stable_difference):.2f}\n"
-            
-            # Format the analysis request using template data
-            system_content = template_data['system_template'].format(
-                current_time=portfolio_data.get('timestamp', 'N/A')
-            )
-            
-            user_content = template_data['user_template'].format(
-                portfolio_value=portfolio_data.get('total_value_brl', 0),
-                changes_24h=portfolio_data.get('weighted_24h_change', 0),
-                changes_7d=portfolio_data.get('weighted_7d_change', 0),
-                holdings=holdings_text
-            )
+            cache_key = None
+            if cache is not None:
+                cache_key = cache.fingerprint(portfolio_data, template_data, self.rebalancer.config())
+                cached_analysis = cache.get(cache_key)
+                if cached_analysis is not None:
+                    return cached_analysis
+
+            messages = self._build_messages(portfolio_data, template_data)
 
             # Make API call with specific parameters for analysis
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": user_content}
-                ],
-                temperature=0.13,
-                max_tokens=1500,
-                presence_penalty=0.3,
-                frequency_penalty=0.3
-            )
+            response = await self._create_completion(messages)
 
             if not response.choices or not response.choices[0].message.content:
                 return "No analysis could be generated. Please try again."
 
-            return response.choices[0].message.content
+            analysis = response.choices[0].message.content
+            if cache is not None:
+                cache.set(cache_key, analysis)
+            return analysis
 
         except Exception as e:
             print(f"Error generating market analysis: {e}")
             return "Unable to generate market analysis at this time. Please try again later."
+
+    def generate_market_analysis(self, portfolio_data: Dict, template_data: Dict,
+                                 cache: Optional[AnalysisCache] = None) -> str:
+        """Blocking wrapper around agenerate_market_analysis for synchronous callers"""
+        return get_runtime().run(self.agenerate_market_analysis(portfolio_data, template_data, cache))
+
+    async def astream_market_analysis(self, portfolio_data: Dict, template_data: Dict,
+                                      cache: Optional[AnalysisCache] = None) -> AsyncIterator[str]:
+        """Generate market analysis, yielding text chunks as they arrive from the API
+
+        Args:
+            portfolio_data: Dictionary containing portfolio information
+            template_data: Dictionary containing template strings
+            cache: Optional analysis cache; a cached analysis is yielded as a single chunk
+
+        Yields:
+            str: Pieces of the analysis text, in order
+        """
+        try:
+            cache_key = None
+            if cache is not None:
+                cache_key = cache.fingerprint(portfolio_data, template_data, self.rebalancer.config())
+                cached_analysis = cache.get(cache_key)
+                if cached_analysis is not None:
+                    yield cached_analysis
+                    return
+
+            messages = self._build_messages(portfolio_data, template_data)
+            parts = []
+            # Closed explicitly so an abandoned stream frees its semaphore slot right away
+            stream = self._stream_completion(messages)
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        parts.append(content)
+                        yield content
+            finally:
+                await stream.aclose()
+
+            if not parts:
+                yield "No analysis could be generated. Please try again."
+                return
+
+            if cache is not None:
+                cache.set(cache_key, ''.join(parts))
+
+        except Exception as e:
+            print(f"Error generating market analysis: {e}")
+            yield "Unable to generate market analysis at this time. Please try again later."
+
+    def stream_market_analysis(self, portfolio_data: Dict, template_data: Dict,
+                               cache: Optional[AnalysisCache] = None) -> Iterator[str]:
+        """Blocking iterator over astream_market_analysis for synchronous callers
+
+        The stream is consumed on the AsyncRuntime loop and handed over
+        through a queue, so chunks are yielded as soon as they arrive. Closing
+        the iterator early cancels the request.
+        """
+        chunks: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream_market_analysis(portfolio_data, template_data, cache):
+                    chunks.put(chunk)
+            finally:
+                chunks.put(done)
+
+        future = get_runtime().submit(pump())
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is done:
+                    return
+                yield chunk
+        finally:
+            # A consumer that stops early (e.g. a Streamlit rerun) must not leave
+            # the completion streaming and holding its semaphore slot
+            future.cancel()
@@ -0,0 +1,97 @@
+import asyncio
+import glob
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .coinmarketcap_service import CoinMarketCapService
+from .financial_service import FinancialService
+from .fx_service import FxRates
+
+
+class PortfolioRegistry:
+    """Collection of named portfolios valued against one shared quote snapshot
+
+    Quotes are fetched once for the union of all portfolio symbols, so API
+    cost grows with the number of distinct symbols, not with the number of
+    portfolios.
+    """
+
+    def __init__(self, cmc_service: Optional[CoinMarketCapService] = None):
+        self._cmc_service = cmc_service
+        self.financial_service = FinancialService()
+        self.portfolios: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def cmc_service(self) -> CoinMarketCapService:
+        """CoinMarketCap client, created on first use"""
+        if self._cmc_service is None:
+            self._cmc_service = CoinMarketCapService()
+        return self._cmc_service
+
+    def add(self, name: str, holdings: Dict[str, float]) -> None:
+        """Register a portfolio under a unique name
+
+        Raises:
+            ValueError: If the name is already registered or holdings are invalid
+        """
+        if name in self.portfolios:
+            raise ValueError(f"Portfolio {name} already registered")
+        if not isinstance(holdings, dict):
+            raise ValueError(f"Portfolio {name} must map symbols to amounts")
+        self.portfolios[name] = {
+            symbol.strip().upper(): float(amount)
+            for symbol, amount in holdings.items()
+        }
+
+    def load_file(self, path: str, name: Optional[str] = None) -> str:
+        """Load a portfolio JSON file (same format as portfolio.json)
+
+        Returns:
+            The name the portfolio was registered under (file name without extension by default)
+        """
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'r') as f:
+            self.add(name, json.load(f))
+        return name
+
+    def load_directory(self, directory: str, pattern: str = '*.json') -> List[str]:
+        """Load every portfolio file matching pattern in a directory"""
+        names = []
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            try:
+                names.append(self.load_file(path))
+            except Exception as e:
+                print(f"Error loading portfolio {path}: {e}")
+        return names
+
+    def symbols(self) -> List[str]:
+        """Deduplicated union of the symbols held across all portfolios"""
+        return sorted({symbol for holdings in self.portfolios.values() for symbol in holdings})
+
+    async def fetch_market_data(self, force_refresh: bool = False) -> Tuple[Dict, FxRates]:
+        """Fetch quotes for the union of all symbols in one deduplicated batch, plus the exchange rates"""
+        market_data, fx_rates = await asyncio.gather(
+            self.cmc_service.get_market_data(self.symbols(), force_refresh=force_refresh),
+            self.cmc_service.get_fx_rates()
+        )
+        return market_data, fx_rates
+
+    def value_portfolio(self, name: str, market_data: Dict, fx_rates: FxRates) -> Dict:
+        """Value one registered portfolio against an existing quote snapshot"""
+        holdings_frame = self.financial_service.calculate_holdings_frame(self.portfolios[name], market_data, fx_rates)
+        return self.financial_service.calculate_frame_metrics(holdings_frame, fx_rates)
+
+    async def value_all(self, force_refresh: bool = False) -> Dict[str, Dict]:
+        """Fetch quotes once and value every registered portfolio
+
+        Returns:
+            Portfolio metrics (as returned by get_portfolio_data) keyed by portfolio name
+        """
+        market_data, fx_rates = await self.fetch_market_data(force_refresh=force_refresh)
+        return {name: self.value_portfolio(name, market_data, fx_rates) for name in self.portfolios}
+
+    async def close(self):
+        """Close the CoinMarketCap client if it was created"""
+        if self._cmc_service is not None:
+            await self._cmc_service.close()
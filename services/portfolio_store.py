@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from .metrics_service import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_lock = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+class PortfolioStore:
+    """Holdings file with atomic writes and cross-process locking
+
+    Writes go to a temporary file in the same directory, are fsynced and
+    then renamed over the target, so readers never see a truncated file.
+    Read-modify-write cycles run under an exclusive lock on a sidecar
+    <file>.lock (flock where available), so concurrent sessions apply their
+    changes on top of each other instead of overwriting them.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.lock_path = f"{self.path}.lock"
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        # flock is per open file, so threads need their own lock for exclusivity
+        thread_lock = _thread_lock(self.path)
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @timed('file_io_seconds', file='portfolio', op='read')
+    def _read(self) -> Optional[Dict[str, float]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    @timed('file_io_seconds', file='portfolio', op='write')
+    def _write(self, holdings: Dict[str, float]) -> None:
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.portfolio-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(holdings, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self) -> Optional[Dict[str, float]]:
+        """Return the stored holdings, or None if the file does not exist"""
+        with self._locked(exclusive=False):
+            return self._read()
+
+    def save(self, holdings: Dict[str, float]) -> None:
+        """Replace the stored holdings atomically"""
+        with self._locked(exclusive=True):
+            self._write(holdings)
+
+    @contextmanager
+    def transaction(self, default: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+        """Read, modify and write the holdings as one atomic step
+
+        Yields the current holdings (or a copy of default when the file does
+        not exist) while holding the exclusive lock. The dict is written once
+        when the block exits normally; nothing is written if it raises or
+        leaves the holdings unchanged.
+        """
+        with self._locked(exclusive=True):
+            current = self._read()
+            if current is None:
+                current = dict(default or {})
+                original = None
+            else:
+                original = dict(current)
+            yield current
+            if current != original:
+                self._write(current)
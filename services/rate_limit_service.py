@@ -0,0 +1,282 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from .metrics_service import get_metrics
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# Priority of the CMC requests made by the current task; tasks started from
+# it (asyncio.gather, create_task) inherit the value
+request_priority: ContextVar[str] = ContextVar('request_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: str) -> Iterator[None]:
+    """Run the CMC requests made inside the block at the given priority"""
+    if level not in (INTERACTIVE, BACKGROUND):
+        raise ValueError(f"Unknown priority {level}, use '{INTERACTIVE}' or '{BACKGROUND}'")
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class CreditBudgetExceeded(RuntimeError):
+    """Raised when a request would have to wait longer than max_wait for budget"""
+
+
+class TokenBucket:
+    """Bucket of `capacity` tokens refilled continuously at `rate` tokens per second
+
+    Tokens may go negative when a single request costs more than the whole
+    capacity; the debt is then paid back by the refill before anything
+    else is admitted.
+    """
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, floor: float = 0.0) -> float:
+        """Seconds until amount can be taken while leaving at least floor tokens"""
+        needed = min(amount, self.capacity) + floor
+        if self.tokens >= needed:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (needed - self.tokens) / self.rate
+
+
+class CreditScheduler:
+    """Token-bucket admission control for CoinMarketCap requests
+
+    CMC meters two things: requests per minute (HTTP 429 once exceeded) and
+    call credits per day/month, where one call can cost several credits
+    depending on how many symbols and convert currencies it bundles. Every
+    request first takes one token from the per-minute bucket and its
+    estimated credits from the per-day bucket, sleeping until both have
+    enough, so a refresh loop runs at the highest rate the plan allows
+    without tripping 429s.
+
+    Interactive requests always go first: background requests wait while
+    any interactive request is queued, and never spend the last
+    `background_reserve` share of the daily budget.
+    """
+
+    def __init__(self, calls_per_minute: float = 30, credits_per_day: float = 333,
+                 background_reserve: float = 0.2, max_wait: float = 60.0, poll_interval: float = 0.05):
+        """
+        Args:
+            calls_per_minute: Request rate limit of the API plan
+            credits_per_day: Daily credit budget (monthly credits / 30 on monthly plans)
+            background_reserve: Share of the daily budget kept for interactive requests
+            max_wait: Longest wait for budget before giving up with CreditBudgetExceeded
+            poll_interval: Seconds between admission checks while background requests wait
+        """
+        self.minute = TokenBucket(calls_per_minute, calls_per_minute / 60.0)
+        self.day = TokenBucket(credits_per_day, credits_per_day / 86400.0)
+        self.background_reserve = background_reserve
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.credits_used = 0.0
+        self.requests_admitted = 0
+
+    @classmethod
+    def from_env(cls) -> 'CreditScheduler':
+        """Build the scheduler from the CMC_CALLS_PER_MINUTE, CMC_CREDITS_PER_DAY,
+        CMC_BACKGROUND_RESERVE and CMC_MAX_WAIT_SECONDS environment variables"""
+        return cls(
+            calls_per_minute=float(os.getenv('CMC_CALLS_PER_MINUTE', '30')),
+            credits_per_day=float(os.getenv('CMC_CREDITS_PER_DAY', '333')),
+            background_reserve=float(os.getenv('CMC_BACKGROUND_RESERVE', '0.2')),
+            max_wait=float(os.getenv('CMC_MAX_WAIT_SECONDS', '60'))
+        )
+
+    def _admission_delay(self, credits: float, level: str, now: float) -> float:
+        """Seconds to wait before the request may go out, 0 to admit it now (lock held)"""
+        self.minute.refill(now)
+        self.day.refill(now)
+        delay = max(self._paused_until - now, 0.0)
+        if level == BACKGROUND:
+            if self._waiting[INTERACTIVE]:
+                return max(delay, self.poll_interval)
+            reserve = self.background_reserve * self.day.capacity
+            delay = max(delay, self.day.wait_time(credits, floor=reserve))
+        else:
+            delay = max(delay, self.day.wait_time(credits))
+        return max(delay, self.minute.wait_time(1))
+
+    async def acquire(self, credits: float = 1, level: Optional[str] = None) -> float:
+        """Wait until a request costing credits may be sent, then charge it
+
+        Args:
+            credits: Estimated credits of the request (see estimate_credits)
+            level: INTERACTIVE or BACKGROUND, defaults to the current request_priority
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            CreditBudgetExceeded: If the budget will not allow the request within max_wait
+        """
+        level = level or request_priority.get()
+        start = time.monotonic()
+        with self._lock:
+            self._waiting[level] += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    delay = self._admission_delay(credits, level, now)
+                    if delay <= 0:
+                        self.minute.tokens -= 1
+                        self.day.tokens -= credits
+                        self.credits_used += credits
+                        self.requests_admitted += 1
+                        break
+                if time.monotonic() - start + delay > self.max_wait:
+                    get_metrics().increment('cmc_scheduler_rejected_total', priority=level)
+                    raise CreditBudgetExceeded(
+                        f"CoinMarketCap credit budget exhausted, next {level} request possible in {delay:.0f}s"
+                    )
+                # Background waiters poll so a newly queued interactive request can overtake them
+                await asyncio.sleep(min(delay, self.poll_interval) if level == BACKGROUND else delay)
+        finally:
+            with self._lock:
+                self._waiting[level] -= 1
+
+        waited = time.monotonic() - start
+        if waited > 0:
+            get_metrics().observe('cmc_scheduler_wait_seconds', waited, priority=level)
+        return waited
+
+    def reconcile(self, estimated: float, actual: Optional[float]) -> None:
+        """Correct the daily budget once the API reports what a request really cost
+
+        Args:
+            estimated: Credits charged by acquire
+            actual: status.credit_count of the response (0 for failed requests, which are not billed)
+        """
+        if actual is None or actual == estimated:
+            return
+        with self._lock:
+            self.day.tokens += estimated - actual
+            self.credits_used += actual - estimated
+
+    def pause(self, seconds: float) -> None:
+        """Hold all requests for seconds, after the API answered 429
+
+        The per-minute bucket is emptied as well, since the server just told
+        us the window is used up.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.minute.tokens = min(self.minute.tokens, 0.0)
+
+    def sustainable_interval(self, credits: float) -> float:
+        """Shortest period at which a job spending credits per run can repeat forever
+
+        Background jobs only get the budget outside the interactive reserve.
+        """
+        background_rate = self.day.rate * (1.0 - self.background_reserve)
+        if credits <= 0:
+            return 0.0
+        if background_rate <= 0:
+            return math.inf
+        return credits / background_rate
+
+    def status(self) -> Dict[str, float]:
+        """Remaining budget and queue lengths"""
+        with self._lock:
+            now = time.monotonic()
+            self.minute.refill(now)
+            self.day.refill(now)
+            return {
+                'calls_remaining_minute': max(self.minute.tokens, 0.0),
+                'credits_remaining_day': max(self.day.tokens, 0.0),
+                'credits_used': self.credits_used,
+                'requests_admitted': self.requests_admitted,
+                'paused_seconds': max(self._paused_until - now, 0.0),
+                'interactive_waiting': self._waiting[INTERACTIVE],
+                'background_waiting': self._waiting[BACKGROUND]
+            }
+
+
+def _count(params: Dict, *names: str) -> int:
+    for name in names:
+        value = params.get(name)
+        if value:
+            return len(str(value).split(','))
+    return 0
+
+
+# Seconds per data point of the historical interval values used by the app
+_INTERVAL_SECONDS = {
+    '5m': 300, '15m': 900, 'hourly': 3600, '1h': 3600, 'daily': 86400, '1d': 86400
+}
+
+
+def estimate_credits(path: str, params: Dict) -> int:
+    """Credits a CMC request is expected to cost, following the per-endpoint rules of the API docs
+
+    quotes endpoints bill 1 credit per 100 coins, historical endpoints 1 per
+    100 data points, listings 1 per 200 coins, /map endpoints always 1; every
+    convert currency beyond the first adds 1.
+    """
+    converts = max(_count(params, 'convert', 'convert_id'), 1)
+    if path.endswith('/map'):
+        return 1
+    if path.endswith('/historical'):
+        points = params.get('count')
+        interval = _INTERVAL_SECONDS.get(params.get('interval', 'daily'))
+        if not points and interval and params.get('time_start') and params.get('time_end'):
+            try:
+                points = math.ceil((int(params['time_end']) - int(params['time_start'])) / interval)
+            except (TypeError, ValueError):
+                points = None
+        units = math.ceil(int(points) / 100) if points else 1
+    elif '/listings/' in path:
+        units = math.ceil(int(params.get('limit', 100)) / 200)
+    elif '/quotes/' in path:
+        units = math.ceil(_count(params, 'symbol', 'id', 'slug') / 100)
+    else:
+        units = 1
+    return max(units, 1) + converts - 1
+
+
+_scheduler: Optional[CreditScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_credit_scheduler() -> CreditScheduler:
+    """Return the process-wide credit scheduler, creating it on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                scheduler = CreditScheduler.from_env()
+                get_metrics().register_collector(lambda: {
+                    f"cmc_{name}": value
+                    for name, value in scheduler.status().items()
+                })
+                _scheduler = scheduler
+    return _scheduler
@@ -0,0 +1,197 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .financial_service import FinancialService
+from .metrics_service import timed
+
+STABLE_SLEEVE = 'stable'
+CRYPTO_SLEEVE = 'crypto'
+
+
+@dataclass
+class RebalancePlan:
+    """Result of RebalancingService.plan"""
+    total_value: float
+    sleeves: Dict[str, Dict[str, float]]  # per sleeve: current/target value and percentage, difference to the goal
+    trades: pd.DataFrame  # one row per holding that has to change, largest first
+    needs_rebalance: bool
+    max_deviation: float  # largest sleeve deviation from target, in percentage points
+    unfunded_sleeves: List[str]  # sleeves with a target but no holdings to trade
+
+    @property
+    def turnover(self) -> float:
+        """Total traded value (buys plus sells) in BRL"""
+        return float(self.trades['value_delta'].abs().sum()) if not self.trades.empty else 0.0
+
+
+class RebalancingService:
+    """Vectorized sleeve rebalancing (70/30 crypto/stablecoin by default)
+
+    Holdings are split into sleeves (stablecoins and everything else). When
+    a sleeve drifts more than the tolerance band from its target weight,
+    each sleeve's value difference is spread over its holdings in
+    proportion to their current value. Every trade inside a sleeve then has
+    the same sign, which is the minimal turnover for reaching the sleeve
+    targets, and relative weights inside a sleeve are preserved.
+    """
+
+    TRADE_COLUMNS = [
+        'symbol', 'sleeve', 'price_brl', 'amount', 'target_amount', 'amount_delta',
+        'value_brl', 'target_value_brl', 'value_delta'
+    ]
+
+    def __init__(self, target_weights: Optional[Dict[str, float]] = None, tolerance: float = 2.5,
+                 stable_symbols: Iterable[str] = ('USDT', 'MUSD'), rebalance_to: str = 'target',
+                 min_trade_value: float = 0.0):
+        """
+        Args:
+            target_weights: Weight per sleeve ('crypto', 'stable'), must sum to 1
+            tolerance: Allowed drift per sleeve in percentage points before rebalancing
+            stable_symbols: Symbols that belong to the stablecoin sleeve
+            rebalance_to: 'target' to trade back to the target weights, 'band' to trade
+                only back to the edge of the tolerance band (less turnover)
+            min_trade_value: Trades smaller than this (in BRL) are dropped
+
+        Raises:
+            ValueError: If the weights or rebalance_to are invalid
+        """
+        target_weights = target_weights or {CRYPTO_SLEEVE: 0.70, STABLE_SLEEVE: 0.30}
+        unknown = set(target_weights) - {CRYPTO_SLEEVE, STABLE_SLEEVE}
+        if unknown:
+            raise ValueError(f"Unknown sleeves {sorted(unknown)}, use '{CRYPTO_SLEEVE}' and '{STABLE_SLEEVE}'")
+        if any(weight < 0 for weight in target_weights.values()) \
+                or abs(sum(target_weights.values()) - 1.0) > 1e-9:
+            raise ValueError("Target weights must be non-negative and sum to 1")
+        if rebalance_to not in ('target', 'band'):
+            raise ValueError("rebalance_to must be 'target' or 'band'")
+
+        self.target_weights = {
+            CRYPTO_SLEEVE: target_weights.get(CRYPTO_SLEEVE, 0.0),
+            STABLE_SLEEVE: target_weights.get(STABLE_SLEEVE, 0.0)
+        }
+        self.tolerance = tolerance
+        self.stable_symbols = set(stable_symbols)
+        self.rebalance_to = rebalance_to
+        self.min_trade_value = min_trade_value
+
+    @classmethod
+    def from_env(cls) -> 'RebalancingService':
+        """Build the service from REBALANCE_STABLE_WEIGHT, REBALANCE_TOLERANCE and REBALANCE_TO"""
+        stable_weight = float(os.getenv('REBALANCE_STABLE_WEIGHT', '0.30'))
+        return cls(
+            target_weights={CRYPTO_SLEEVE: 1.0 - stable_weight, STABLE_SLEEVE: stable_weight},
+            tolerance=float(os.getenv('REBALANCE_TOLERANCE', '2.5')),
+            rebalance_to=os.getenv('REBALANCE_TO', 'target')
+        )
+
+    def config(self) -> Dict:
+        """Settings that shape the plan, e.g. for keying cached analyses"""
+        return {
+            'target_weights': self.target_weights,
+            'tolerance': self.tolerance,
+            'stable_symbols': sorted(self.stable_symbols),
+            'rebalance_to': self.rebalance_to,
+            'min_trade_value': self.min_trade_value
+        }
+
+    def _holdings_frame(self, portfolio_data: Dict) -> pd.DataFrame:
+        frame = portfolio_data.get('holdings_frame')
+        if frame is None:
+            frame = pd.DataFrame(portfolio_data.get('holdings', []), columns=FinancialService.HOLDING_COLUMNS)
+        return frame
+
+    @timed('rebalance_plan_seconds')
+    def plan(self, portfolio_data: Dict) -> RebalancePlan:
+        """Compute sleeve allocations and the trades needed to reach the targets
+
+        Args:
+            portfolio_data: Result of get_portfolio_data (uses holdings_frame when present)
+
+        Returns:
+            RebalancePlan; trades is empty when the portfolio is within the tolerance band
+        """
+        frame = self._holdings_frame(portfolio_data)
+        symbols = frame['symbol'].to_numpy()
+        values = frame['value_brl'].to_numpy(dtype=float)
+        prices = frame['price_brl'].to_numpy(dtype=float)
+        amounts = frame['amount'].to_numpy(dtype=float)
+        is_stable = frame['symbol'].isin(self.stable_symbols).to_numpy()
+
+        total_value = float(values.sum())
+        sleeve_names = (CRYPTO_SLEEVE, STABLE_SLEEVE)
+        sleeve_index = is_stable.astype(np.intp)  # 0 = crypto, 1 = stable
+        current = np.bincount(sleeve_index, weights=values, minlength=2)
+        counts = np.bincount(sleeve_index, minlength=2)
+        weights = np.array([self.target_weights[name] for name in sleeve_names])
+
+        if total_value > 0:
+            current_pct = current / total_value * 100
+        else:
+            current_pct = np.zeros(2)
+        target_pct = weights * 100
+        deviation = current_pct - target_pct
+        max_deviation = float(np.abs(deviation).max())
+        needs_rebalance = total_value > 0 and max_deviation > self.tolerance
+
+        # Where each sleeve should end up
+        if self.rebalance_to == 'band':
+            goal_pct = target_pct + np.clip(deviation, -self.tolerance, self.tolerance)
+        else:
+            goal_pct = target_pct
+        goal = goal_pct / 100 * total_value
+        difference = goal - current
+
+        sleeves = {
+            name: {
+                'current_value': float(current[i]),
+                'target_value': float(target_pct[i] / 100 * total_value),
+                # Same goal as the trades: the band edge when rebalance_to is 'band'
+                'difference': float(difference[i]),
+                'current_pct': float(current_pct[i]),
+                'target_pct': float(target_pct[i])
+            }
+            for i, name in enumerate(sleeve_names)
+        }
+        unfunded = [name for i, name in enumerate(sleeve_names) if counts[i] == 0 and weights[i] > 0]
+
+        if not needs_rebalance or unfunded:
+            trades = pd.DataFrame(columns=self.TRADE_COLUMNS)
+        else:
+            # Share of each holding within its sleeve; equal split when the sleeve is empty in value
+            sleeve_total = current[sleeve_index]
+            share = np.divide(values, sleeve_total, out=np.zeros_like(values), where=sleeve_total > 0)
+            empty = sleeve_total <= 0
+            share[empty] = 1.0 / counts[sleeve_index[empty]]
+
+            value_delta = share * difference[sleeve_index]
+            target_values = values + value_delta
+            target_amounts = np.divide(target_values, prices, out=amounts.copy(), where=prices > 0)
+
+            trades = pd.DataFrame({
+                'symbol': symbols,
+                'sleeve': np.array(sleeve_names)[sleeve_index],
+                'price_brl': prices,
+                'amount': amounts,
+                'target_amount': target_amounts,
+                'amount_delta': target_amounts - amounts,
+                'value_brl': values,
+                'target_value_brl': target_values,
+                'value_delta': value_delta
+            })
+            keep = np.abs(value_delta) > max(self.min_trade_value, 0.0)
+            trades = trades[keep]
+            order = np.argsort(-np.abs(trades['value_delta'].to_numpy()), kind='stable')
+            trades = trades.iloc[order].reset_index(drop=True)
+
+        return RebalancePlan(
+            total_value=total_value,
+            sleeves=sleeves,
+            trades=trades,
+            needs_rebalance=needs_rebalance,
+            max_deviation=max_deviation,
+            unfunded_sleeves=unfunded
+        )
@@ -0,0 +1,140 @@
+import threading
+from dataclasses import dataclass, fields
+from itertools import repeat
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class SymbolTable:
+    """Interning table giving every ticker symbol one shared string and a dense integer code
+
+    Symbols arrive as fresh strings on every API response, ledger line and
+    portfolio file read; interning them means each symbol is stored once
+    per process, and codes let hot paths compare symbols as int32 arrays.
+    Lookups are lock-free; only new symbols take the lock.
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def code(self, symbol: str) -> int:
+        """Integer code of symbol, assigned on first sight"""
+        code = self._codes.get(symbol)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(symbol)
+                if code is None:
+                    code = len(self._symbols)
+                    self._symbols.append(symbol)
+                    self._codes[symbol] = code
+        return code
+
+    def intern(self, symbol: str) -> str:
+        """The table's canonical string for symbol"""
+        return self._symbols[self.code(symbol)]
+
+    def normalize(self, symbol: str) -> str:
+        """Interned ticker for user or file input, stripped and upper-cased like CMC symbols"""
+        return self.intern(symbol.strip().upper())
+
+    def symbol(self, code: int) -> str:
+        return self._symbols[code]
+
+    def codes(self, symbols: Iterable[str]) -> 'np.ndarray':
+        """Codes for many symbols as an int32 array"""
+        import numpy as np  # imported lazily: the records are loaded at app startup
+        return np.fromiter((self.code(symbol) for symbol in symbols), dtype=np.int32)
+
+
+_symbol_table = SymbolTable()
+
+
+def get_symbol_table() -> SymbolTable:
+    """Return the process-wide symbol table"""
+    return _symbol_table
+
+
+@dataclass(frozen=True, slots=True)
+class Quote:
+    """Latest market quote for one symbol, priced in the CMC base currency
+
+    Quotes are shared through the process-wide cache, so they are immutable.
+    MISSING_QUOTE (NaN price) marks symbols the API does not know and is
+    the only falsy quote.
+    """
+    price: float
+    percent_change_24h: float = 0.0
+    percent_change_7d: float = 0.0
+
+    def __bool__(self) -> bool:
+        return self.price == self.price  # False only for NaN
+
+
+MISSING_QUOTE = Quote(float('nan'))
+
+
+@dataclass(slots=True)
+class Holding:
+    """One valued position of a portfolio snapshot (a row of the holdings frame)"""
+    symbol: str
+    amount: float
+    price_brl: float
+    value_brl: float
+    percent_change_24h: float = 0.0
+    percent_change_7d: float = 0.0
+    volume_24h: float = 0.0
+    market_cap: float = 0.0
+    portfolio_percentage: Optional[float] = None
+
+    @classmethod
+    def from_frame(cls, frame) -> List['Holding']:
+        """Build records straight from the frame's columns (much cheaper than to_dict('records'))"""
+        columns = [
+            frame[field.name].tolist() if field.name in frame.columns else repeat(field.default, len(frame))
+            for field in fields(cls)
+        ]
+        return list(map(cls, *columns))
+
+    def to_dict(self) -> Dict:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+@dataclass(frozen=True, slots=True)
+class Asset:
+    """One coin of the CMC listings snapshot
+
+    price and market_cap are in the CMC base currency and only known for the
+    coins covered by listings/latest (the top CMC_LISTINGS_LIMIT by rank).
+    """
+    id: int
+    symbol: str
+    name: str
+    slug: str
+    rank: Optional[int] = None
+    price: Optional[float] = None
+    market_cap: Optional[float] = None
+
+
+# Row layouts of the per-symbol tables in EarningsLedger.summary; rows keep
+# dict-style access (row['symbol']) without allocating an object per row
+SYMBOL_VALUE_FIELDS = (('symbol', 'O'), ('value', 'f8'))
+POSITION_FIELDS = (
+    ('symbol', 'O'), ('quantity', 'f8'), ('cost_basis', 'f8'), ('realized_pnl', 'f8'), ('unrealized_pnl', 'f8')
+)
+
+
+def structured_table(layout, **columns) -> 'np.ndarray':
+    """NumPy structured array with one row per element of the given equal-length columns"""
+    import numpy as np
+    size = len(next(iter(columns.values()))) if columns else 0
+    table = np.empty(size, dtype=list(layout))
+    for name, values in columns.items():
+        table[name] = values
+    return table
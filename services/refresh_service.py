@@ -0,0 +1,159 @@
+import copy
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from .async_runtime import get_runtime
+from .rate_limit_service import BACKGROUND, INTERACTIVE, get_credit_scheduler, priority
+
+
+@dataclass(frozen=True)
+class PortfolioSnapshot:
+    """Immutable result of one portfolio refresh
+
+    The data dict is a private deep copy made at publish time; readers must
+    treat it as read-only since the same snapshot is shared by every session.
+    """
+    snapshot_id: int
+    created_at: datetime
+    data: Dict[str, Any]
+
+
+class PortfolioRefresher:
+    """Background thread that refreshes portfolio data on a fixed schedule
+
+    One refresher runs per process. It polls CoinMarketCap every `interval`
+    seconds on the shared AsyncRuntime loop and publishes a PortfolioSnapshot,
+    so page renders only read the latest snapshot and never wait on the API.
+    The interval is stretched when a refresh costs more credits than the
+    daily budget can sustain at that rate.
+    """
+
+    def __init__(self, portfolio_factory: Callable[[], Any], interval: float = 300.0):
+        """
+        Args:
+            portfolio_factory: Callable returning an object with an async
+                get_portfolio_data(force_refresh=...) method, called on every refresh
+                so holdings edits saved to disk are picked up
+            interval: Seconds between scheduled refreshes
+        """
+        self.portfolio_factory = portfolio_factory
+        self.interval = interval
+        self.last_error: Optional[Exception] = None
+        self._snapshot: Optional[PortfolioSnapshot] = None
+        self._next_id = 1
+        self._condition = threading.Condition()
+        self._force_refresh = False
+        self._requested = 0  # generation of the latest refresh request
+        self._served = 0  # generation covered by the last completed refresh attempt
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'PortfolioRefresher':
+        """Start the refresh thread if it is not running yet"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='portfolio-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the refresh thread"""
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def latest(self) -> Optional[PortfolioSnapshot]:
+        """Return the most recent snapshot without blocking"""
+        return self._snapshot
+
+    def request_refresh(self, force_refresh: bool = False) -> int:
+        """Ask for a refresh ahead of schedule
+
+        Args:
+            force_refresh: If False, quotes still fresh in the shared cache are reused
+
+        Returns:
+            Generation number of the request, to be passed to wait_for_refresh
+        """
+        with self._condition:
+            self._force_refresh = self._force_refresh or force_refresh
+            self._requested += 1
+            generation = self._requested
+            self._condition.notify_all()
+        return generation
+
+    def wait_for_refresh(self, generation: int, timeout: Optional[float] = None) -> Optional[PortfolioSnapshot]:
+        """Block until a refresh attempt covering the given request generation has finished"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._served >= generation, timeout)
+            return self._snapshot
+
+    def wait_for_snapshot(self, timeout: Optional[float] = None) -> Optional[PortfolioSnapshot]:
+        """Block until a first snapshot exists (or the first refresh failed)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._snapshot is not None or self.last_error is not None, timeout)
+            return self._snapshot
+
+    def refresh_now(self, force_refresh: bool = False, timeout: Optional[float] = 30.0) -> Optional[PortfolioSnapshot]:
+        """Request a refresh and wait for it, for explicit user actions"""
+        return self.wait_for_refresh(self.request_refresh(force_refresh), timeout)
+
+    def _publish(self, data: Dict[str, Any], generation: int) -> PortfolioSnapshot:
+        with self._condition:
+            data = copy.deepcopy(data)
+            # Lets readers memoize work derived from a snapshot on its id
+            data['snapshot_id'] = self._next_id
+            snapshot = PortfolioSnapshot(
+                snapshot_id=self._next_id,
+                created_at=datetime.now(),
+                data=data
+            )
+            self._next_id += 1
+            self._snapshot = snapshot
+            self.last_error = None
+            self._served = generation
+            self._condition.notify_all()
+        return snapshot
+
+    async def _refresh(self, force_refresh: bool, background: bool) -> Dict[str, Any]:
+        portfolio = self.portfolio_factory()
+        try:
+            # Scheduled refreshes yield the CMC credit budget to interactive requests
+            with priority(BACKGROUND if background else INTERACTIVE):
+                return await portfolio.get_portfolio_data(force_refresh=force_refresh)
+        finally:
+            if hasattr(portfolio, 'close'):
+                await portfolio.close()
+
+    def _run(self) -> None:
+        runtime = get_runtime()
+        scheduler = get_credit_scheduler()
+        force_refresh = True  # the first and every scheduled refresh go to the API
+        scheduled = False  # the first refresh has a user waiting for it
+        while not self._stopped.is_set():
+            with self._condition:
+                force_refresh = force_refresh or self._force_refresh
+                self._force_refresh = False
+                generation = self._requested
+            credits_before = scheduler.credits_used
+            try:
+                data = runtime.run(self._refresh(force_refresh, background=scheduled))
+                self._publish(data, generation)
+            except Exception as e:
+                print(f"Error refreshing portfolio data: {e}")
+                with self._condition:
+                    self.last_error = e
+                    self._served = generation
+                    self._condition.notify_all()
+            interval = max(self.interval, scheduler.sustainable_interval(scheduler.credits_used - credits_before))
+            # Requests made while the refresh ran are still pending and end the wait at once;
+            # a timeout means a scheduled refresh
+            with self._condition:
+                scheduled = not self._condition.wait_for(
+                    lambda: self._requested > generation or self._stopped.is_set(), interval
+                )
+            force_refresh = scheduled
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# The services package and the app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.stubs import StubServer
+from services import cache_service, listings_service, rate_limit_service
+
+
+@pytest.fixture
+def cmc_stub(monkeypatch):
+    """StubServer the CMC services are pointed at, with fresh process-wide singletons"""
+    server = StubServer().start()
+    for name, value in server.environ().items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(rate_limit_service, '_scheduler', None)
+    monkeypatch.setattr(cache_service, '_shared_cache', None)
+    monkeypatch.setattr(listings_service, '_id_map', None)
+    yield server
+    server.stop()
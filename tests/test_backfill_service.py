@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.async_runtime import get_runtime
+from services.backfill_service import HistoricalBackfillService
+from services.coinmarketcap_service import CoinMarketCapService
+from services.history_service import HistoryStore
+
+DAY = 86400
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+START_TS = int(START.timestamp())
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+class RecordingService(CoinMarketCapService):
+    """CoinMarketCapService that records historical requests and can fail after `fail_after` of them"""
+
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.fail_after = fail_after
+        self.history_requests = []
+
+    async def _request(self, path, params, decode=None):
+        if path.endswith('/historical'):
+            if self.fail_after is not None and len(self.history_requests) >= self.fail_after:
+                raise RuntimeError("connection lost")
+            self.history_requests.append((params['symbol'], params['time_start'], params['time_end']))
+        return await super()._request(path, params, decode)
+
+
+def run_backfill(store, symbols, start, end, fail_after=None, period='daily', page_size=10):
+    service = HistoricalBackfillService(store, RecordingService(fail_after), page_size=page_size)
+    written = get_runtime().run(service.backfill(symbols, start, end, period=period))
+    return service, written
+
+
+def stored_days(store, symbol, period='daily'):
+    return [int(row['timestamp'].timestamp()) for row in store.iter_ohlcv(symbol, period)]
+
+
+def test_pages_cover_the_range_exactly(cmc_stub, store):
+    service, written = run_backfill(store, ['BTC'], START, START + timedelta(days=24))
+    assert written == {'BTC': 25}
+    # time_start is exclusive: each page asks from one period before its first day
+    assert service.cmc_service.history_requests == [
+        ('BTC', START_TS - DAY, START_TS + 9 * DAY),
+        ('BTC', START_TS + 9 * DAY, START_TS + 19 * DAY),
+        ('BTC', START_TS + 19 * DAY, START_TS + 24 * DAY)
+    ]
+    assert stored_days(store, 'BTC') == [START_TS + day * DAY for day in range(25)]
+
+
+def test_resumes_after_an_interruption(cmc_stub, store):
+    end = START + timedelta(days=34)
+    _, written = run_backfill(store, ['BTC'], START, end, fail_after=2)
+    assert written == {'BTC': 0}  # the error is reported, pages already fetched are kept
+    assert stored_days(store, 'BTC') == [START_TS + day * DAY for day in range(20)]
+
+    # A new run picks up the checkpoint file and only fetches the last two pages
+    service, written = run_backfill(store, ['BTC'], START, end)
+    assert written == {'BTC': 15}
+    assert [request[1] for request in service.cmc_service.history_requests] == [
+        START_TS + 19 * DAY, START_TS + 29 * DAY
+    ]
+    assert stored_days(store, 'BTC') == [START_TS + day * DAY for day in range(35)]
+
+
+def test_refetches_only_the_gaps(cmc_stub, store):
+    run_backfill(store, ['ETH'], START + timedelta(days=10), START + timedelta(days=19), page_size=500)
+    service, written = run_backfill(store, ['ETH'], START, START + timedelta(days=29), page_size=500)
+    assert written == {'ETH': 20}
+    assert service.cmc_service.history_requests == [
+        ('ETH', START_TS - DAY, START_TS + 9 * DAY),
+        ('ETH', START_TS + 19 * DAY, START_TS + 29 * DAY)
+    ]
+    service, written = run_backfill(store, ['ETH'], START, START + timedelta(days=29))
+    assert written == {'ETH': 0}
+    assert service.cmc_service.history_requests == []
+
+
+def test_gaps_merges_touching_ranges(store, tmp_path):
+    service = HistoricalBackfillService(store, cmc_service=object(), checkpoint_file=str(tmp_path / 'ckpt.json'))
+    service._mark_covered('BTC:daily', 10 * DAY, 19 * DAY, DAY)
+    service._mark_covered('BTC:daily', 20 * DAY, 29 * DAY, DAY)
+    service._mark_covered('BTC:daily', 40 * DAY, 49 * DAY, DAY)
+    assert service._checkpoint['BTC:daily'] == [[10 * DAY, 29 * DAY], [40 * DAY, 49 * DAY]]
+    assert service.gaps('BTC', 'daily', 0, 59 * DAY) == [
+        (0, 9 * DAY), (30 * DAY, 39 * DAY), (50 * DAY, 59 * DAY)
+    ]
+    assert service.gaps('BTC', 'daily', 12 * DAY, 25 * DAY) == []
+    assert service.gaps('ETH', 'daily', 0, DAY) == [(0, DAY)]
+
+
+def test_quotes_history_for_short_periods(cmc_stub, store):
+    start = START + timedelta(hours=1)
+    _, written = run_backfill(store, ['BTC'], start, start + timedelta(minutes=55), period='5m', page_size=5)
+    assert written == {'BTC': 12}
+    rows = list(store.iter_ohlcv('BTC', '5m'))
+    assert [int(row['timestamp'].timestamp()) for row in rows] == [
+        int(start.timestamp()) + step * 300 for step in range(12)
+    ]
+    assert all(row['open'] == row['close'] for row in rows)
+
+
+def test_holdings_value_uses_common_periods(store):
+    store.append_ohlcv('BTC', 'daily', [{'ts': day * DAY, 'close': 100.0 + day} for day in range(5)])
+    store.append_ohlcv('ETH', 'daily', [{'ts': day * DAY, 'close': 10.0} for day in range(2, 5)])
+    values = store.holdings_value_history({'BTC': 2.0, 'ETH': 1.0, 'USDT': 50.0}, 'daily')
+    assert [int(point['timestamp'].timestamp()) for point in values] == [2 * DAY, 3 * DAY, 4 * DAY]
+    assert [point['value'] for point in values] == [214.0, 216.0, 218.0]
+    assert store.holdings_value_history({}, 'daily') == []
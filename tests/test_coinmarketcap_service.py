@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from services.async_runtime import get_runtime
+from services.coinmarketcap_service import CoinMarketCapService
+
+QUOTES_PATH = '/v1/cryptocurrency/quotes/latest'
+MAP_PATH = '/v1/cryptocurrency/map'
+
+
+@pytest.fixture
+def service(cmc_stub):
+    return CoinMarketCapService()
+
+
+def test_symbols_are_normalized(cmc_stub, service):
+    quotes = get_runtime().run(service.get_market_data([' btc', 'BTC', 'Eth ']))
+    assert set(quotes) == {'BTC', 'ETH'}
+    assert cmc_stub.requests[QUOTES_PATH] == 1
+
+    # The lower-case spelling is served from the same cache entry
+    assert set(get_runtime().run(service.get_market_data(['eth']))) == {'ETH'}
+    assert cmc_stub.requests[QUOTES_PATH] == 1
+
+
+def test_resolve_ids_normalizes_and_pins(cmc_stub, service):
+    assert get_runtime().run(service.resolve_ids(['btc', ' UNI '])) == {'BTC': 1, 'UNI': 6}
+    assert service.id_map.get('BTC') == 1
+    assert get_runtime().run(service.resolve_ids(['Btc'])) == {'BTC': 1}
+    assert cmc_stub.requests[MAP_PATH] == 1
+
+
+def test_concurrent_callers_share_one_request(cmc_stub, service):
+    cmc_stub.latency = 0.1
+
+    async def run():
+        return await asyncio.gather(
+            service.get_market_data(['BTC', 'ETH']),
+            CoinMarketCapService().get_market_data(['ETH', 'BTC']),
+            service.get_market_data(['BTC'])
+        )
+
+    first, second, third = get_runtime().run(run())
+    assert first == second
+    assert third == {'BTC': first['BTC']}
+    assert cmc_stub.requests[QUOTES_PATH] == 1
+
+
+def test_waiter_fetches_again_when_the_owner_is_cancelled(cmc_stub, service):
+    get_runtime().run(service.resolve_ids(['BTC']))  # so the owner is cancelled mid quotes request
+    cmc_stub.latency = 0.2
+
+    async def run():
+        owner = asyncio.ensure_future(service.get_market_data(['BTC']))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(CoinMarketCapService().get_market_data(['BTC']))
+        await asyncio.sleep(0.05)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    quotes = get_runtime().run(run())
+    assert quotes['BTC'].price > 0
+    assert cmc_stub.requests[QUOTES_PATH] == 2
+    assert not CoinMarketCapService._inflight
+
+
+def test_owner_error_reaches_the_waiters(cmc_stub, service, monkeypatch):
+    cmc_stub.latency = 0.1
+    monkeypatch.setattr(CoinMarketCapService, 'MAX_RETRIES', 0)
+    monkeypatch.setattr(service, 'api_root', f"{cmc_stub.url}/missing")
+
+    async def run():
+        return await asyncio.gather(
+            service.get_market_data(['LTC']),
+            CoinMarketCapService().get_market_data(['LTC']),
+            return_exceptions=True
+        )
+
+    results = get_runtime().run(run())
+    assert all(isinstance(result, Exception) for result in results)
+
+
+def test_empty_symbol_list_needs_no_request(cmc_stub, service):
+    assert get_runtime().run(service.get_market_data([])) == {}
+    assert not cmc_stub.requests
+
+
+def test_empty_portfolio_is_valued_at_zero(cmc_stub, tmp_path, monkeypatch):
+    from crypto_portfolio_v2 import CryptoPortfolio
+
+    portfolio = CryptoPortfolio(portfolio={}, portfolio_file=str(tmp_path / 'portfolio.json'))
+    monkeypatch.setattr(portfolio, 'history_file', str(tmp_path / 'history.db'))
+    data = get_runtime().run(portfolio.get_portfolio_data())
+    assert data['total_value_brl'] == 0
+    assert list(data['holdings']) == []
@@ -0,0 +1,124 @@
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.earnings_service import EarningsLedger, EarningsService, Trade
+from services.history_service import HistoryStore
+from services.records import Holding
+
+T0 = datetime(2024, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def snapshot(minutes, **holdings):
+    """Portfolio data with holdings given as symbol=(amount, price_brl, percent_change_24h)"""
+    return {
+        'timestamp': T0 + timedelta(minutes=minutes),
+        'holdings': [
+            Holding(symbol, amount, price, amount * price, change)
+            for symbol, (amount, price, change) in holdings.items()
+        ]
+    }
+
+
+def test_trades_are_derived_from_the_recorded_snapshots(store):
+    store.append_snapshot(snapshot(0, BTC=(1.0, 100.0, 0.0)))
+    store.append_snapshot(snapshot(5, BTC=(3.0, 110.0, 10.0)))
+    ledger = EarningsLedger(store, [Trade('BTC', 1.0, 80.0)])
+
+    position = ledger.positions['BTC']
+    assert position.quantity == 3.0
+    assert position.cost_basis == pytest.approx(80.0 + 2 * 110.0)
+    assert position.unrealized_pnl == pytest.approx(330.0 - 300.0)
+
+    # A sale between snapshots realizes the gain on the average cost
+    store.append_snapshot(snapshot(10, BTC=(1.0, 120.0, 0.0)))
+    assert ledger.sync() == 1
+    assert ledger.positions['BTC'].realized_pnl == pytest.approx(2 * 120.0 - 200.0)
+    assert ledger.sync() == 0
+
+
+def test_missing_symbol_is_kept_until_removed_from_the_holdings(store):
+    store.append_snapshot(snapshot(0, BTC=(1.0, 100.0, 0.0), ETH=(2.0, 10.0, 0.0)))
+    store.append_snapshot(snapshot(5, BTC=(1.0, 100.0, 0.0)))
+    ledger = EarningsLedger(store)
+    assert ledger.positions['ETH'].quantity == 2.0
+
+    ledger.apply_snapshot(snapshot(5, BTC=(1.0, 100.0, 0.0)), holdings={'BTC': 1.0})
+    assert ledger.positions['ETH'].quantity == 0.0
+    assert ledger.summary()['total_balance'] == pytest.approx(100.0)
+
+
+def test_running_totals_are_resummed(monkeypatch):
+    monkeypatch.setattr(EarningsLedger, 'RESUM_INTERVAL', 50)
+    ledger = EarningsLedger(seed_trades=[Trade(f"C{i}", 0.1 * (i + 1), 1.0) for i in range(20)])
+    for tick in range(1, 500):
+        symbol = f"C{tick % 20}"
+        ledger.apply_price(symbol, 0.1 * tick + 1e-9 * tick, (tick % 7) - 3.3)
+    # Force the totals off, as float drift would, and let the next updates fix them
+    ledger._total_value += 1.0
+    for tick in range(50):
+        ledger.apply_price('C0', 1.0 + tick)
+
+    positions = ledger.positions.values()
+    summary = ledger.summary()
+    exact = pytest.approx
+    assert summary['total_balance'] == exact(math.fsum(p.market_value for p in positions), rel=1e-12)
+    assert summary['total_daily'] == exact(math.fsum(p.daily_pnl for p in positions), rel=1e-12)
+    assert summary['total_accumulated'] == exact(
+        math.fsum(p.realized_pnl + p.unrealized_pnl for p in positions), rel=1e-12
+    )
+
+
+def test_calculate_earnings_values_a_single_snapshot():
+    earnings = EarningsService.calculate_earnings(snapshot(0, BTC=(0.00004615, 300000.0, 2.0)))
+    assert earnings['total_accumulated'] == pytest.approx(0.00004615 * 300000.0 - 10.0)
+    assert earnings['total_daily'] == pytest.approx(0.02 * 0.00004615 * 300000.0)
+
+
+def test_sync_closes_only_positions_missing_from_the_holdings(store):
+    store.append_snapshot(snapshot(0, BTC=(1.0, 100.0, 0.0), ETH=(2.0, 10.0, 0.0)))
+    ledger = EarningsService.get_ledger(store)
+    assert EarningsService.get_ledger(store) is ledger
+
+    store.append_snapshot(snapshot(5, BTC=(1.0, 100.0, 0.0)))
+    ledger.sync(holdings={'BTC': 1.0, 'ETH': 2.0})
+    assert ledger.positions['ETH'].quantity == 2.0
+    ledger.sync(holdings={'BTC': 1.0})
+    assert ledger.positions['ETH'].quantity == 0.0
+
+
+def test_snapshots_are_booked_when_recorded_and_read_only_in_the_ui(cmc_stub, tmp_path):
+    from crypto_portfolio_v2 import CryptoPortfolio
+    from services.async_runtime import get_runtime
+    from services.portfolio_store import PortfolioStore
+
+    portfolio_file = str(tmp_path / 'portfolio.json')
+    PortfolioStore(portfolio_file).save({'BTC': 1.0, 'ETH': 2.0})
+
+    def session(**kwargs):
+        portfolio = CryptoPortfolio(portfolio_file=portfolio_file, **kwargs)
+        portfolio.history_file = str(tmp_path / 'history.db')
+        return portfolio
+
+    fresh = session()
+    get_runtime().run(fresh.get_portfolio_data())
+    ledger = EarningsService.get_ledger(fresh.history)
+    assert ledger.positions['ETH'].quantity == 2.0
+
+    # A session whose copy of the holdings is stale neither closes ETH when it
+    # records a snapshot nor touches the ledger when it reads the earnings
+    stale = session(portfolio={'BTC': 1.0})
+    get_runtime().run(stale.get_portfolio_data())
+    trades = ledger.trade_count
+    earnings = stale.get_earnings_data()
+    assert ledger.positions['ETH'].quantity == 2.0
+    assert ledger.trade_count == trades
+    assert earnings['total_balance'] == pytest.approx(ledger.summary()['total_balance'])
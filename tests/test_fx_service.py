@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from services.async_runtime import get_runtime
+from services.coinmarketcap_service import CoinMarketCapService
+from services.fx_service import FxRates, FxService
+
+FIAT_MAP_PATH = '/v1/fiat/map'
+CONVERSION_PATH = '/v2/tools/price-conversion'
+
+
+@pytest.fixture
+def fx_service(cmc_stub, monkeypatch):
+    monkeypatch.delenv('CMC_BASE_CURRENCY', raising=False)
+    monkeypatch.setattr(FxService, '_fiat_ids', None)
+    monkeypatch.setattr(FxService, '_tables', {})
+    return FxService(CoinMarketCapService(), currencies=('BRL', 'EUR'))
+
+
+def test_rates_convert_between_any_two_currencies():
+    rates = FxRates(base='USD', rates={'BRL': 5.0, 'EUR': 0.8})
+    assert rates.rate('USD') == 1.0
+    assert rates.rate('BRL') == 5.0
+    assert rates.rate('USD', from_currency='BRL') == pytest.approx(0.2)
+    assert rates.rate('EUR', from_currency='BRL') == pytest.approx(0.16)
+    assert rates.convert(10.0, 'BRL') == 50.0
+    np.testing.assert_allclose(rates.convert([1.0, 2.0], 'USD', from_currency='EUR'), [1.25, 2.5])
+    with pytest.raises(KeyError):
+        rates.rate('JPY')
+
+
+def test_totals_skip_currencies_without_a_rate():
+    rates = FxRates(base='USD', rates={'BRL': 5.0})
+    assert rates.totals(50.0, 'BRL', currencies=('BRL', 'USD', 'EUR')) == {'BRL': 50.0, 'USD': 10.0}
+
+
+def test_rates_come_from_the_price_conversion_tool(cmc_stub, fx_service):
+    rates = get_runtime().run(fx_service.get_rates())
+    assert rates.base == 'USD'
+    assert rates.rates == pytest.approx({'BRL': 5.0, 'EUR': 0.92})
+    assert cmc_stub.requests[FIAT_MAP_PATH] == 1
+    assert cmc_stub.requests[CONVERSION_PATH] == 1
+
+
+def test_rates_are_cached_until_the_ttl_expires(cmc_stub, fx_service, monkeypatch):
+    first = get_runtime().run(fx_service.get_rates())
+    # Another service with the same currencies shares the process-wide table
+    assert get_runtime().run(FxService(CoinMarketCapService(), currencies=('EUR', 'BRL')).get_rates()) is first
+    assert cmc_stub.requests[CONVERSION_PATH] == 1
+
+    monkeypatch.setattr(FxService, 'TTL_SECONDS', 0.0)
+    refreshed = get_runtime().run(fx_service.get_rates())
+    assert refreshed is not first
+    assert refreshed.fetched_at >= first.fetched_at
+    assert cmc_stub.requests[CONVERSION_PATH] == 2
+    # The fiat id map is only fetched once per process
+    assert cmc_stub.requests[FIAT_MAP_PATH] == 1
+
+
+def test_failed_refresh_falls_back_to_the_expired_table(cmc_stub, fx_service, monkeypatch):
+    first = get_runtime().run(fx_service.get_rates())
+    monkeypatch.setattr(FxService, 'TTL_SECONDS', 0.0)
+
+    async def unavailable():
+        raise ValueError('rates unavailable')
+
+    monkeypatch.setattr(fx_service, '_fetch_rates', unavailable)
+    assert get_runtime().run(fx_service.get_rates()) is first
+
+
+def test_unknown_currencies_are_rejected(cmc_stub, fx_service):
+    service = FxService(CoinMarketCapService(), currencies=('JPY',))
+    with pytest.raises(ValueError, match='JPY'):
+        get_runtime().run(service.get_rates())
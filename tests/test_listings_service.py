@@ -0,0 +1,79 @@
+import json
+import time
+
+from services.async_runtime import get_runtime
+from services.listings_service import ListingsIndex, ListingsService
+from services.records import Asset
+
+MAP_PATH = '/v1/cryptocurrency/map'
+LISTINGS_PATH = '/v1/cryptocurrency/listings/latest'
+
+ASSETS = [
+    Asset(8, 'UNI', 'UNICORN Token', 'unicorn-token', rank=8),
+    Asset(9, 'BNT', 'Bancor', 'bancor'),
+    Asset(1, 'BTC', 'Bitcoin', 'bitcoin', rank=1),
+    Asset(6, 'UNI', 'Uniswap', 'uniswap', rank=6),
+    Asset(7, 'BCH', 'Bitcoin Cash', 'bitcoin-cash', rank=3)
+]
+
+
+def test_search_matches_prefixes_best_rank_first():
+    index = ListingsIndex(ASSETS, fetched_at=0.0)
+    # Symbol, slug and name prefixes, each asset once, unranked last
+    assert [asset.id for asset in index.search('b')] == [1, 7, 9]
+    assert [asset.id for asset in index.search('BIT')] == [1, 7]
+    assert [asset.id for asset in index.search('uni')] == [6, 8]
+    assert [asset.id for asset in index.search('b', limit=2)] == [1, 7]
+    assert index.search('x') == []
+    assert [asset.id for asset in index.search('')] == [1, 7, 6, 8, 9]
+
+
+def test_shared_tickers_resolve_to_the_best_rank():
+    index = ListingsIndex(ASSETS, fetched_at=0.0)
+    assert [asset.name for asset in index.candidates('uni')] == ['Uniswap', 'UNICORN Token']
+    assert index.resolve('UNI').id == 6
+    assert index.lookup('8').name == 'UNICORN Token'
+    assert index.lookup('unicorn-token').id == 8
+    assert 'uni' in index
+    assert index.resolve('ETH') is None
+
+
+def test_snapshot_round_trips_through_json():
+    index = ListingsIndex.from_json(json.loads(json.dumps(ListingsIndex(ASSETS, fetched_at=5.0).to_json())))
+    assert index.fetched_at == 5.0
+    assert index.assets == ListingsIndex(ASSETS, fetched_at=0.0).assets
+
+
+def test_refresh_persists_and_a_new_service_loads_from_disk(cmc_stub, monkeypatch, tmp_path):
+    monkeypatch.setattr(ListingsService, 'LISTINGS_LIMIT', 10)
+    snapshot_file = str(tmp_path / 'listings.json')
+
+    index = get_runtime().run(ListingsService(snapshot_file).refresh())
+    assert len(index) == 10000
+    assert index.resolve('UNI').name == 'Uniswap'
+    assert index.resolve('BTC').price is not None
+    assert index.resolve('C000100').price is None  # mapped but not listed
+    requests = dict(cmc_stub.requests)
+
+    loaded = ListingsService(snapshot_file)
+    assert not loaded.is_stale()
+    assert loaded.get_index().assets == index.assets
+    assert cmc_stub.requests == requests
+
+
+def test_stale_index_is_served_while_refreshing_in_the_background(cmc_stub, monkeypatch, tmp_path):
+    monkeypatch.setattr(ListingsService, 'LISTINGS_LIMIT', 10)
+    monkeypatch.setattr(ListingsService, 'TTL_SECONDS', 60.0)
+    snapshot_file = tmp_path / 'listings.json'
+    stale = ListingsIndex(ASSETS, fetched_at=time.time() - 120)
+    snapshot_file.write_text(json.dumps(stale.to_json()), encoding='utf-8')
+
+    service = ListingsService(str(snapshot_file))
+    assert service.is_stale()
+    assert service.get_index().assets == stale.assets
+    service.refresh_in_background().result(timeout=10)
+
+    assert not service.is_stale()
+    assert len(service.get_index()) == 10000
+    assert cmc_stub.requests[LISTINGS_PATH] == 1
+    assert len(ListingsService(str(snapshot_file)).index) == 10000
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+
+import pytest
+from aiohttp import web
+
+from benchmarks.stubs import StubServer
+from services import openai_service
+from services.analysis_cache import AnalysisCache
+from services.async_runtime import get_runtime
+from services.openai_service import OpenAIService, get_openai_client
+from services.rebalancing_service import RebalancingService
+
+MESSAGES = [{'role': 'user', 'content': 'analysis'}]
+
+
+class FakeOpenAI(StubServer):
+    """Chat completions endpoint with injectable failures
+
+    Streams the words '0'..'n-1', fails the first `fail_first` requests with
+    a 500 and drops the connection after `break_after` chunks when set.
+    """
+
+    def __init__(self, words: int = 20, chunk_delay: float = 0.0):
+        super().__init__()
+        self.words = words
+        self.chunk_delay = chunk_delay
+        self.fail_first = 0
+        self.break_after = None
+        self.peers = []
+        self.open_streams = 0
+        self.max_open_streams = 0
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        await self._count(request)
+        self.peers.append(request.transport.get_extra_info('peername'))
+        body = await request.json()
+        if self.fail_first > 0:
+            self.fail_first -= 1
+            return web.json_response({'error': {'message': 'overloaded', 'type': 'server_error'}}, status=500)
+        words = [str(number) for number in range(self.words)]
+        if not body.get('stream'):
+            return web.json_response({
+                'id': 'test', 'object': 'chat.completion', 'created': 0, 'model': body.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ' '.join(words)},
+                             'finish_reason': 'stop'}]
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        self.open_streams += 1
+        self.max_open_streams = max(self.max_open_streams, self.open_streams)
+        try:
+            for index, word in enumerate(words):
+                if index == self.break_after:
+                    request.transport.close()
+                    return response
+                chunk = {
+                    'id': 'test', 'object': 'chat.completion.chunk', 'created': 0, 'model': body.get('model'),
+                    'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]
+                }
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        finally:
+            self.open_streams -= 1
+        return response
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    server = FakeOpenAI().start()
+    for name, value in server.environ().items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(openai_service, '_client', None)
+    monkeypatch.setattr(OpenAIService, '_semaphore', None)
+    monkeypatch.setattr(OpenAIService, 'BACKOFF_BASE', 0.0)
+    yield server
+    server.stop()
+
+
+async def collect(service: OpenAIService):
+    return [chunk.choices[0].delta.content async for chunk in service._stream_completion(MESSAGES)]
+
+
+def test_stream_yields_chunks_in_order(fake_openai):
+    chunks = get_runtime().run(collect(OpenAIService()))
+    assert chunks == [str(number) for number in range(20)]
+
+
+def test_retries_until_the_stream_is_opened(fake_openai):
+    fake_openai.fail_first = 2
+    chunks = get_runtime().run(collect(OpenAIService()))
+    assert chunks == [str(number) for number in range(20)]
+    assert fake_openai.requests['/v1/chat/completions'] == 3
+
+
+def test_no_retry_once_the_stream_is_open(fake_openai):
+    fake_openai.break_after = 5
+    service = OpenAIService()
+    received = []
+
+    async def consume():
+        async for chunk in service._stream_completion(MESSAGES):
+            received.append(chunk.choices[0].delta.content)
+
+    with pytest.raises(Exception):
+        get_runtime().run(consume())
+    assert received == ['0', '1', '2', '3', '4']
+    assert fake_openai.requests['/v1/chat/completions'] == 1
+
+
+def test_blocking_completion_gives_up_after_max_retries(fake_openai, monkeypatch):
+    monkeypatch.setattr(OpenAIService, 'MAX_RETRIES', 1)
+    fake_openai.fail_first = 5
+    with pytest.raises(openai_service.openai.InternalServerError):
+        get_runtime().run(OpenAIService()._create_completion(MESSAGES))
+    assert fake_openai.requests['/v1/chat/completions'] == 2
+
+
+def test_services_share_one_client_and_connection(fake_openai):
+    first, second = OpenAIService(), OpenAIService()
+    assert first.client is second.client is get_openai_client()
+
+    async def run():
+        for service in (first, second, first):
+            await service._create_completion(MESSAGES)
+
+    get_runtime().run(run())
+    assert len(fake_openai.peers) == 3
+    assert len(set(fake_openai.peers)) == 1
+
+
+def test_streams_hold_the_semaphore_until_read(fake_openai, monkeypatch):
+    monkeypatch.setattr(OpenAIService, 'MAX_CONCURRENT_COMPLETIONS', 1)
+    fake_openai.chunk_delay = 0.01
+    service = OpenAIService()
+
+    async def run():
+        return await asyncio.gather(*(collect(service) for _ in range(3)))
+
+    results = get_runtime().run(run())
+    assert all(chunks == [str(number) for number in range(20)] for chunks in results)
+    assert fake_openai.max_open_streams == 1
+
+
+def test_abandoned_stream_releases_the_semaphore(fake_openai, monkeypatch):
+    monkeypatch.setattr(OpenAIService, 'MAX_CONCURRENT_COMPLETIONS', 1)
+    service = OpenAIService()
+
+    async def run():
+        stream = service._stream_completion(MESSAGES)
+        first = await stream.__anext__()
+        locked = service._get_semaphore().locked()
+        await stream.aclose()
+        return first.choices[0].delta.content, locked, service._get_semaphore().locked()
+
+    assert get_runtime().run(run()) == ('0', True, False)
+
+
+def test_closing_the_sync_stream_cancels_the_request(fake_openai, monkeypatch):
+    monkeypatch.setattr(OpenAIService, 'MAX_CONCURRENT_COMPLETIONS', 1)
+    fake_openai.chunk_delay = 0.1  # the whole stream would take 2s
+    service = OpenAIService()
+    monkeypatch.setattr(service, '_build_messages', lambda portfolio_data, template_data: MESSAGES)
+
+    chunks = service.stream_market_analysis({}, {})
+    assert next(chunks) == '0'
+    chunks.close()
+
+    async def released():
+        return not service._get_semaphore().locked()
+
+    deadline = time.monotonic() + 1.0
+    while time.monotonic() < deadline and not (get_runtime().run(released()) and fake_openai.open_streams == 0):
+        time.sleep(0.01)
+    assert get_runtime().run(released())
+    assert fake_openai.open_streams == 0
+
+
+def test_cached_analyses_are_keyed_on_the_rebalancer_settings(fake_openai, monkeypatch):
+    monkeypatch.setattr(OpenAIService, '_build_messages', lambda self, portfolio_data, template_data: MESSAGES)
+    cache = AnalysisCache(None)
+    services = [
+        OpenAIService(RebalancingService()),
+        OpenAIService(RebalancingService()),
+        OpenAIService(RebalancingService(rebalance_to='band')),
+        OpenAIService(RebalancingService(tolerance=5.0))
+    ]
+    for service in services:
+        service.generate_market_analysis({}, {}, cache)
+    assert cache.hits == 1
+    assert fake_openai.requests['/v1/chat/completions'] == 3
+
+
+def test_certificates_are_verified_unless_disabled(fake_openai, monkeypatch):
+    created = []
+    transport = openai_service.httpx.AsyncHTTPTransport
+
+    def record(*args, **kwargs):
+        created.append(kwargs.get('verify'))
+        return transport(*args, **kwargs)
+
+    monkeypatch.setattr(openai_service.httpx, 'AsyncHTTPTransport', record)
+    get_openai_client()
+    monkeypatch.setattr(openai_service, '_client', None)
+    monkeypatch.setenv('OPENAI_VERIFY_SSL', '0')
+    get_openai_client()
+    assert created == [True, False]
@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+from crypto_portfolio_v2 import CryptoPortfolio
+from services.portfolio_store import PortfolioStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'portfolio.json')
+
+
+def count_writes(monkeypatch):
+    writes = []
+    write = PortfolioStore._write
+
+    def counting(self, holdings):
+        writes.append(dict(holdings))
+        write(self, holdings)
+
+    monkeypatch.setattr(PortfolioStore, '_write', counting)
+    return writes
+
+
+def test_transaction_writes_once_on_success(path, monkeypatch):
+    writes = count_writes(monkeypatch)
+    store = PortfolioStore(path)
+    with store.transaction(default={'BTC': 1.0}) as holdings:
+        holdings['ETH'] = 2.0
+        holdings['LTC'] = 3.0
+    assert writes == [{'BTC': 1.0, 'ETH': 2.0, 'LTC': 3.0}]
+    assert store.load() == {'BTC': 1.0, 'ETH': 2.0, 'LTC': 3.0}
+
+
+def test_transaction_skips_unchanged_and_failed_blocks(path, monkeypatch):
+    store = PortfolioStore(path)
+    store.save({'BTC': 1.0})
+    writes = count_writes(monkeypatch)
+    with store.transaction() as holdings:
+        holdings['BTC'] = 1.0
+    with pytest.raises(RuntimeError):
+        with store.transaction() as holdings:
+            holdings['BTC'] = 5.0
+            raise RuntimeError('abort')
+    assert writes == []
+    assert store.load() == {'BTC': 1.0}
+
+
+def test_concurrent_transactions_keep_every_change(path):
+    store = PortfolioStore(path)
+    store.save({})
+
+    def add(symbol):
+        for _ in range(10):
+            with PortfolioStore(path).transaction() as holdings:
+                holdings[symbol] = holdings.get(symbol, 0) + 1
+
+    threads = [threading.Thread(target=add, args=(f"C{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.load() == {f"C{i}": 10 for i in range(8)}
+
+
+def _increment(path, times):
+    for _ in range(times):
+        with PortfolioStore(path).transaction() as holdings:
+            holdings['BTC'] = holdings.get('BTC', 0) + 1
+
+
+def test_transactions_are_atomic_across_processes(path):
+    PortfolioStore(path).save({'BTC': 0})
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_increment, args=(path, 20)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert PortfolioStore(path).load() == {'BTC': 80}
+    with open(path) as f:
+        json.load(f)  # never left truncated
+
+
+def test_batch_writes_once_and_merges_concurrent_sessions(path, monkeypatch):
+    PortfolioStore(path).save({'BTC': 1.0, 'ETH': 2.0, 'LTC': 3.0})
+    first = CryptoPortfolio(portfolio_file=path)
+    second = CryptoPortfolio(portfolio_file=path)
+    writes = count_writes(monkeypatch)
+
+    with first.batch():
+        first.update_holdings('btc', 1.5)
+        first.remove_holding('LTC')
+    second.update_holdings('ETH', 4.0)
+
+    assert len(writes) == 2
+    assert PortfolioStore(path).load() == {'BTC': 1.5, 'ETH': 4.0}
+    assert second.portfolio == {'BTC': 1.5, 'ETH': 4.0}
+
+
+def test_failed_batch_discards_staged_changes(path, monkeypatch):
+    PortfolioStore(path).save({'BTC': 1.0})
+    portfolio = CryptoPortfolio(portfolio_file=path)
+    writes = count_writes(monkeypatch)
+    with pytest.raises(ValueError):
+        with portfolio.batch():
+            portfolio.update_holdings('BTC', 9.0)
+            portfolio.remove_holding('DOGE')
+    assert writes == []
+    assert portfolio.portfolio == {'BTC': 1.0}
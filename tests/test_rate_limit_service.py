@@ -0,0 +1,105 @@
+import asyncio
+import math
+
+import pytest
+
+from services.rate_limit_service import (
+    BACKGROUND, INTERACTIVE, CreditBudgetExceeded, CreditScheduler, TokenBucket, estimate_credits, priority,
+    request_priority
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_estimate_credits_follows_the_endpoint_rules():
+    quotes = '/v1/cryptocurrency/quotes/latest'
+    assert estimate_credits(quotes, {'symbol': ','.join(['BTC'] * 150), 'convert': 'USD'}) == 2
+    assert estimate_credits(quotes, {'id': '1,2', 'convert': 'USD,BRL,EUR'}) == 3
+    assert estimate_credits('/v1/cryptocurrency/map', {'symbol': 'BTC', 'convert': 'USD,BRL'}) == 1
+    assert estimate_credits('/v1/cryptocurrency/listings/latest', {'limit': 1000}) == 5
+    history = {'interval': 'daily', 'time_start': 86400, 'time_end': 251 * 86400}
+    assert estimate_credits('/v2/cryptocurrency/ohlcv/historical', history) == 3
+
+
+def test_acquire_charges_both_buckets():
+    scheduler = CreditScheduler(calls_per_minute=10, credits_per_day=100)
+    waited = run(scheduler.acquire(5))
+    assert waited < 0.1
+    status = scheduler.status()
+    assert status['calls_remaining_minute'] == pytest.approx(9, abs=0.01)
+    assert status['credits_remaining_day'] == pytest.approx(95, abs=0.01)
+    assert status['requests_admitted'] == 1
+
+
+def test_acquire_waits_for_the_minute_bucket():
+    scheduler = CreditScheduler(calls_per_minute=600, credits_per_day=1000)
+    scheduler.minute = TokenBucket(1, 20.0)  # one call every 50 ms
+
+    async def burst():
+        return [await scheduler.acquire(1) for _ in range(3)]
+
+    waits = run(burst())
+    assert waits[0] < 0.02
+    assert all(0.03 < wait < 0.2 for wait in waits[1:])
+
+
+def test_acquire_gives_up_after_max_wait():
+    scheduler = CreditScheduler(calls_per_minute=1, credits_per_day=1000, max_wait=0.5)
+    run(scheduler.acquire(1))
+    with pytest.raises(CreditBudgetExceeded):
+        run(scheduler.acquire(1))
+
+
+def test_background_requests_leave_the_reserve():
+    scheduler = CreditScheduler(calls_per_minute=100, credits_per_day=10, background_reserve=0.5, max_wait=0.1)
+    run(scheduler.acquire(5, BACKGROUND))
+    with pytest.raises(CreditBudgetExceeded):
+        run(scheduler.acquire(1, BACKGROUND))
+    run(scheduler.acquire(4, INTERACTIVE))
+
+
+def test_interactive_requests_overtake_background_ones():
+    scheduler = CreditScheduler(calls_per_minute=600, credits_per_day=1000, poll_interval=0.005)
+    scheduler.minute = TokenBucket(1, 10.0)
+    order = []
+
+    async def request(level, delay):
+        await asyncio.sleep(delay)
+        await scheduler.acquire(1, level)
+        order.append(level)
+
+    async def scenario():
+        await scheduler.acquire(1)  # empty the minute bucket
+        await asyncio.gather(request(BACKGROUND, 0.0), request(INTERACTIVE, 0.02))
+
+    run(scenario())
+    assert order == [INTERACTIVE, BACKGROUND]
+
+
+def test_priority_context_sets_the_default_level():
+    assert request_priority.get() == INTERACTIVE
+    with priority(BACKGROUND):
+        assert request_priority.get() == BACKGROUND
+    assert request_priority.get() == INTERACTIVE
+    with pytest.raises(ValueError):
+        with priority('urgent'):
+            pass
+
+
+def test_reconcile_pause_and_sustainable_interval():
+    scheduler = CreditScheduler(calls_per_minute=30, credits_per_day=86400, background_reserve=0.5)
+    run(scheduler.acquire(10))
+    scheduler.reconcile(10, 2)
+    assert scheduler.credits_used == 2
+    assert scheduler.status()['credits_remaining_day'] == pytest.approx(86398, abs=1)
+
+    scheduler.pause(30)
+    assert scheduler.status()['paused_seconds'] == pytest.approx(30, abs=1)
+    assert scheduler.status()['calls_remaining_minute'] < 1
+
+    # 1 credit/s daily rate, half of it for background jobs
+    assert scheduler.sustainable_interval(5) == pytest.approx(10)
+    assert scheduler.sustainable_interval(0) == 0.0
+    assert CreditScheduler(credits_per_day=0).sustainable_interval(1) == math.inf
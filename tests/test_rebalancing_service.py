@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from services.rebalancing_service import CRYPTO_SLEEVE, STABLE_SLEEVE, RebalancingService
+
+
+def portfolio(**values):
+    """Portfolio data with one holding per symbol=value_brl, priced at 10 BRL"""
+    frame = pd.DataFrame({
+        'symbol': list(values),
+        'amount': [value / 10.0 for value in values.values()],
+        'price_brl': [10.0] * len(values),
+        'value_brl': [float(value) for value in values.values()]
+    })
+    return {'holdings_frame': frame}
+
+
+def deltas(plan):
+    return dict(zip(plan.trades['symbol'], plan.trades['value_delta']))
+
+
+def test_within_tolerance_needs_no_trades():
+    plan = RebalancingService(tolerance=2.5).plan(portfolio(BTC=71, USDT=29))
+    assert not plan.needs_rebalance
+    assert plan.trades.empty
+    assert plan.max_deviation == pytest.approx(1.0)
+
+
+def test_target_mode_trades_back_to_the_target_weights():
+    plan = RebalancingService(tolerance=2.5).plan(portfolio(BTC=60, ETH=20, USDT=20))
+    assert plan.needs_rebalance
+    assert deltas(plan) == pytest.approx({'BTC': -7.5, 'ETH': -2.5, 'USDT': 10.0})
+    assert plan.sleeves[CRYPTO_SLEEVE]['difference'] == pytest.approx(-10.0)
+    assert plan.sleeves[STABLE_SLEEVE]['difference'] == pytest.approx(10.0)
+    assert plan.turnover == pytest.approx(20.0)
+
+
+def test_band_mode_stops_at_the_band_edge_and_reports_the_same_difference():
+    plan = RebalancingService(tolerance=2.5, rebalance_to='band').plan(portfolio(BTC=60, ETH=20, USDT=20))
+    assert plan.sleeves[CRYPTO_SLEEVE]['target_pct'] == pytest.approx(70.0)
+    assert plan.sleeves[CRYPTO_SLEEVE]['difference'] == pytest.approx(-7.5)
+    assert plan.sleeves[STABLE_SLEEVE]['difference'] == pytest.approx(7.5)
+    by_sleeve = plan.trades.groupby('sleeve')['value_delta'].sum()
+    for sleeve in (CRYPTO_SLEEVE, STABLE_SLEEVE):
+        assert by_sleeve[sleeve] == pytest.approx(plan.sleeves[sleeve]['difference'])
+
+
+def test_unfunded_sleeve_blocks_trading():
+    plan = RebalancingService().plan(portfolio(BTC=60, ETH=40))
+    assert plan.needs_rebalance
+    assert plan.unfunded_sleeves == [STABLE_SLEEVE]
+    assert plan.trades.empty
+
+
+def test_trades_below_the_minimum_are_dropped():
+    plan = RebalancingService(min_trade_value=3.0).plan(portfolio(BTC=60, ETH=20, USDT=20))
+    assert set(plan.trades['symbol']) == {'BTC', 'USDT'}
+    assert list(plan.trades['symbol']) == ['USDT', 'BTC']  # largest first
+
+
+def test_sleeve_delta_is_split_in_proportion_to_value():
+    service = RebalancingService(target_weights={CRYPTO_SLEEVE: 0.5, STABLE_SLEEVE: 0.5})
+    plan = service.plan(portfolio(BTC=50, ETH=30, LINK=20, USDT=40, MUSD=10))
+    trades = plan.trades.set_index('symbol')
+    crypto = trades[trades['sleeve'] == CRYPTO_SLEEVE]
+    stable = trades[trades['sleeve'] == STABLE_SLEEVE]
+
+    assert crypto['value_delta'].sum() == pytest.approx(plan.sleeves[CRYPTO_SLEEVE]['difference'])
+    assert stable['value_delta'].sum() == pytest.approx(plan.sleeves[STABLE_SLEEVE]['difference'])
+    assert (crypto['value_delta'] / crypto['value_brl']).tolist() == pytest.approx([-25 / 100] * 3)
+    assert (stable['value_delta'] / stable['value_brl']).tolist() == pytest.approx([25 / 50] * 2)
+    assert (trades['amount_delta'] * trades['price_brl']).tolist() == pytest.approx(trades['value_delta'].tolist())
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+from services.refresh_service import PortfolioRefresher
+
+
+class SlowPortfolio:
+    """Portfolio stub whose refreshes take `delay` seconds and are counted"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        self.started = threading.Event()
+
+    async def get_portfolio_data(self, force_refresh: bool = False):
+        self.calls += 1
+        self.started.set()
+        await asyncio.sleep(self.delay)
+        return {'call': self.calls, 'force_refresh': force_refresh}
+
+
+def test_first_snapshot_is_published():
+    portfolio = SlowPortfolio(0.0)
+    refresher = PortfolioRefresher(lambda: portfolio, interval=60).start()
+    try:
+        snapshot = refresher.wait_for_snapshot(timeout=5)
+        assert snapshot is not None
+        assert snapshot.data['call'] == 1
+        assert snapshot.data['snapshot_id'] == snapshot.snapshot_id
+    finally:
+        refresher.stop(timeout=5)
+
+
+def test_request_during_slow_refresh_is_served_promptly():
+    portfolio = SlowPortfolio(0.3)
+    refresher = PortfolioRefresher(lambda: portfolio, interval=60).start()
+    try:
+        assert portfolio.started.wait(5)
+        # The first refresh is still running: this request must not be lost
+        # when it finishes, nor wait for the 60s schedule
+        generation = refresher.request_refresh()
+        started = time.monotonic()
+        snapshot = refresher.wait_for_refresh(generation, timeout=5)
+        assert time.monotonic() - started < 2
+        assert snapshot is not None
+        assert snapshot.data['call'] == 2
+    finally:
+        refresher.stop(timeout=5)
+
+
+def test_requests_are_coalesced_into_one_refresh():
+    portfolio = SlowPortfolio(0.2)
+    refresher = PortfolioRefresher(lambda: portfolio, interval=60).start()
+    try:
+        assert portfolio.started.wait(5)
+        generations = [refresher.request_refresh() for _ in range(5)]
+        snapshot = refresher.wait_for_refresh(generations[-1], timeout=5)
+        assert snapshot.data['call'] == 2
+    finally:
+        refresher.stop(timeout=5)
+
+
+def test_failed_refresh_is_reported_and_serves_the_request():
+    class FailingPortfolio:
+        async def get_portfolio_data(self, force_refresh: bool = False):
+            raise RuntimeError('API down')
+
+    refresher = PortfolioRefresher(FailingPortfolio, interval=60).start()
+    try:
+        assert refresher.wait_for_snapshot(timeout=5) is None
+        assert isinstance(refresher.last_error, RuntimeError)
+        assert refresher.refresh_now(timeout=5) is None
+    finally:
+        refresher.stop(timeout=5)
+
+
+def test_stop_interrupts_the_wait():
+    refresher = PortfolioRefresher(lambda: SlowPortfolio(0.0), interval=3600).start()
+    refresher.wait_for_snapshot(timeout=5)
+    started = time.monotonic()
+    refresher.stop(timeout=5)
+    assert time.monotonic() - started < 2
+    assert not refresher._thread.is_alive()